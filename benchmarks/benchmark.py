@@ -0,0 +1,353 @@
+"""Measures the latency and the throughput of the API against simulated drones.
+
+The server is started as a subprocess with simulated drones only, so no radio is needed. For every number of drones a
+swarm is registered and connected, then every endpoint is requested by every number of concurrent clients. The results
+are saved as JSON and can be compared with an earlier run:
+
+    python benchmarks/benchmark.py --output benchmarks/baseline.json
+    python benchmarks/benchmark.py --compare benchmarks/baseline.json
+
+Latencies depend on the machine, so no baseline is committed and a baseline is only compared on the processor and
+number of CPUs it was recorded with. Record it locally with --output before a change.
+"""
+
+from typing import Callable, List
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+endpoints: List[str] = ['status', 'goto', 'package', 'pickup', 'deliver']
+
+
+class Client:
+    """Sends requests to the server and measures how long each of them takes."""
+
+    def __init__(self, host: str, port: int, timeout: float = 120.0):
+        self.host: str = host
+        self.port: int = port
+        self.timeout: float = timeout
+
+    def request(self, method: str, path: str, body=None) -> tuple:
+        """Sends a request on a new connection, like most clients of the server do.
+
+        Returns:
+            tuple -- The status code, the decoded JSON body (None if it is no JSON) and the latency in seconds.
+        """
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        started = time.perf_counter()
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            data = response.read()
+            latency = time.perf_counter() - started
+        finally:
+            connection.close()
+        try:
+            decoded = json.loads(data.decode())
+        except ValueError:
+            decoded = None
+        return response.status, decoded, latency
+
+    def get(self, path: str) -> tuple:
+        return self.request('GET', path)
+
+
+class Server:
+    """Runs crazyserv.py in a subprocess with its output in a log file."""
+
+    def __init__(self, port: int, threads: int, virtual_clock: bool, log: str):
+        self.port: int = port
+        arguments = [sys.executable, os.path.join(repository, 'crazyserv.py'), '--host', '127.0.0.1', '--port', str(port),
+                     '--threads', str(threads), '--journal', '', '--recordings', '']
+        if virtual_clock:
+            arguments.append('--virtual-clock')
+        self._log = open(log, 'w')
+        # The server writes its TOC cache and results next to the working directory
+        self._process = subprocess.Popen(arguments, cwd=repository, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_until_ready(self, client: Client, timeout: float = 60.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError('The server exited with %d, see %s' % (self._process.returncode, self._log.name))
+            try:
+                if client.get('/api/arena')[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('The server did not start within %d seconds' % timeout)
+
+    def stop(self, client: Client):
+        try:
+            client.get('/shutdown')
+            self._process.wait(10)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._log.close()
+
+
+class Scenario:
+    """The drones of one swarm and the requests of every endpoint against them."""
+
+    def __init__(self, client: Client, drones: int, seed: int):
+        self.client: Client = client
+        self.swarm_id: str = 'bench-%d' % drones
+        self.drone_ids: List[str] = ['drone-%d' % index for index in range(drones)]
+        self.seed: int = seed
+        self.arena: dict = client.get('/api/arena')[1]
+        self._pending: List[str] = []
+        self._reset_lock = threading.Lock()
+
+    def setup(self):
+        """Registers the swarm, connects the drones and takes them off."""
+        status, _, _ = self.client.get('/api/%s/register_swarm?arena_id=0&sim=1&seed=%d' % (self.swarm_id, self.seed))
+        if status != 200:
+            raise RuntimeError('Registering %s failed with %d' % (self.swarm_id, status))
+        # Ten drones share a radio like on a real setup
+        connections = [{'drone_id': drone_id, 'uri': 'sim://%d/80/2M/E7E7E7E7%02X' % (index // 10, index % 256)}
+                       for index, drone_id in enumerate(self.drone_ids)]
+        status, progress, _ = self.client.request('POST', '/api/%s/connect' % self.swarm_id, connections)
+        failed = [drone['drone_id'] for drone in progress or [] if drone['stage'] != 'connected']
+        if status != 200 or failed:
+            raise RuntimeError('Connecting the drones failed: %s' % (failed or status))
+        commands = [{'drone_id': drone_id, 'command': 'takeoff', 'z': 0.5, 'v': 1.0} for drone_id in self.drone_ids]
+        self.client.request('POST', '/api/%s/batch' % self.swarm_id, commands)
+
+    def teardown(self):
+        for drone_id in self.drone_ids:
+            self.client.get('/api/%s/%s/disconnect' % (self.swarm_id, drone_id))
+
+    def create_request(self, endpoint: str, rng: random.Random) -> Callable[[], tuple]:
+        """Creates a function which sends one request of the endpoint and returns its status, body and latency."""
+        swarm_id = self.swarm_id
+
+        def drone_id():
+            return rng.choice(self.drone_ids)
+
+        if endpoint == 'status':
+            return lambda: self.client.get('/api/%s/%s/status' % (swarm_id, drone_id()))
+        if endpoint == 'goto':
+            def goto():
+                x = rng.uniform(self.arena['min_x'], self.arena['max_x'])
+                y = rng.uniform(self.arena['min_y'], self.arena['max_y'])
+                return self.client.get('/api/%s/%s/goto?x=%.2f&y=%.2f&z=0.5&v=0.5' % (swarm_id, drone_id(), x, y))
+            return goto
+        if endpoint == 'package':
+            return self._order_package
+        if endpoint in ('pickup', 'deliver'):
+            # The drones are rarely in the zones, so most requests take the path of a rejected pickup or delivery
+            def pickup_or_deliver():
+                package_id = rng.choice(self._pending) if self._pending else 'none'
+                return self.client.get('/api/%s/%s/%s?package_id=%s' % (swarm_id, drone_id(), endpoint, package_id))
+            return pickup_or_deliver
+        raise ValueError('Unknown endpoint: ' + endpoint)
+
+    def prepare(self, endpoint: str):
+        """Fills the pending packages the pickups and deliveries refer to."""
+        self.client.get('/api/%s/reset_package_generator?seed=%d' % (self.swarm_id, self.seed))
+        if endpoint in ('pickup', 'deliver'):
+            self.client.get('/api/%s/packages?count=20' % self.swarm_id)
+        self._pending = [package['id'] for package in self.client.get('/api/%s/pending' % self.swarm_id)[1]]
+
+    def _order_package(self) -> tuple:
+        # At most 20 packages are pending, the generator is reset (untimed) whenever it is full
+        while True:
+            status, body, latency = self.client.get('/api/%s/package' % self.swarm_id)
+            if status != 500:
+                return status, body, latency
+            with self._reset_lock:
+                self.client.get('/api/%s/reset_package_generator?seed=%d' % (self.swarm_id, self.seed))
+
+
+def measure(send: Callable[[], tuple], clients: int, requests: int, warmup: int) -> dict:
+    """Sends the requests from concurrent clients and summarizes their latencies.
+
+    Arguments:
+        send {Callable[[], tuple]} -- Creates the request of a client, called once per client with its index.
+        clients {int} -- The number of concurrent clients.
+        requests {int} -- The number of measured requests of all clients together.
+        warmup {int} -- The number of requests of every client before the measurement.
+
+    Returns:
+        dict -- The number of requests and errors, the latency percentiles in ms and the throughput per second.
+    """
+
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    barrier = threading.Barrier(clients + 1)
+
+    def run(index: int):
+        request = send(index)
+        for _ in range(warmup):
+            request()
+        barrier.wait()
+        for _ in range(requests // clients + (1 if index < requests % clients else 0)):
+            try:
+                status, _, latency = request()
+            except OSError:
+                errors[index] += 1
+                continue
+            if status >= 400:
+                errors[index] += 1
+            latencies[index].append(latency)
+
+    threads = [threading.Thread(target=run, args=(index,), daemon=True) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    measured = np.concatenate([np.array(client_latencies) for client_latencies in latencies]) * 1000.0
+    return {
+        'requests': int(len(measured)),
+        'errors': int(sum(errors)),
+        'p50_ms': float(np.percentile(measured, 50)) if len(measured) else None,
+        'p99_ms': float(np.percentile(measured, 99)) if len(measured) else None,
+        'mean_ms': float(measured.mean()) if len(measured) else None,
+        'throughput': len(measured) / elapsed if elapsed > 0 else None
+    }
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """Compares the results with a baseline, a change beyond the tolerance (e.g. 0.2 for 20 %) is a regression.
+
+    Returns:
+        List[str] -- The regressions, empty if there are none.
+    """
+
+    previous = {(result['endpoint'], result['drones'], result['clients']): result for result in baseline['results']}
+    regressions = []
+    print('%-8s %7s %7s %14s %14s %16s' % ('endpoint', 'drones', 'clients', 'p50 ms', 'p99 ms', 'req/s'))
+    for result in results:
+        old = previous.get((result['endpoint'], result['drones'], result['clients']))
+        if old is None or result['p50_ms'] is None or old['p50_ms'] is None:
+            continue
+        changes = {
+            'p50': result['p50_ms'] / old['p50_ms'] - 1,
+            'p99': result['p99_ms'] / old['p99_ms'] - 1,
+            'throughput': old['throughput'] / result['throughput'] - 1
+        }
+        print('%-8s %7d %7d %7.2f %+5.0f%% %7.2f %+5.0f%% %8.0f %+5.0f%%' % (
+            result['endpoint'], result['drones'], result['clients'], result['p50_ms'], changes['p50'] * 100,
+            result['p99_ms'], changes['p99'] * 100, result['throughput'], -changes['throughput'] * 100))
+        for name, change in changes.items():
+            if change > tolerance:
+                regressions.append('%s with %d drones and %d clients: %s is %.0f %% worse' % (
+                    result['endpoint'], result['drones'], result['clients'], name, change * 100))
+    return regressions
+
+
+def environment_differences(baseline: dict, environment: dict) -> List[str]:
+    """Gets the properties of the machine which differ from the one of the baseline and make the results incomparable."""
+    recorded = baseline.get('environment', {})
+    return ['%s is %r instead of %r' % (name, environment.get(name), recorded.get(name))
+            for name in ['processor', 'cpus'] if environment.get(name) != recorded.get(name)]
+
+
+def describe_environment() -> dict:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repository, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def parse_counts(value: str) -> List[int]:
+    return [int(count) for count in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the latency and the throughput of the API against simulated drones.")
+    parser.add_argument("--drones", type=parse_counts, default=[1, 10, 100], help="The numbers of drones, comma separated.")
+    parser.add_argument("--clients", type=parse_counts, default=[1, 8, 32], help="The numbers of concurrent clients, comma separated.")
+    parser.add_argument("--endpoints", type=lambda value: value.split(','), default=endpoints, help="The endpoints, comma separated.")
+    parser.add_argument("--requests", type=int, default=500, help="The number of measured requests per endpoint, drones and clients.")
+    parser.add_argument("--warmup", type=int, default=5, help="The number of requests of every client before measuring.")
+    parser.add_argument("--seed", type=int, default=467859, help="The seed of the packages and of the requests.")
+    parser.add_argument("--threads", type=int, default=64, help="The number of request threads of the server.")
+    parser.add_argument("--virtual-clock", action="store_true", help="Run the simulation on a virtual clock, the drones then send no telemetry.")
+    parser.add_argument("--port", type=int, default=None, help="The port of the server, any free port by default.")
+    parser.add_argument("--log", default=os.path.join(repository, 'benchmarks', 'server.log'), help="The file the output of the server is written to.")
+    parser.add_argument("--output", default=None, help="The file the results are saved to as JSON.")
+    parser.add_argument("--compare", default=None, help="A saved result to compare with, the exit code is 1 if there are regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="The relative change which counts as a regression.")
+    parser.add_argument("--any-machine", action="store_true", help="Compare with a baseline of another machine anyway.")
+    args = parser.parse_args()
+
+    unknown = [endpoint for endpoint in args.endpoints if endpoint not in endpoints]
+    if unknown:
+        parser.error('Unknown endpoints: ' + ', '.join(unknown))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        differences = environment_differences(baseline, describe_environment())
+        if differences and not args.any_machine:
+            parser.error('The baseline was recorded on another machine (%s), regenerate it here with --output or pass --any-machine'
+                         % ', '.join(differences))
+    client = Client('127.0.0.1', args.port or free_port())
+    server = Server(client.port, args.threads, args.virtual_clock, args.log)
+    results = []
+    try:
+        server.wait_until_ready(client)
+        for drones in args.drones:
+            scenario = Scenario(client, drones, args.seed)
+            scenario.setup()
+            for endpoint in args.endpoints:
+                for clients in args.clients:
+                    scenario.prepare(endpoint)
+                    result = measure(lambda index: scenario.create_request(endpoint, random.Random(args.seed + index)),
+                                     clients, args.requests, args.warmup)
+                    result.update({'endpoint': endpoint, 'drones': drones, 'clients': clients})
+                    results.append(result)
+                    print('%-8s %4d drones %3d clients: p50 %7.2f ms, p99 %7.2f ms, %7.0f req/s, %d errors' % (
+                        endpoint, drones, clients, result['p50_ms'], result['p99_ms'], result['throughput'], result['errors']))
+            scenario.teardown()
+    finally:
+        server.stop(client)
+
+    report = {
+        'environment': describe_environment(),
+        'settings': {'requests': args.requests, 'warmup': args.warmup, 'seed': args.seed, 'threads': args.threads,
+                     'virtual_clock': args.virtual_clock},
+        'results': results
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print('Saved the results to ' + args.output)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        sys.exit(1 if regressions else 0)
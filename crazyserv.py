@@ -1,5 +1,9 @@
 import platform
-from flask import Flask, request, jsonify, abort
+import argparse
+import signal
+import json
+import uuid
+from flask import Flask, request, jsonify, abort, Response, stream_with_context
 from flasgger import Swagger, swag_from
 import cflib
 from crazyserv import Drone
@@ -8,6 +12,13 @@ from crazyserv import SwarmManager
 from crazyserv import Arena
 from crazyserv import PackageGenerator
 from crazyserv import DeliveryLogger
+from crazyserv import DeliveryJournal
+from crazyserv import SimulationEngine
+from crazyserv import VirtualClock
+from crazyserv import TelemetryStream
+from crazyserv import telemetry_profiles
+from crazyserv import SharedTocCache
+from crazyserv import Server
 
 ##############################
 # Globals (cough)
@@ -15,11 +26,26 @@ from crazyserv import DeliveryLogger
 app = Flask(__name__)
 swagger = Swagger(app)
 swarm_manager = SwarmManager()
+# The production server, None when running the development server
+server = None
 package_generator = PackageGenerator()
 default_velocity = 0.2
 default_start_z = 1
 default_land_z = 0
 default_yaw = 0
+default_seed = 467859
+conflict_policies = ["report", "delay", "reject"]
+# Longest time a request waits for a job in seconds
+max_wait_timeout = 30
+# Default and longest time the dispatch of the packages may take in seconds
+default_dispatch_budget = 0.05
+max_dispatch_budget = 1.0
+# Most packages a lookahead previews
+max_lookahead = 100
+# Versions restart with the server, the instance id keeps the ETags of different runs apart
+instance_id = uuid.uuid4().hex[:8]
+# Static resources are serialized once at startup
+arena_json = json.dumps(Arena(0).get_description())
 
 ##############################
 # Route Definitions
@@ -34,16 +60,7 @@ def hello():
 @app.route("/api/arena")
 @swag_from("static/swagger-doc/arena.yml")
 def arena():
-    arena = Arena(0)
-    return jsonify({
-        'min_x': arena.min_x,
-        'max_x': arena.max_x,
-        'min_y': arena.min_y,
-        'max_y': arena.max_y,
-        'min_z': arena.min_z,
-        'max_z': arena.max_z,
-        'buildings': [[2., 2.8, 0], [1.5, 1., 0], [3.15, 0.7, 0], [3., 2., 0]]
-    })
+    return conditional_json(arena_json, instance_id + "-arena")
 
 
 @app.route("/api/help")
@@ -77,10 +94,11 @@ def status(swarm_id: str):
     swarm = swarm_manager.get_swarm(swarm_id)
     if swarm is None:
         abort(404, description="Swarm not found.")
-    drone_stats = []
-    for _, drone in swarm.drones.items():
-        drone_stats.append(drone.get_status())
-    return jsonify(drone_stats)
+    if to_bool(request.args.get("extrapolate"), False):
+        # Extrapolated positions change with time and are never cached
+        return jsonify([drone.get_status(extrapolated=True) for drone in list(swarm.drones.values())])
+    version = swarm.status_version
+    return conditional_json(swarm.get_status_json(), "%s-%d" % (instance_id, version))
 
 
 @app.route("/api/<swarm_id>/<drone_id>/status")
@@ -92,18 +110,51 @@ def drone_status(swarm_id, drone_id):
     drone = swarm.get_drone(drone_id)
     if drone is None:
         abort(404, description="Drone not found.")
-    return jsonify(drone.get_status())
+    if to_bool(request.args.get("extrapolate"), False):
+        return jsonify(drone.get_status(extrapolated=True))
+    version = drone.status_version
+    return conditional_json(drone.get_status_json(), "%s-%d" % (instance_id, version))
+
+
+@app.route("/api/<swarm_id>/stream")
+@swag_from("static/swagger-doc/swarm_stream.yml")
+def stream(swarm_id):
+    return stream_telemetry(swarm_id, None)
+
+
+@app.route("/api/<swarm_id>/<drone_id>/stream")
+@swag_from("static/swagger-doc/swarm_drone_stream.yml")
+def drone_stream(swarm_id, drone_id):
+    return stream_telemetry(swarm_id, drone_id)
+
+
+@app.route("/api/<swarm_id>/<drone_id>/history")
+@swag_from("static/swagger-doc/history.yml")
+def history(swarm_id, drone_id):
+    since = request.args.get("since")
+    until = request.args.get("until")
+    fields = request.args.get("fields")
+    try:
+        since = float(since) if since else None
+        until = float(until) if until else None
+    except ValueError:
+        abort(400, description="Expected since and until in seconds.")
+    drone = swarm_manager.get_drone(swarm_id, drone_id)
+    if drone is None:
+        abort(404, description="Drone not found.")
+    samples = drone.history.query(since, until, fields.split(",") if fields else None)
+    return jsonify(samples)
 
 
 @app.route("/api/<swarm_id>/<drone_id>/connect")
 @swag_from("static/swagger-doc/connect.yml")
 def connect(swarm_id, drone_id):
-    radio_id = int(is_none(request.args.get("r"), 0))
-    channel = int(is_none(request.args.get("c"), 80))
-    address = is_none(request.args.get("a"), "E7E7E7E7E7")
-    data_rate = is_none(request.args.get("dr"), "2M")
+    try:
+        radio_id, channel, address, data_rate, simulated = parse_connection(request.args)
+    except ValueError:
+        abort(400, description="Invalid link uri.")
 
-    added_drone = swarm_manager.add_drone(swarm_id, drone_id, radio_id, channel, address, data_rate)
+    added_drone = swarm_manager.add_drone(swarm_id, drone_id, radio_id, channel, address, data_rate, simulated)
     # Check if the connection to the drone was successfull
     if added_drone is None:
         # Connection failed
@@ -111,6 +162,36 @@ def connect(swarm_id, drone_id):
     return jsonify(added_drone.get_status())
 
 
+@app.route("/api/<swarm_id>/connect", methods=['POST'])
+@swag_from("static/swagger-doc/connect_drones.yml")
+def connect_drones(swarm_id):
+    body = request.get_json(silent=True)
+    drones = body.get("drones") if isinstance(body, dict) else body
+    if not isinstance(drones, list) or not all(isinstance(drone, dict) and "drone_id" in drone for drone in drones):
+        abort(400, description="Expected a list of drones with ids.")
+    connections = []
+    for drone in drones:
+        try:
+            radio_id, channel, address, data_rate, simulated = parse_connection(drone)
+        except ValueError:
+            abort(400, description="Invalid link uri.")
+        connections.append({'drone_id': str(drone["drone_id"]), 'radio_id': radio_id, 'channel': channel,
+                            'address': address, 'data_rate': data_rate, 'simulated': simulated})
+    results = swarm_manager.add_drones(swarm_id, connections)
+    if results is None:
+        abort(404, description="Swarm not found.")
+    return jsonify(results)
+
+
+@app.route("/api/<swarm_id>/connect_progress")
+@swag_from("static/swagger-doc/connect_progress.yml")
+def connect_progress(swarm_id):
+    swarm = swarm_manager.get_swarm(swarm_id)
+    if swarm is None:
+        abort(404, description="Swarm not found.")
+    return jsonify(list(swarm.connection_progress.values()))
+
+
 @app.route("/api/<swarm_id>/<drone_id>/disconnect")
 @swag_from("static/swagger-doc/disconnect.yml")
 def disconnect(swarm_id, drone_id):
@@ -124,8 +205,8 @@ def calibrate(swarm_id, drone_id):
     drone = swarm_manager.get_drone(swarm_id, drone_id)
     if (drone is None):
         abort(404, description="Drone not found.")
-    resetted = drone.reset_estimator()
-    return jsonify({'success': resetted})
+    convergence_time = drone.reset_estimator()
+    return jsonify({'success': convergence_time is not None, 'convergence_time': convergence_time})
 
 
 @app.route("/api/<swarm_id>/<drone_id>/takeoff")
@@ -136,7 +217,12 @@ def takeoff(swarm_id, drone_id):
     drone = swarm_manager.get_drone(swarm_id, drone_id)
     if (drone is None):
         abort(404, description="Drone not found.")
+    if to_bool(request.args.get("queued"), False):
+        return queue_command(drone, "takeoff", drone.takeoff, z, v)
+    drone.jobs.cancel()
     takeoff_result = drone.takeoff(z, v)
+    if takeoff_result is None:
+        abort(500, description="Position estimator did not converge.")
     return jsonify(takeoff_result)
 
 
@@ -148,6 +234,9 @@ def land(swarm_id, drone_id):
     drone = swarm_manager.get_drone(swarm_id, drone_id)
     if (drone is None):
         abort(404, description="Drone not found.")
+    if to_bool(request.args.get("queued"), False):
+        return queue_command(drone, "land", drone.land, z, v)
+    drone.jobs.cancel()
     land_result = drone.land(z, v)
     return jsonify(land_result)
 
@@ -170,29 +259,139 @@ def goto(swarm_id, drone_id):
     z = float(is_none(request.args.get("z"), default_start_z))
     yaw = float(is_none(request.args.get("yaw"), default_yaw))
     velocity = float(is_none(request.args.get("v"), default_velocity))
+    planned = to_bool(request.args.get("planned"), False)
+    on_conflict = is_none(request.args.get("on_conflict"), "report")
+    if on_conflict not in conflict_policies:
+        abort(400, description="Unknown conflict policy.")
     drone = swarm_manager.get_drone(swarm_id, drone_id)
     if (drone is None):
         abort(404, description="Drone not found.")
-    go_to_result = drone.go_to(x, y, z, yaw, velocity)
+    queued = to_bool(request.args.get("queued"), False)
+    if planned:
+        # A queued flight is planned from where the drone is when it starts
+        if queued:
+            return queue_command(drone, "goto", fly_planned, swarm_id, drone, [x, y, z], yaw, velocity)
+        drone.jobs.cancel()
+        waypoints = swarm_manager.get_path_planner(swarm_id).plan(drone.get_position(), [x, y, z])
+        if waypoints is None:
+            abort(500, description="No path to the target.")
+        return jsonify(drone.go_to_waypoints(waypoints, yaw, velocity))
+    if queued:
+        return queue_command(drone, "goto", drone.go_to, x, y, z, yaw, velocity, False, False, on_conflict)
+    drone.jobs.cancel()
+    go_to_result = drone.go_to(x, y, z, yaw, velocity, on_conflict=on_conflict)
+    if not go_to_result["accepted"]:
+        abort(409, description="Conflict with drones " + ", ".join([conflict["drone_id"] for conflict in go_to_result["conflicts"]]) + ".")
     return jsonify(go_to_result)
 
 
+@app.route("/api/<swarm_id>/<drone_id>/route")
+@swag_from("static/swagger-doc/route.yml")
+def route(swarm_id, drone_id):
+    x = float(request.args.get("x"))
+    y = float(request.args.get("y"))
+    z = float(is_none(request.args.get("z"), default_start_z))
+    velocity = float(is_none(request.args.get("v"), default_velocity))
+    drone = swarm_manager.get_drone(swarm_id, drone_id)
+    if (drone is None):
+        abort(404, description="Drone not found.")
+    waypoints = swarm_manager.get_path_planner(swarm_id).plan(drone.get_position(), [x, y, z])
+    if waypoints is None:
+        abort(500, description="No path to the target.")
+    durations = drone.estimate_waypoint_durations(waypoints, velocity)
+    return jsonify({'waypoints': waypoints, 'durations': durations, 'duration': sum(durations)})
+
+
+@app.route("/api/<swarm_id>/<drone_id>/mission", methods=['POST'])
+@swag_from("static/swagger-doc/mission.yml")
+def mission(swarm_id, drone_id):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, description="Expected a mission with waypoints.")
+    try:
+        waypoints = [[float(waypoint[0]), float(waypoint[1]), float(waypoint[2] if len(waypoint) > 2 else default_start_z)]
+                     for waypoint in body.get("waypoints")]
+    except (TypeError, ValueError, IndexError):
+        abort(400, description="Expected a list of waypoints with x, y and z.")
+    if len(waypoints) == 0:
+        abort(400, description="Expected at least one waypoint.")
+    yaw = float(is_none(body.get("yaw"), default_yaw))
+    velocity = float(is_none(body.get("v"), default_velocity))
+    drone = swarm_manager.get_drone(swarm_id, drone_id)
+    if (drone is None):
+        abort(404, description="Drone not found.")
+    if to_bool(body.get("planned"), False):
+        # Every leg is routed around the buildings
+        planner = swarm_manager.get_path_planner(swarm_id)
+        planned_waypoints = []
+        for start, goal in zip([drone.get_position()] + waypoints, waypoints):
+            leg = planner.plan(start, goal)
+            if leg is None:
+                abort(500, description="No path to the waypoint.")
+            planned_waypoints.extend(leg)
+        waypoints = planned_waypoints
+    if to_bool(body.get("queued"), False):
+        return queue_command(drone, "mission", drone.fly_mission, waypoints, yaw, velocity)
+    drone.jobs.cancel()
+    mission_result = drone.fly_mission(waypoints, yaw, velocity)
+    if mission_result is None:
+        abort(500, description="Mission could not be uploaded.")
+    return jsonify(mission_result)
+
+
+@app.route("/api/<swarm_id>/<drone_id>/wait")
+@swag_from("static/swagger-doc/wait.yml")
+def wait(swarm_id, drone_id):
+    job_id = request.args.get("job")
+    timeout = min(float(is_none(request.args.get("timeout"), max_wait_timeout)), max_wait_timeout)
+    drone = swarm_manager.get_drone(swarm_id, drone_id)
+    if (drone is None):
+        abort(404, description="Drone not found.")
+    job = drone.jobs.get_job(job_id)
+    if job is None:
+        abort(404, description="Job not found.")
+    job.wait(timeout)
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/<swarm_id>/<drone_id>/jobs")
+@swag_from("static/swagger-doc/jobs.yml")
+def jobs(swarm_id, drone_id):
+    drone = swarm_manager.get_drone(swarm_id, drone_id)
+    if (drone is None):
+        abort(404, description="Drone not found.")
+    return jsonify([job.to_dict() for job in drone.jobs.get_jobs()])
+
+
+@app.route("/api/<swarm_id>/batch", methods=['POST'])
+@swag_from("static/swagger-doc/batch.yml")
+def batch(swarm_id):
+    body = request.get_json(silent=True)
+    commands = body.get("commands") if isinstance(body, dict) else body
+    if not isinstance(commands, list) or not all(isinstance(command, dict) for command in commands):
+        abort(400, description="Expected a list of commands.")
+    results = swarm_manager.execute_commands(swarm_id, commands, execute_command)
+    if results is None:
+        abort(404, description="Swarm not found.")
+    return jsonify(results)
+
+
 @app.route('/shutdown', methods=['GET'])
 @swag_from("static/swagger-doc/shutdown.yml")
 def shutdown():
+    if server is None:
+        abort(500, description="Only the production server can be shut down.")
     # Cleanup
-    for swarm in swarm_manager.swarms:
-        for drone in swarm.drones:
-            swarm.remove_drone(drone.id)
+    swarm_manager.remove_all_drones()
     # Shutdown the server
-    shutdown_server()
+    server.shutdown()
     return 'Server shutting down...'
 
 
 @app.route('/api/<swarm_id>/reset_package_generator')
 @swag_from("static/swagger-doc/reset_package_generator.yml")
 def reset_package_generator(swarm_id):
-    seed = 467859
+    seed = int(is_none(request.args.get("seed"), default_seed))
     result = package_generator.initialize_swarm(swarm_id, seed)
     return jsonify({'success': result})
 
@@ -201,10 +400,20 @@ def reset_package_generator(swarm_id):
 @swag_from("static/swagger-doc/register_swarm.yml")
 def register_swarm(swarm_id):
     arena_id = int(request.args.get("arena_id"))
-    seed = 467859
-    result = swarm_manager.register_swarm(swarm_id, arena_id)
-    package_generator.initialize_swarm(swarm_id, seed)
-    return jsonify({'success': result})
+    simulated = to_bool(request.args.get("sim"), False)
+    seed = int(is_none(request.args.get("seed"), default_seed))
+    telemetry = is_none(request.args.get("telemetry"), "standard")
+    restore = to_bool(request.args.get("restore"), False)
+    replay = request.args.get("replay")
+    if telemetry not in telemetry_profiles:
+        abort(400, description="Unknown telemetry profile.")
+    if replay is not None and swarm_manager.get_session(replay) is None:
+        abort(404, description="Recorded session not found.")
+    result = swarm_manager.register_swarm(swarm_id, arena_id, simulated, telemetry_profiles[telemetry], replay)
+    restored = restore and package_generator.restore_swarm(swarm_id)
+    if not restored:
+        package_generator.initialize_swarm(swarm_id, seed)
+    return jsonify({'success': result, 'restored': restored})
 
 
 @app.route('/api/<swarm_id>/package')
@@ -217,7 +426,45 @@ def coordinate(swarm_id):
         abort(404, description="Swarm not found.")
     if package is None:
         abort(500, description="Too many parcels pending.")
-    return jsonify({'id': package['id'], 'coordinates': package['coordinates'], 'weight': package['weight']})
+    return jsonify(describe_package(package))
+
+
+@app.route('/api/<swarm_id>/packages')
+@swag_from("static/swagger-doc/package_bulk_order.yml")
+def order_packages(swarm_id):
+    count = int(is_none(request.args.get("count"), 1))
+    if count < 0:
+        abort(400, description="The count must not be negative.")
+    if swarm_id not in package_generator.delivery_loggers:
+        abort(404, description="Swarm not found.")
+    packages = package_generator.get_packages(swarm_id, count)
+    return jsonify([describe_package(package) for package in packages])
+
+
+@app.route('/api/<swarm_id>/lookahead')
+@swag_from("static/swagger-doc/package_lookahead.yml")
+def lookahead(swarm_id):
+    count = int(is_none(request.args.get("count"), 1))
+    if count < 0 or count > max_lookahead:
+        abort(400, description="The count must be between 0 and %d." % max_lookahead)
+    if swarm_id not in package_generator.delivery_loggers:
+        abort(404, description="Swarm not found.")
+    packages = package_generator.preview_packages(swarm_id, count)
+    return jsonify([describe_package(package) for package in packages])
+
+
+@app.route('/api/<swarm_id>/pending')
+@swag_from("static/swagger-doc/pending_packages.yml")
+def pending(swarm_id):
+    try:
+        pad = None if request.args.get("pad") is None else int(request.args.get("pad"))
+        weight = None if request.args.get("weight") is None else float(request.args.get("weight"))
+    except ValueError:
+        abort(400, description="Expected an integer pad and a numeric weight.")
+    if swarm_id not in package_generator.delivery_loggers:
+        abort(404, description="Swarm not found.")
+    packages = package_generator.get_pending(swarm_id, pad, weight)
+    return jsonify([dict(describe_package(package), drone_id=package['drone'], picked=package['picked']) for package in packages])
 
 
 @app.route('/api/<swarm_id>/<drone_id>/pickup')
@@ -238,18 +485,149 @@ def deliver(swarm_id, drone_id):
     return jsonify({'success': success})
 
 
+@app.route('/api/<swarm_id>/eligible_actions')
+@swag_from("static/swagger-doc/eligible_actions.yml")
+def eligible_actions(swarm_id):
+    auto_deliver = to_bool(request.args.get("auto_deliver"), False)
+    swarm = swarm_manager.get_swarm(swarm_id)
+    if swarm is None or swarm_id not in package_generator.delivery_loggers:
+        abort(404, description="Swarm not found.")
+    actions = package_generator.eligible_actions(swarm_id, list(swarm.drones.values()), auto_deliver)
+    return jsonify(actions)
+
+
+@app.route('/api/<swarm_id>/dispatch')
+@swag_from("static/swagger-doc/dispatch.yml")
+def dispatch(swarm_id):
+    budget = min(float(is_none(request.args.get("budget"), default_dispatch_budget)), max_dispatch_budget)
+    swarm = swarm_manager.get_swarm(swarm_id)
+    if swarm is None or swarm_id not in package_generator.delivery_loggers:
+        abort(404, description="Swarm not found.")
+    return jsonify(package_generator.dispatch(swarm_id, list(swarm.drones.values()), budget))
+
+
 @app.route('/api/<swarm_id>/print_deliveries')
 @swag_from("static/swagger-doc/print_deliveries.yml")
-def print(swarm_id):
+def print_deliveries(swarm_id):
     success = package_generator.print_deliveries(swarm_id)
     return jsonify({'success': success})
 
 
-def shutdown_server():
-    func = request.environ.get('werkzeug.server.shutdown')
-    if func is None:
-        raise RuntimeError('Not running with the Werkzeug Server')
-    func()
+@app.route("/api/radios")
+@swag_from("static/swagger-doc/radios.yml")
+def radios():
+    return jsonify(swarm_manager.get_radio_stats())
+
+
+@app.route('/api/simulation/advance')
+@swag_from("static/swagger-doc/simulation_advance.yml")
+def simulation_advance():
+    t = float(is_none(request.args.get("t"), 0))
+    try:
+        now = swarm_manager.simulation.advance(t)
+    except RuntimeError:
+        abort(400, description="The simulation does not run with a virtual clock.")
+    return jsonify({'time': now})
+
+
+def conditional_json(body, etag):
+    """Responds with serialized JSON tagged with the ETag, or with 304 if the client already has this version."""
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def stream_telemetry(swarm_id, drone_id):
+    """Streams the telemetry changes of a swarm or a single drone as server-sent events."""
+    fields = request.args.get("fields")
+    rate = request.args.get("rate")
+    swarm = swarm_manager.get_swarm(swarm_id)
+    if swarm is None:
+        abort(404, description="Swarm not found.")
+    if drone_id is not None and swarm.get_drone(drone_id) is None:
+        abort(404, description="Drone not found.")
+    telemetry_stream = TelemetryStream(drone_id, fields.split(",") if fields else None, float(rate) if rate else None)
+    # Start with the complete status
+    for drone in list(swarm.drones.values()):
+        telemetry_stream.publish(drone.id, drone.get_status())
+    swarm.telemetry_updated.add_callback(telemetry_stream.publish)
+
+    def events():
+        try:
+            for event in telemetry_stream.events():
+                yield event
+        finally:
+            swarm.telemetry_updated.remove_callback(telemetry_stream.publish)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+
+def execute_command(drone, command):
+    """Executes a single command of a batch with the same defaults as the single drone routes."""
+    name = command.get("command")
+    if to_bool(command.get("queued"), False) and name in ("takeoff", "land", "goto"):
+        return queue_batch_command(drone, command)
+    if name in ("takeoff", "land", "goto"):
+        drone.jobs.cancel()
+    if name == "takeoff":
+        result = drone.takeoff(float(command.get("z", default_start_z)), float(command.get("v", default_velocity)))
+        if result is None:
+            raise RuntimeError("Position estimator did not converge.")
+        return result
+    if name == "land":
+        return drone.land(float(command.get("z", default_land_z)), float(command.get("v", default_velocity)))
+    if name == "goto":
+        if "x" not in command or "y" not in command:
+            raise ValueError("Missing target coordinates x and y.")
+        on_conflict = command.get("on_conflict", "report")
+        if on_conflict not in conflict_policies:
+            raise ValueError("Unknown conflict policy: " + str(on_conflict))
+        result = drone.go_to(float(command["x"]), float(command["y"]), float(command.get("z", default_start_z)),
+                             float(command.get("yaw", default_yaw)), float(command.get("v", default_velocity)), on_conflict=on_conflict)
+        if not result["accepted"]:
+            raise RuntimeError("Conflict with drones " + ", ".join([conflict["drone_id"] for conflict in result["conflicts"]]) + ".")
+        return result
+    if name == "stop":
+        drone.stop()
+        return drone.get_status()
+    if name == "status":
+        return drone.get_status()
+    raise ValueError("Unknown command: " + str(name))
+
+
+def queue_batch_command(drone, command):
+    """Queues a takeoff, land or goto of a batch and returns its job."""
+    name = command.get("command")
+    if name == "takeoff":
+        job = drone.jobs.submit(name, drone.takeoff, float(command.get("z", default_start_z)), float(command.get("v", default_velocity)))
+    elif name == "land":
+        job = drone.jobs.submit(name, drone.land, float(command.get("z", default_land_z)), float(command.get("v", default_velocity)))
+    else:
+        if "x" not in command or "y" not in command:
+            raise ValueError("Missing target coordinates x and y.")
+        on_conflict = command.get("on_conflict", "report")
+        if on_conflict not in conflict_policies:
+            raise ValueError("Unknown conflict policy: " + str(on_conflict))
+        job = drone.jobs.submit(name, drone.go_to, float(command["x"]), float(command["y"]), float(command.get("z", default_start_z)),
+                                float(command.get("yaw", default_yaw)), float(command.get("v", default_velocity)), False, False, on_conflict)
+    return job.to_dict()
+
+
+def queue_command(drone, command, function, *args):
+    """Queues a command of a route for the drone and returns its job."""
+    job = drone.jobs.submit(command, function, *args)
+    return jsonify(job.to_dict()), 202
+
+
+def fly_planned(swarm_id, drone, target, yaw, velocity):
+    waypoints = swarm_manager.get_path_planner(swarm_id).plan(drone.get_position(), target)
+    if waypoints is None:
+        return None
+    return drone.go_to_waypoints(waypoints, yaw, velocity)
+
+
+def describe_package(package: dict) -> dict:
+    return {'id': package['id'], 'coordinates': package['coordinates'], 'pad': package['pad'], 'weight': package['weight']}
 
 
 def is_none(value, alternative):
@@ -259,13 +637,81 @@ def is_none(value, alternative):
         return value
 
 
+def to_bool(value, alternative):
+    if value is None:
+        return alternative
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def parse_connection(values):
+    """Gets (radio_id, channel, address, data_rate, simulated) from the connection parameters r, c, a, dr and uri."""
+    radio_id = int(is_none(values.get("r"), 0))
+    channel = int(is_none(values.get("c"), 80))
+    address = str(is_none(values.get("a"), "E7E7E7E7E7"))
+    data_rate = str(is_none(values.get("dr"), "2M"))
+    simulated = None
+    # A complete link uri (radio://0/80/2M/E7E7E7E7E7 or sim://...) overrides the single parts
+    uri = values.get("uri")
+    if uri is not None:
+        simulated, radio_id, channel, data_rate, address = parse_link_uri(str(uri))
+    return radio_id, channel, address, data_rate, simulated
+
+
+def parse_link_uri(uri):
+    """Splits a link uri like radio://0/80/2M/E7E7E7E7E7 into (simulated, radio_id, channel, data_rate, address)."""
+    scheme, _, path = uri.partition("://")
+    parts = path.split("/")
+    if scheme not in ("radio", "sim") or len(parts) != 4:
+        raise ValueError("Invalid link uri: " + uri)
+    return scheme == "sim", int(parts[0]), int(parts[1]), parts[2], parts[3]
+
+
 ##############################
 # Main
 ##############################
 if __name__ == '__main__':
-    port = 5000
-    host = "0.0.0.0"
+    parser = argparse.ArgumentParser(description="Server with a simple API to control multiple Crazyflie quads.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--virtual-clock", action="store_true",
+                        help="Run simulated drones on a virtual clock which only moves with /api/simulation/advance (or while drones wait).")
+    parser.add_argument("--toc-cache", default="./cache",
+                        help="Directory of the cached log and parameter TOCs of the drones, loaded at startup.")
+    parser.add_argument("--threads", type=int, default=32,
+                        help="Number of requests the server handles at the same time, every open stream or long-poll holds one.")
+    parser.add_argument("--debug", action="store_true",
+                        help="Run the Flask development server with the reloader and debugger instead.")
+    parser.add_argument("--journal", default="deliveries.jsonl",
+                        help="File the package events of all swarms are appended to, empty to keep no journal.")
+    parser.add_argument("--recordings", default="./recordings",
+                        help="Directory the telemetry and the commands of every swarm are recorded to, empty to record nothing.")
+    args = parser.parse_args()
+    if args.virtual_clock:
+        swarm_manager.simulation = SimulationEngine(VirtualClock())
+    swarm_manager.toc_cache = SharedTocCache(args.toc_cache)
+    if args.journal:
+        package_generator.journal = DeliveryJournal(args.journal)
+    swarm_manager.recordings = args.recordings or None
+    print('Loaded %d TOCs from %s' % (swarm_manager.toc_cache.prewarm(), swarm_manager.toc_cache.directory))
     # Initialize the low-level drivers (don't list the debug drivers)
     cflib.crtp.init_drivers(enable_debug_driver=False)
     # Start the web server
-    app.run(host=host, debug=True, port=port)
+    if args.debug:
+        app.run(host=args.host, debug=True, port=args.port)
+    else:
+        # Compile the API specification once instead of with the first request for it
+        with app.test_request_context():
+            swagger.get_apispecs()
+        server = Server(app, args.host, args.port, args.threads)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            swarm_manager.remove_all_drones()
+            swarm_manager.close_recordings()
+            if package_generator.journal is not None:
+                package_generator.journal.close()
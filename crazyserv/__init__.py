@@ -4,3 +4,19 @@ from .swarm import Swarm
 from .swarmmanager import SwarmManager
 from .packagegenerator import PackageGenerator
 from .deliverylogger import DeliveryLogger
+from .deliveryjournal import DeliveryJournal, read_journal
+from .simulation import SimulationEngine, SimulatedCrazyflie
+from .clock import Clock, VirtualClock, TimerWheel
+from .telemetrystream import TelemetryStream
+from .telemetryhistory import TelemetryHistory
+from .pathplanner import PathPlanner
+from .airspace import Airspace
+from .trajectory import fit_trajectory, evaluate_trajectory
+from .radioscheduler import RadioScheduler, Lane
+from .telemetryprofile import TelemetryProfile, telemetry_profiles
+from .toccache import SharedTocCache
+from .commandqueue import CommandQueue, Job
+from .server import Server
+from .dispatcher import Dispatcher
+from .flightrecorder import FlightRecorder, FlightSession
+from .flightreplay import ReplayEngine, ReplayCrazyflie
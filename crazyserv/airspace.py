@@ -0,0 +1,187 @@
+from typing import Dict, List
+import threading
+
+import numpy as np
+
+from .clock import Clock
+
+
+class Airspace:
+    """Index of the flight segments of the drones of a swarm to detect conflicts between them.
+
+    Every drone flies a route of straight segments: it stays at the start of the first segment until its start time,
+    moves from segment to segment and stays at the end of the last segment afterwards. Each segment only covers the
+    drone between its start and end time, except for the first and the last one. The segments are kept in arrays so
+    that a new segment is checked against all other drones at once. All times are on the clock of the airspace, which
+    is the clock of the swarm, so drones on different clocks are compared on the same time base.
+    """
+
+    def __init__(self, separation: List[float] = [0.3, 0.3, 0.6], capacity: int = 16, clock: Clock = None):
+        """Initializes an empty airspace.
+
+        Arguments:
+            separation {List[float]} -- The minimal distance between two drones along x, y and z,
+                                         larger along z because of the downwash.
+            capacity {int} -- The number of segments to allocate space for, it grows when needed.
+            clock {Clock} -- The clock the times of the segments are on.
+        """
+
+        self.separation = np.array(separation, dtype=float)
+        self.clock: Clock = clock if clock is not None else Clock()
+        self._slots: Dict[str, List[int]] = {}
+        self._drone_ids: List[str] = [None] * capacity
+        self._start = np.zeros((capacity, 3))
+        self._end = np.zeros((capacity, 3))
+        self._start_time = np.zeros(capacity)
+        self._end_time = np.zeros(capacity)
+        # The time range in which a segment covers its drone
+        self._valid_from = np.zeros(capacity)
+        self._valid_until = np.zeros(capacity)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._lock = threading.Lock()
+
+    def update(self, drone_id: str, start: List[float], end: List[float], start_time: float, end_time: float):
+        """Sets the route of a drone to a single segment, positions are in the coordinates of the arena."""
+        self.update_route(drone_id, [start, end], [start_time, end_time])
+
+    def update_route(self, drone_id: str, waypoints: List[List[float]], times: List[float]):
+        """Sets the route of a drone, one segment between each two consecutive waypoints.
+
+        Arguments:
+            drone_id {str} -- The id of the drone.
+            waypoints {List[List[float]]} -- The positions in the coordinates of the arena, starting with the current one.
+            times {List[float]} -- The time the drone is at each waypoint.
+        """
+
+        with self._lock:
+            slots = self._slots.get(drone_id, [])
+            count = len(waypoints) - 1
+            for slot in slots[count:]:
+                self._free(slot)
+            slots = slots[:count]
+            while len(slots) < count:
+                slots.append(self._allocate(drone_id))
+            self._slots[drone_id] = slots
+            times = np.maximum.accumulate(np.array(times, dtype=float))
+            for index, slot in enumerate(slots):
+                self._start[slot] = waypoints[index]
+                self._end[slot] = waypoints[index + 1]
+                self._start_time[slot] = times[index]
+                self._end_time[slot] = times[index + 1]
+                self._valid_from[slot] = times[index] if index > 0 else -np.inf
+                self._valid_until[slot] = times[index + 1] if index < count - 1 else np.inf
+
+    def hold(self, drone_id: str, position: List[float]):
+        """Sets a drone to stay at the given position."""
+        self.update(drone_id, position, position, 0.0, 0.0)
+
+    def remove(self, drone_id: str):
+        """Removes the segment of a drone."""
+        with self._lock:
+            for slot in self._slots.pop(drone_id, []):
+                self._free(slot)
+
+    def conflicts(self, drone_id: str, start: List[float], end: List[float], start_time: float, end_time: float,
+                  now: float) -> List[dict]:
+        """Checks a new segment of a drone against the segments of all other drones from now on.
+
+        The drones are assumed to move with constant velocity, the separation has to cover the difference
+        to the smooth trajectories of the high level commander.
+
+        Returns:
+            List[dict] -- The drone_id, time and distance of the closest approach of every drone which comes
+                          closer than the separation, ordered by time.
+        """
+
+        with self._lock:
+            others = self._active.copy()
+            others[self._slots.get(drone_id, [])] = False
+            # Only drones whose bounding boxes come closer than the separation can conflict
+            start = np.array(start, dtype=float)
+            end = np.array(end, dtype=float)
+            lower = np.minimum(start, end) - self.separation
+            upper = np.maximum(start, end) + self.separation
+            others &= np.all((np.minimum(self._start, self._end) < upper) & (np.maximum(self._start, self._end) > lower), axis=1)
+            others = np.flatnonzero(others)
+            if len(others) == 0:
+                return []
+            times, distances = self._closest_approach(others, start, end, start_time, max(end_time, start_time), now)
+            # Only the closest approach to each drone along its route is reported
+            closest = {}
+            for index in np.flatnonzero(distances < 1.0):
+                other = self._drone_ids[others[index]]
+                if other not in closest or distances[index] < distances[closest[other]]:
+                    closest[other] = index
+        order = sorted(closest.items(), key=lambda item: times[item[1]])
+        return [{
+            'drone_id': other,
+            'time': float(times[index]),
+            'distance': float(distances[index])
+        } for other, index in order]
+
+    def find_delay(self, drone_id: str, start: List[float], end: List[float], start_time: float, end_time: float,
+                   now: float, step: float = 0.5, max_delay: float = 10.0) -> float:
+        """Finds the shortest delay (in multiples of step) of a new segment without conflicts, None if there is none."""
+        for count in range(int(max_delay / step) + 1):
+            delay = count * step
+            if not self.conflicts(drone_id, start, end, start_time + delay, end_time + delay, now):
+                return delay
+        return None
+
+    def _closest_approach(self, others: np.ndarray, start: np.ndarray, end: np.ndarray, start_time: float, end_time: float,
+                          now: float) -> tuple:
+        """Computes the time and the distance (in units of the separation) of the closest approach to the other segments."""
+        count = len(others)
+        # Both drones move linearly between the sorted start and end times, the last piece has no movement. The
+        # bounds of the time a segment covers its drone are breaks as well, the first and last segment are unbounded.
+        valid_from = self._valid_from[others]
+        valid_until = self._valid_until[others]
+        breaks = np.column_stack((np.full(count, start_time), np.full(count, end_time), self._start_time[others], self._end_time[others],
+                                  np.where(np.isfinite(valid_from), valid_from, now), np.where(np.isfinite(valid_until), valid_until, now)))
+        times = np.concatenate((np.full((count, 1), now), np.sort(np.maximum(breaks, now), axis=1)), axis=1)
+        relative = (self._position(start[np.newaxis], end[np.newaxis], start_time, end_time, times)
+                    - self._position(self._start[others], self._end[others], self._start_time[others], self._end_time[others], times))
+        relative /= self.separation
+        # Closest point of each linear piece of the relative movement to the origin
+        piece_start = relative[:, :-1]
+        piece_direction = relative[:, 1:] - piece_start
+        length = np.einsum('ijk,ijk->ij', piece_direction, piece_direction)
+        fraction = np.clip(-np.einsum('ijk,ijk->ij', piece_start, piece_direction) / np.where(length > 0, length, 1.0), 0.0, 1.0)
+        distances = np.linalg.norm(piece_start + fraction[:, :, np.newaxis] * piece_direction, axis=2)
+        # Pieces in which another segment of the route covers the drone do not count
+        covered = (times[:, :-1] >= valid_from[:, np.newaxis]) & (times[:, 1:] <= valid_until[:, np.newaxis])
+        distances = np.where(covered, distances, np.inf)
+        closest = np.argmin(distances, axis=1)
+        rows = np.arange(count)
+        closest_times = times[rows, closest] + fraction[rows, closest] * (times[rows, closest + 1] - times[rows, closest])
+        return closest_times, distances[rows, closest]
+
+    def _position(self, start: np.ndarray, end: np.ndarray, start_time, end_time, times: np.ndarray) -> np.ndarray:
+        """Evaluates segments (n x 3) at the given times (n x k) and returns the positions (n x k x 3)."""
+        start_time = np.reshape(start_time, (-1, 1))
+        duration = np.reshape(end_time, (-1, 1)) - start_time
+        progress = np.clip((times - start_time) / np.where(duration > 0, duration, 1.0), 0.0, 1.0)
+        progress = np.where(duration > 0, progress, (times >= start_time).astype(float))
+        return start[:, np.newaxis, :] + progress[:, :, np.newaxis] * (end - start)[:, np.newaxis, :]
+
+    def _allocate(self, drone_id: str) -> int:
+        free = np.flatnonzero(~self._active)
+        if len(free) == 0:
+            capacity = len(self._active)
+            self._start = np.concatenate((self._start, np.zeros((capacity, 3))))
+            self._end = np.concatenate((self._end, np.zeros((capacity, 3))))
+            self._start_time = np.concatenate((self._start_time, np.zeros(capacity)))
+            self._end_time = np.concatenate((self._end_time, np.zeros(capacity)))
+            self._valid_from = np.concatenate((self._valid_from, np.zeros(capacity)))
+            self._valid_until = np.concatenate((self._valid_until, np.zeros(capacity)))
+            self._active = np.concatenate((self._active, np.zeros(capacity, dtype=bool)))
+            self._drone_ids.extend([None] * capacity)
+            free = [capacity]
+        slot = int(free[0])
+        self._active[slot] = True
+        self._drone_ids[slot] = drone_id
+        return slot
+
+    def _free(self, slot: int):
+        self._active[slot] = False
+        self._drone_ids[slot] = None
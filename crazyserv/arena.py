@@ -10,9 +10,24 @@ class Arena:
         self.min_z: float = 0.0
         self.max_z: float = 1.2
 
+        self.buildings = [[2., 2.8, 0], [1.5, 1., 0], [3.15, 0.7, 0], [3., 2., 0]]
+        self.building_size: float = 0.3
+
         self.arena_id = arena_id
         self.arena_offsets = [[-2, -2, 0], [2, -2, 0], [2, -6, 0]]
 
+    def get_description(self):
+        """Gets the bounds and the buildings of the arena."""
+        return {
+            'min_x': self.min_x,
+            'max_x': self.max_x,
+            'min_y': self.min_y,
+            'max_y': self.max_y,
+            'min_z': self.min_z,
+            'max_z': self.max_z,
+            'buildings': self.buildings
+        }
+
     def transform_x(self, x):
         return x + self.arena_offsets[self.arena_id][0]
 
@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from cflib.utils.callbacks import Caller
+
+
+class Clock:
+    """Wall clock, used when flying real drones. The timers of all wall clocks run on one shared timer wheel."""
+
+    _wheel = None
+    _wheel_lock = threading.Lock()
+
+    def time(self) -> float:
+        """Gets the current time in seconds."""
+        return time.time()
+
+    def sleep(self, seconds: float):
+        """Blocks for the given number of seconds."""
+        time.sleep(seconds)
+
+    def call_later(self, delay: float, callback):
+        """Calls the callback after the given number of seconds, the returned timer can be cancelled."""
+        with Clock._wheel_lock:
+            if Clock._wheel is None:
+                Clock._wheel = TimerWheel()
+        return Clock._wheel.schedule(delay, callback)
+
+
+class TimerWheel:
+    """Runs timers on a single thread instead of a thread per timer.
+
+    The timers are hashed into the slots of a wheel by the tick they are due in, every tick the worker runs the due
+    timers of one slot. Timers of the same tick run in the order they were scheduled, callbacks should return quickly.
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 512):
+        """Initializes the wheel and starts its worker.
+
+        Arguments:
+            tick {float} -- The resolution of the timers in seconds.
+            slots {int} -- The number of slots, timers further ahead than a turn of the wheel wait for later turns.
+        """
+
+        self.tick: float = tick
+        self._slots = [[] for _ in range(slots)]
+        self._start: float = time.time()
+        self._current: int = 0
+        self._pending: int = 0
+        self._lock = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='TimerWheel', daemon=True)
+        self._worker.start()
+
+    def schedule(self, delay: float, callback):
+        """Calls the callback after the given number of seconds, the returned timer can be cancelled."""
+        timer = _Timer(callback)
+        with self._lock:
+            if self._pending == 0:
+                # The worker skips the ticks while it waits for a timer
+                self._current = int((time.time() - self._start) / self.tick)
+                self._lock.notify()
+            self._pending += 1
+            due = max(math.ceil((time.time() + max(delay, 0.0) - self._start) / self.tick), self._current + 1)
+            self._slots[due % len(self._slots)].append((due, timer))
+        return timer
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending == 0:
+                    self._lock.wait()
+            time.sleep(max(self._start + (self._current + 1) * self.tick - time.time(), 0.0))
+            now = int((time.time() - self._start) / self.tick)
+            while self._current < now:
+                with self._lock:
+                    self._current += 1
+                    slot = self._slots[self._current % len(self._slots)]
+                    due = [timer for tick, timer in slot if tick <= self._current]
+                    if due:
+                        slot[:] = [(tick, timer) for tick, timer in slot if tick > self._current]
+                        self._pending -= len(due)
+                for timer in due:
+                    try:
+                        timer.run()
+                    except Exception as e:
+                        print('Timer failed: %s' % e)
+
+
+class VirtualClock(Clock):
+    """Clock that only moves forward when it is advanced.
+
+    Sleeping does not block until another thread advances the clock, the sleeping thread moves the clock to the end of
+    its sleep itself. All threads share the clock, so sleeps of concurrent threads overlap: a sleep which ends before
+    the time another thread advanced the clock to returns once that advance is done, without moving the clock further.
+    """
+
+    def __init__(self, start: float = 0.0, resolution: float = 0.01):
+        self.resolution: float = resolution
+        self._now: float = start
+        self._lock = threading.RLock()
+        self._timers = []
+        self._timer_sequence = itertools.count()
+        # Called with the new time whenever the clock was advanced
+        self.advanced = Caller()
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        self.advance_to(self._now + max(seconds, 0.0))
+
+    def call_later(self, delay: float, callback):
+        with self._lock:
+            timer = _Timer(callback)
+            heapq.heappush(self._timers, (self._now + max(delay, 0.0), next(self._timer_sequence), timer))
+            return timer
+
+    def advance(self, seconds: float) -> float:
+        """Moves the clock forward by the given number of seconds and returns the new time.
+
+        The clock moves in steps of its resolution so that everything happening in between sees the right time."""
+        with self._lock:
+            return self.advance_to(self._now + max(seconds, 0.0))
+
+    def advance_to(self, target: float) -> float:
+        """Moves the clock forward to the given time unless it is there already and returns the new time."""
+        with self._lock:
+            while self._now < target:
+                self._now = min(self._now + self.resolution, target)
+                self.advanced.call(self._now)
+                while self._timers and self._timers[0][0] <= self._now:
+                    _, _, timer = heapq.heappop(self._timers)
+                    timer.run()
+            return self._now
+
+
+class _Timer:
+    def __init__(self, callback):
+        self._callback = callback
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        if not self._cancelled:
+            self._callback()
@@ -0,0 +1,164 @@
+from collections import deque
+from typing import Callable, Dict
+import functools
+import threading
+import uuid
+
+from .clock import Clock
+
+
+class Job:
+    """A command queued for a drone, it is done when the drone finished the command (arrived or landed)."""
+
+    def __init__(self, command: str, function: Callable, args: tuple, submitted: float):
+        self.id: str = uuid.uuid4().hex
+        self.command: str = command
+        self.status: str = 'queued'
+        self.result: dict = None
+        self.error: str = None
+        self.submitted: float = submitted
+        self.started: float = None
+        self.finished: float = None
+        self._function = function
+        self._args = args
+        self._timer = None
+        self._done = threading.Event()
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits until the job is done, failed or cancelled.
+
+        Returns:
+            bool -- True if the job is done, False if the timeout passed before.
+        """
+
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'command': self.command,
+            'status': self.status,
+            'done': self.is_done(),
+            'result': self.result,
+            'error': self.error,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished
+        }
+
+
+class CommandQueue:
+    """Runs the commands of a drone one after the other.
+
+    A command is sent by a short-lived thread, so a takeoff waiting for the estimator holds no request thread. The
+    command returns the duration of the flight, the next command starts when a timer of the clock marks the job as
+    done after that duration.
+    """
+
+    def __init__(self, clock: Clock, history: int = 64):
+        """Initializes the queue.
+
+        Arguments:
+            clock {Clock} -- The clock of the drone which runs the timers.
+            history {int} -- The number of finished jobs which can still be looked up.
+        """
+
+        self._clock: Clock = clock
+        self._history: int = history
+        self._queue = deque()
+        self._current: Job = None
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, command: str, function: Callable, *args) -> Job:
+        """Queues a command, it starts when all earlier commands are done.
+
+        Arguments:
+            command {str} -- The name of the command.
+            function {Callable} -- Sends the command and returns its result with the duration (and delay) in seconds,
+                                   None or a result which was not accepted if the command failed.
+
+        Returns:
+            Job -- The queued job.
+        """
+
+        job = Job(command, function, args, self._clock.time())
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs
+            finished = [job_id for job_id, old in self._jobs.items() if old.is_done()]
+            for job_id in finished[:max(len(self._jobs) - self._history, 0)]:
+                self._jobs.pop(job_id)
+            self._queue.append(job)
+            start = self._current is None
+        if start:
+            self._start_next()
+        return job
+
+    def get_job(self, job_id: str) -> Job:
+        """Gets a queued, running or recently finished job, None if no such job exists."""
+        return self._jobs.get(job_id)
+
+    def get_jobs(self) -> list:
+        return list(self._jobs.values())
+
+    def cancel(self):
+        """Cancels the running and all queued jobs, for example when the drone got a command directly."""
+        with self._lock:
+            jobs = list(self._queue)
+            if self._current is not None:
+                jobs.append(self._current)
+                if self._current._timer is not None:
+                    self._current._timer.cancel()
+            self._queue.clear()
+            self._current = None
+        for job in jobs:
+            self._finish(job, 'cancelled')
+
+    def _start_next(self):
+        with self._lock:
+            if self._current is not None or not self._queue:
+                return
+            job = self._queue.popleft()
+            self._current = job
+            job.status = 'running'
+            job.started = self._clock.time()
+        threading.Thread(target=self._execute, args=(job,), name='Job ' + job.command, daemon=True).start()
+
+    def _execute(self, job: Job):
+        try:
+            result = job._function(*job._args)
+        except Exception as e:
+            result = None
+            job.error = str(e)
+        job.result = result
+        if result is None or not result.get('accepted', True):
+            if job.error is None:
+                job.error = 'The command was not accepted.' if result is not None else 'The command failed.'
+            self._complete(job, 'failed')
+            return
+        # The clock runs its timers under its own lock, so the timer is scheduled outside of the lock of the queue
+        timer = self._clock.call_later(result.get('delay', 0.0) + result.get('duration', 0.0), functools.partial(self._complete, job))
+        with self._lock:
+            job._timer = timer
+            if job is not self._current:
+                # Cancelled while the command was sent
+                timer.cancel()
+
+    def _complete(self, job: Job, status: str = 'done'):
+        with self._lock:
+            if job is not self._current:
+                return
+            self._current = None
+        self._finish(job, status)
+        self._start_next()
+
+    def _finish(self, job: Job, status: str):
+        if job.is_done():
+            return
+        job.status = status
+        job.finished = self._clock.time()
+        job._done.set()
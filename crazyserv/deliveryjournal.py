@@ -0,0 +1,178 @@
+from typing import List
+import json
+import queue
+import threading
+import time
+
+
+class DeliveryJournal:
+    """Append-only journal of the package events of all swarms.
+
+    Every event is one JSON line: the reset of a package generator, packages being created, picked up and delivered
+    and pickups which exceeded the maximum weight. Recording an event only queues it, a background thread writes the
+    queued events in batches and flushes the file periodically, so a crash loses at most the events of one flush
+    interval. The state of a swarm is rebuilt by replaying its events since its last reset. If the journal cannot be
+    written the writer stops, the journal is marked as failed and later events are dropped instead of piling up in memory.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 256):
+        """Opens the journal and starts its writer.
+
+        Arguments:
+            path {str} -- The file the events are appended to.
+            flush_interval {float} -- The longest time in seconds an event stays in memory.
+            batch_size {int} -- The number of events written at once at most.
+        """
+
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self.written: int = 0
+        self.failed: bool = False
+        self._events = queue.Queue()
+        self._file = open(path, 'a')
+        self._writer = threading.Thread(target=self._write, name='Delivery journal', daemon=True)
+        self._writer.start()
+
+    def record(self, swarm_id: str, event: str, **fields):
+        """Queues an event, it is written by the writer thread.
+
+        Arguments:
+            swarm_id {str} -- The swarm of the event.
+            event {str} -- The type of the event: reset, created, picked, delivered or weight_exceeded.
+        """
+
+        if self.failed:
+            return
+        self._events.put(dict(fields, time=time.time(), swarm_id=swarm_id, event=event))
+
+    def export(self, path: str, text: str):
+        """Queues a file to be written by the writer thread after the events recorded before it.
+
+        Arguments:
+            path {str} -- The file, it is overwritten.
+            text {str} -- The content of the file.
+        """
+
+        if self.failed:
+            _export(path, text)
+            return
+        self._events.put((path, text))
+
+    def flush(self):
+        """Waits until the writer wrote and flushed all events recorded before."""
+        if self.failed:
+            return
+        written = threading.Event()
+        self._events.put(written)
+        # The writer sets the event also when it fails or is closed
+        while not written.wait(0.1) and self._writer.is_alive():
+            pass
+
+    def close(self):
+        """Writes all queued events and closes the file."""
+        self._events.put(None)
+        self._writer.join()
+        try:
+            self._file.close()
+        except OSError as error:
+            print('Closing the delivery journal %s failed: %s' % (self.path, error))
+
+    def _write(self):
+        closed = False
+        last_flush = time.monotonic()
+        while not closed:
+            batch = []
+            try:
+                batch.append(self._events.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._events.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                closed = True
+            flushes = [item for item in batch if isinstance(item, threading.Event)]
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if closed or flushes or time.monotonic() - last_flush >= self.flush_interval:
+                    self._file.flush()
+                    last_flush = time.monotonic()
+            except OSError as error:
+                print('Writing the delivery journal %s failed, later events are dropped: %s' % (self.path, error))
+                self.failed = True
+                self._drop(batch)
+                return
+            finally:
+                for flushed in flushes:
+                    flushed.set()
+
+    def _drop(self, batch: list):
+        """Drops the queued events of a failed journal, the queued files are still written."""
+        try:
+            while True:
+                batch.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        for path, text in [item for item in batch if isinstance(item, tuple)]:
+            _export(path, text)
+        for flushed in [item for item in batch if isinstance(item, threading.Event)]:
+            flushed.set()
+
+    def _write_batch(self, batch: list):
+        events = [item for item in batch if isinstance(item, dict)]
+        self._file.write(''.join([json.dumps(event) + '\n' for event in events]))
+        self.written += len(events)
+        for path, text in [item for item in batch if isinstance(item, tuple)]:
+            _export(path, text)
+
+
+def _export(path: str, text: str):
+    # A file which cannot be exported does not stop the journal
+    try:
+        with open(path, 'w') as export_file:
+            export_file.write(text)
+    except OSError as error:
+        print('Writing %s failed: %s' % (path, error))
+
+
+def read_journal(path: str, swarm_id: str) -> List[dict]:
+    """Reads the events of a swarm since its last reset.
+
+    Arguments:
+        path {str} -- The journal file.
+        swarm_id {str} -- The id of the swarm.
+
+    Returns:
+        List[dict] -- The events in the order they happened, starting with the reset, empty if the swarm was never reset.
+    """
+
+    events = []
+    with open(path) as journal:
+        for line in journal:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # The last line may be cut off by a crash
+                continue
+            if event['swarm_id'] != swarm_id:
+                continue
+            if event['event'] == 'reset':
+                events = []
+            events.append(event)
+    return events if events and events[0]['event'] == 'reset' else []
+
+
+def read_swarm_ids(path: str) -> List[str]:
+    swarm_ids = []
+    with open(path) as journal:
+        for line in journal:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event['event'] == 'reset' and event['swarm_id'] not in swarm_ids:
+                swarm_ids.append(event['swarm_id'])
+    return swarm_ids
+
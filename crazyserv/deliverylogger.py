@@ -1,10 +1,24 @@
+from typing import Dict, List
+import threading
 import numpy as np
 
+from .deliveryjournal import DeliveryJournal
+from .dispatcher import Dispatcher
 from .drone import Drone
 
 
 class DeliveryLogger:
-    def __init__(self):
+    """Keeps track of the pending packages of a swarm and the load of its drones.
+
+    Pickups and deliveries are transactions: the checks and the changes happen under one lock, so two drones can never
+    pick up the same package and a load is never changed twice. The pending packages are also indexed by their
+    destination pad and by their weight, the indexes change together with the log. Every change is recorded in the
+    journal, if there is one, from which the logger can be rebuilt with apply.
+    """
+
+    def __init__(self, swarm_id: str = None, journal: DeliveryJournal = None):
+        self.swarm_id = swarm_id
+        self.journal = journal
         self.log = {}
         self.count = 0
         self.count_weight_exceeded = 0
@@ -12,53 +26,229 @@ class DeliveryLogger:
         self.drone_load = {}
         self.sensitivity = 0.5
         self.sensitivity_z = 0.2
+        self.pickup_zones = [[2.2, 1.6]]
+        self.max_pending = 20
+        self.pending_by_pad: Dict[int, Dict[str, dict]] = {}
+        self.pending_by_weight: Dict[float, Dict[str, dict]] = {}
+        self._lock = threading.Lock()
 
     def add_package(self, swarm_id, package):
+        package_id = package['id']
+        with self._lock:
+            self._add_package(package)
+            self.swarm_id = swarm_id
+            self._record('created', package_id=package_id, coordinates=package['coordinates'], pad=package.get('pad'), weight=package['weight'])
+
+    def _add_package(self, package):
         package_id = package['id']
         self.log[package_id] = package
-        self.swarm_id = swarm_id
+        self.pending_by_pad.setdefault(package.get('pad'), {})[package_id] = package
+        self.pending_by_weight.setdefault(package['weight'], {})[package_id] = package
 
     def pickup(self, swarm_id, package_id, drone: Drone):
+        with self._lock:
+            return self._pickup(package_id, drone)
+
+    def deliver(self, swarm_id, package_id, drone: Drone):
+        with self._lock:
+            return self._deliver(package_id, drone)
+
+    def _pickup(self, package_id, drone: Drone):
         if package_id not in self.log:
             return False
         package = self.log[package_id]
         if package['picked']:
             return False
-        if self.drone_is_in_landing_zone(drone, [2.2, 1.6]):
+        if self.drone_is_in_pickup_zone(drone):
             new_drone_load = self.drone_load.get(drone.id, 0) + package['weight']
             if new_drone_load > self.max_weight:
                 self.count_weight_exceeded += 1
+                self._record('weight_exceeded', package_id=package_id, drone_id=drone.id)
                 return False
-            package['drone'] = drone.id
-            package['picked'] = True
-            self.drone_load[drone.id] = new_drone_load
+            self._picked(package, drone.id)
+            self._record('picked', package_id=package_id, drone_id=drone.id)
             return True
         return False
 
-    def deliver(self, swarm_id, package_id, drone: Drone):
+    def _picked(self, package, drone_id):
+        package['drone'] = drone_id
+        package['picked'] = True
+        self.drone_load[drone_id] = self.drone_load.get(drone_id, 0) + package['weight']
+
+    def _deliver(self, package_id, drone: Drone):
         if package_id not in self.log:
             return False
         package = self.log[package_id]
         if package['drone'] is None or package['drone'] != drone.id:
             return False
         if self.drone_is_in_landing_zone(drone, package['coordinates']):
-            self.log.pop(package_id)
-            self.count += 1
-            self.drone_load[drone.id] -= package['weight']
+            self._delivered(package)
+            self._record('delivered', package_id=package_id, drone_id=drone.id)
             return True
         return False
 
+    def _delivered(self, package):
+        package_id = package['id']
+        self.log.pop(package_id)
+        self.pending_by_pad[package.get('pad')].pop(package_id)
+        self.pending_by_weight[package['weight']].pop(package_id)
+        self.count += 1
+        self.drone_load[package['drone']] -= package['weight']
+
+    def _record(self, event, **fields):
+        if self.journal is not None:
+            self.journal.record(self.swarm_id, event, **fields)
+
+    def apply(self, event: dict):
+        """Applies an event of the journal, replaying all events of a swarm since its reset rebuilds its logger.
+
+        Arguments:
+            event {dict} -- The event as recorded in the journal.
+        """
+
+        with self._lock:
+            if event['event'] == 'created':
+                self._add_package({'id': event['package_id'], 'coordinates': event['coordinates'], 'pad': event['pad'],
+                                   'weight': event['weight'], 'drone': None, 'picked': False})
+            elif event['event'] == 'picked':
+                self._picked(self.log[event['package_id']], event['drone_id'])
+            elif event['event'] == 'delivered':
+                self._delivered(self.log[event['package_id']])
+            elif event['event'] == 'weight_exceeded':
+                self.count_weight_exceeded += 1
+
+    def get_scores(self) -> dict:
+        with self._lock:
+            return {
+                'delivered': self.count,
+                'pending': len(self.log),
+                'picked': sum([package['picked'] for package in self.log.values()]),
+                'weight_exceeded': self.count_weight_exceeded
+            }
+
     def drone_is_in_landing_zone(self, drone: Drone, coordinates: []):
-        status = drone.get_status()
-        return np.sqrt((status['x'] - coordinates[0])**2 + (status['y'] - coordinates[1])**2) < self.sensitivity and status['z'] < self.sensitivity_z
+        return bool(self.landed_in_zones(np.array([drone.get_position()]), np.array([coordinates]))[0, 0])
+
+    def drone_is_in_pickup_zone(self, drone: Drone):
+        return bool(self.landed_in_zones(np.array([drone.get_position()]), np.array(self.pickup_zones)).any())
+
+    def landed_in_zones(self, positions: np.ndarray, zones: np.ndarray) -> np.ndarray:
+        """Checks for all drone positions (n x 3) and zones (m x 2+) whether the drone landed in the zone (n x m)."""
+        if len(positions) == 0 or len(zones) == 0:
+            return np.zeros((len(positions), len(zones)), dtype=bool)
+        offsets = positions[:, np.newaxis, :2] - zones[np.newaxis, :, :2]
+        distances = np.sqrt((offsets ** 2).sum(axis=2))
+        return (distances < self.sensitivity) & (positions[:, 2] < self.sensitivity_z)[:, np.newaxis]
+
+    def eligible_actions(self, drones: List[Drone], auto_deliver: bool = False):
+        """Finds which drone can pick up or deliver which package right now, checking all of them in one pass.
+
+        Arguments:
+            drones {List[Drone]} -- The drones of the swarm.
+            auto_deliver {bool} -- Deliver all packages which can be delivered right away.
+
+        Returns:
+            dict -- The possible pickups and deliveries and the packages which were delivered automatically.
+        """
+
+        with self._lock:
+            return self._eligible_actions(drones, auto_deliver)
+
+    def _eligible_actions(self, drones: List[Drone], auto_deliver: bool):
+        packages = list(self.log.values())
+        positions = np.array([drone.get_position() for drone in drones]).reshape(-1, 3)
+        destinations = np.array([package['coordinates'] for package in packages]).reshape(-1, 3)
+        weights = np.array([package['weight'] for package in packages])
+        picked = np.array([package['picked'] for package in packages], dtype=bool)
+        loads = np.array([self.drone_load.get(drone.id, 0) for drone in drones])
+        drone_indices = {drone.id: index for index, drone in enumerate(drones)}
+        carrier_indices = np.array([drone_indices.get(package['drone'], -1) for package in packages], dtype=int)
+        carriers = carrier_indices[np.newaxis, :] == np.arange(len(drones))[:, np.newaxis]
+
+        in_pickup_zone = self.landed_in_zones(positions, np.array(self.pickup_zones)).any(axis=1)
+        at_destination = self.landed_in_zones(positions, destinations)
+        can_pickup = in_pickup_zone[:, np.newaxis] & ~picked[np.newaxis, :] & (loads[:, np.newaxis] + weights[np.newaxis, :] <= self.max_weight)
+        can_deliver = carriers & at_destination
+
+        actions = {
+            'pickup': [{'drone_id': drones[d].id, 'package_id': packages[p]['id'], 'weight': packages[p]['weight']}
+                       for d, p in zip(*np.nonzero(can_pickup))],
+            'deliver': [{'drone_id': drones[d].id, 'package_id': packages[p]['id']} for d, p in zip(*np.nonzero(can_deliver))],
+            'delivered': []
+        }
+        if auto_deliver:
+            deliveries = actions['deliver']
+            actions['deliver'] = []
+            for delivery in deliveries:
+                drone = drones[drone_indices[delivery['drone_id']]]
+                if self._deliver(delivery['package_id'], drone):
+                    actions['delivered'].append(delivery)
+                else:
+                    actions['deliver'].append(delivery)
+        return actions
+
+    def dispatch(self, drones: List[Drone], budget: float = 0.05) -> dict:
+        """Plans which drone picks up which pending packages and in which order the drones deliver them.
+
+        Arguments:
+            drones {List[Drone]} -- The drones of the swarm.
+            budget {float} -- The time in seconds the planning may take.
+
+        Returns:
+            dict -- The trip of each drone and the packages which no drone can take.
+        """
+
+        with self._lock:
+            packages = [dict(package) for package in self.log.values()]
+            loads = {drone.id: self.drone_load.get(drone.id, 0) for drone in drones}
+        dispatcher = Dispatcher(self.pickup_zones, self.max_weight)
+        return dispatcher.dispatch([{'id': drone.id, 'position': drone.get_position(), 'load': loads[drone.id]} for drone in drones],
+                                   packages, budget)
+
+    def get_pending(self, pad: int = None, weight: float = None) -> List[dict]:
+        """Gets the pending packages, optionally only those to one pad or of one weight.
+
+        Arguments:
+            pad {int} -- The index of the destination pad, None for all pads.
+            weight {float} -- The weight of the packages, None for all weights.
+
+        Returns:
+            List[dict] -- Copies of the matching packages, including the drone carrying them.
+        """
+
+        with self._lock:
+            if pad is None and weight is None:
+                packages = self.log
+            elif weight is None:
+                packages = self.pending_by_pad.get(pad, {})
+            elif pad is None:
+                packages = self.pending_by_weight.get(weight, {})
+            else:
+                packages = self.pending_by_pad.get(pad, {})
+                by_weight = self.pending_by_weight.get(weight, {})
+                packages = {package_id: package for package_id, package in packages.items() if package_id in by_weight}
+            return [dict(package) for package in packages.values()]
+
+    def get_free_slots(self) -> int:
+        return max(self.max_pending - len(self.log), 0)
 
     def log_is_full(self, swarm_id):
-        return len(self.log) >= 20
+        return len(self.log) >= self.max_pending
 
-    # TODO: thread-safe implementation of file operation
     def print_deliveries(self):
-        log_file = open(self.swarm_id + "_results.txt", "w")
-        log_file.write("Swarm " + self.swarm_id + " has " + str(self.count) + " deliveries and " + str(len(self.log)) +
-                       " still pending and " + str(self.count_weight_exceeded) + " weight exceeds on a drone.")
-        log_file.close()
+        # Only the counts are taken under the lock, the file is written after it was released
+        with self._lock:
+            swarm_id, count, pending, count_weight_exceeded = self.swarm_id, self.count, len(self.log), self.count_weight_exceeded
+        text = ("Swarm " + swarm_id + " has " + str(count) + " deliveries and " + str(pending) +
+                " still pending and " + str(count_weight_exceeded) + " weight exceeds on a drone.")
+        if self.journal is not None:
+            # The writer of the journal writes the file in the background
+            self.journal.export(swarm_id + "_results.txt", text)
+        else:
+            self._print_deliveries(swarm_id + "_results.txt", text)
         return True
+
+    def _print_deliveries(self, path, text):
+        log_file = open(path, "w")
+        log_file.write(text)
+        log_file.close()
@@ -0,0 +1,258 @@
+from typing import Dict, List
+import itertools
+import time
+
+import numpy as np
+
+
+class Dispatcher:
+    """Assigns the pending packages to the drones and orders the stops of each drone.
+
+    Every drone flies one trip: if it gets new packages it flies to a pickup zone first and then delivers the new and
+    the packages it already carries, otherwise it only delivers the packages it carries. The weight of the packages of
+    a drone may not exceed the maximum weight. The cost of a trip is the sum of the distances each package travels
+    until it is delivered, so trips which deliver many packages early are preferred, and every package left behind
+    costs a fixed penalty. Distances are straight lines in the x-y plane.
+
+    The packages are first inserted greedily where they add the least cost, then packages are moved and swapped
+    between the drones as long as this lowers the cost and the time budget allows.
+    """
+
+    # All orders of the stops of a trip, by the number of stops
+    _permutations: Dict[int, np.ndarray] = {}
+
+    def __init__(self, pickup_zones: List[List[float]], max_weight: float, unassigned_cost: float = 100.0, max_exact_stops: int = 7):
+        """Initializes the dispatcher.
+
+        Arguments:
+            pickup_zones {List[List[float]]} -- The zones (x, y) where packages are picked up.
+            max_weight {float} -- The weight a drone can carry at most.
+            unassigned_cost {float} -- The cost of a package which is not assigned to any drone.
+            max_exact_stops {int} -- Trips with up to this many stops are ordered by trying all orders, longer
+                                     ones by visiting the nearest stop next.
+        """
+
+        self.pickup_zones = np.array(pickup_zones, dtype=float).reshape(-1, 2)[:, :2]
+        self.max_weight: float = max_weight
+        self.unassigned_cost: float = unassigned_cost
+        self.max_exact_stops: int = max_exact_stops
+
+    def dispatch(self, drones: List[dict], packages: List[dict], budget: float = 0.05) -> dict:
+        """Plans a trip for every drone.
+
+        Arguments:
+            drones {List[dict]} -- The id, position (x, y, z) and load of each drone.
+            packages {List[dict]} -- The pending packages with id, coordinates, weight, the carrying drone and
+                                     whether they were picked up.
+            budget {float} -- The time in seconds after which the best assignment found so far is returned.
+
+        Returns:
+            dict -- The trip of each drone, the packages which were not assigned and the cost of the plan.
+        """
+
+        started = time.perf_counter()
+        deadline = started + budget
+        problem = _Problem(self, drones, packages)
+        iterations = problem.solve(deadline)
+        trips = [problem.describe_trip(d) for d in range(len(drones))]
+        return {
+            'trips': trips,
+            'unassigned': [packages[p]['id'] for p in problem.unassigned()],
+            'cost': problem.total_cost(),
+            'distance': sum([trip['distance'] for trip in trips]),
+            'iterations': iterations,
+            'elapsed': time.perf_counter() - started
+        }
+
+    def get_permutations(self, count: int) -> np.ndarray:
+        if count not in self._permutations:
+            self._permutations[count] = np.array(list(itertools.permutations(range(count))), dtype=int).reshape(-1, count)
+        return self._permutations[count]
+
+
+class _Problem:
+    def __init__(self, dispatcher: Dispatcher, drones: List[dict], packages: List[dict]):
+        self._dispatcher = dispatcher
+        self._drone_ids = [drone['id'] for drone in drones]
+        self._packages = packages
+        drone_indices = {drone_id: index for index, drone_id in enumerate(self._drone_ids)}
+
+        # Packages to the same destination share a stop
+        destinations = np.array([package['coordinates'] for package in packages], dtype=float).reshape(-1, 3)[:, :2]
+        self.stops, self._stop_of = np.unique(destinations.round(6), axis=0, return_inverse=True)
+        self._stop_of = self._stop_of.reshape(-1)
+        self._weights = np.array([package['weight'] for package in packages], dtype=float)
+
+        # All distances between the starts, the pickup zones and the stops at once
+        starts = np.array([drone['position'] for drone in drones], dtype=float).reshape(-1, 3)[:, :2]
+        zones = dispatcher.pickup_zones
+        distance = lambda a, b: np.linalg.norm(a[:, np.newaxis, :] - b[np.newaxis, :, :], axis=2)
+        self._start_stop = distance(starts, self.stops)
+        self._start_zone = distance(starts, zones)
+        self._zone_stop = distance(zones, self.stops)
+        self._stop_stop = distance(self.stops, self.stops)
+
+        # Packages which were picked up stay with their drone, the others can be assigned (-1 if not assigned)
+        self._carried = np.array([drone_indices.get(package['drone'], -1) if package['picked'] else -1 for package in packages], dtype=int)
+        self._free = np.array([not package['picked'] for package in packages], dtype=bool)
+        self._assigned = np.full(len(packages), -1, dtype=int)
+        self._capacity = np.array([dispatcher.max_weight - drone['load'] for drone in drones], dtype=float)
+        self._trip_costs = np.zeros(len(drones))
+        self._trips = {}
+
+    def solve(self, deadline: float) -> int:
+        for d in range(len(self._drone_ids)):
+            self._trip_costs[d] = self._trip(d, self._assigned)[0]
+        # Heavy packages first, they are the hardest to fit
+        for p in sorted(np.nonzero(self._free)[0], key=lambda p: -self._weights[p]):
+            self._insert(p)
+            if time.perf_counter() > deadline:
+                return 0
+        iterations = 0
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            iterations += 1
+            for p in np.nonzero(self._free)[0]:
+                improved = self._relocate(p) or improved
+                if time.perf_counter() > deadline:
+                    return iterations
+            for p, q in itertools.combinations(np.nonzero(self._free & (self._assigned >= 0))[0], 2):
+                improved = self._swap(p, q) or improved
+                if time.perf_counter() > deadline:
+                    return iterations
+        return iterations
+
+    def unassigned(self) -> List[int]:
+        return [int(p) for p in np.nonzero(self._free & (self._assigned < 0))[0]]
+
+    def total_cost(self) -> float:
+        return float(self._trip_costs.sum() + self._dispatcher.unassigned_cost * len(self.unassigned()))
+
+    def describe_trip(self, d: int) -> dict:
+        cost, order, zone, distance = self._trip(d, self._assigned)
+        new = np.nonzero(self._assigned == d)[0]
+        carried = np.nonzero(self._carried == d)[0]
+        packages = np.concatenate((new, carried))
+        stops = []
+        if len(new) > 0:
+            stops.append({'type': 'pickup', 'coordinates': self._dispatcher.pickup_zones[zone].tolist(),
+                          'package_ids': [self._packages[p]['id'] for p in new]})
+        for stop in order:
+            stops.append({'type': 'deliver', 'coordinates': self.stops[stop].tolist(),
+                          'package_ids': [self._packages[p]['id'] for p in packages if self._stop_of[p] == stop]})
+        return {
+            'drone_id': self._drone_ids[d],
+            'pickup': [self._packages[p]['id'] for p in new],
+            'carried': [self._packages[p]['id'] for p in carried],
+            'weight': float(self._weights[packages].sum()),
+            'stops': stops,
+            'distance': distance,
+            'cost': cost
+        }
+
+    def _insert(self, p: int):
+        best, best_delta = None, self._dispatcher.unassigned_cost
+        for d in np.nonzero(self._capacity - self._loads() >= self._weights[p] - 1e-9)[0]:
+            self._assigned[p] = d
+            delta = self._trip(d, self._assigned)[0] - self._trip_costs[d]
+            self._assigned[p] = -1
+            if delta < best_delta:
+                best, best_delta = d, delta
+        if best is not None:
+            self._assigned[p] = best
+            self._trip_costs[best] += best_delta
+
+    def _relocate(self, p: int) -> bool:
+        """Moves the package to the drone (or no drone) where it costs the least."""
+        source = self._assigned[p]
+        self._assigned[p] = -1
+        source_cost = self._trip(source, self._assigned)[0] if source >= 0 else 0.0
+        removed = (self._trip_costs[source] - source_cost if source >= 0 else self._dispatcher.unassigned_cost)
+        best, best_cost = -1, self._dispatcher.unassigned_cost
+        free_capacity = self._capacity - self._loads()
+        for d in np.nonzero(free_capacity >= self._weights[p] - 1e-9)[0]:
+            self._assigned[p] = d
+            cost = self._trip(d, self._assigned)[0] - (source_cost if d == source else self._trip_costs[d])
+            if cost < best_cost:
+                best, best_cost = d, cost
+        if best_cost < removed - 1e-9 and best != source:
+            if source >= 0:
+                self._trip_costs[source] = source_cost
+            if best >= 0:
+                self._assigned[p] = best
+                self._trip_costs[best] = self._trip(best, self._assigned)[0]
+            else:
+                self._assigned[p] = -1
+            return True
+        self._assigned[p] = source
+        return False
+
+    def _swap(self, p: int, q: int) -> bool:
+        """Exchanges two packages of different drones if both trips get cheaper together."""
+        first, second = self._assigned[p], self._assigned[q]
+        if first == second:
+            return False
+        loads = self._loads()
+        if (loads[first] - self._weights[p] + self._weights[q] > self._capacity[first] + 1e-9 or
+                loads[second] - self._weights[q] + self._weights[p] > self._capacity[second] + 1e-9):
+            return False
+        self._assigned[p], self._assigned[q] = second, first
+        first_cost = self._trip(first, self._assigned)[0]
+        second_cost = self._trip(second, self._assigned)[0]
+        if first_cost + second_cost < self._trip_costs[first] + self._trip_costs[second] - 1e-9:
+            self._trip_costs[first], self._trip_costs[second] = first_cost, second_cost
+            return True
+        self._assigned[p], self._assigned[q] = first, second
+        return False
+
+    def _loads(self) -> np.ndarray:
+        """Gets the weight of the newly assigned packages of every drone."""
+        assigned = self._assigned >= 0
+        return np.bincount(self._assigned[assigned], weights=self._weights[assigned], minlength=len(self._drone_ids))
+
+    def _trip(self, d: int, assigned: np.ndarray) -> tuple:
+        """Finds the best order of the stops of a drone, returns its cost, order, pickup zone and distance."""
+        new = assigned == d
+        counts = np.bincount(self._stop_of[new | (self._carried == d)], minlength=len(self.stops))
+        key = (d, new.any(), counts.tobytes())
+        if key in self._trips:
+            return self._trips[key]
+        stops = np.nonzero(counts)[0]
+        if len(stops) == 0:
+            trip = (0.0, [], 0, 0.0)
+        elif len(stops) <= self._dispatcher.max_exact_stops:
+            trip = self._best_order(d, new.any(), stops, counts, stops[self._dispatcher.get_permutations(len(stops))])
+        else:
+            trip = self._best_order(d, new.any(), stops, counts, self._nearest_order(d, new.any(), stops)[np.newaxis, :])
+        self._trips[key] = trip
+        return trip
+
+    def _best_order(self, d: int, pickup: bool, stops: np.ndarray, counts: np.ndarray, orders: np.ndarray) -> tuple:
+        # The first leg of every order (through the best pickup zone), then the legs between the stops
+        if pickup:
+            through_zone = self._start_zone[d][:, np.newaxis] + self._zone_stop[:, orders[:, 0]]
+            zones = through_zone.argmin(axis=0)
+            first = through_zone.min(axis=0)
+        else:
+            zones = np.zeros(len(orders), dtype=int)
+            first = self._start_stop[d, orders[:, 0]]
+        legs = np.hstack((first[:, np.newaxis], self._stop_stop[orders[:, :-1], orders[:, 1:]]))
+        arrivals = np.cumsum(legs, axis=1)
+        costs = (arrivals * counts[orders]).sum(axis=1)
+        best = int(costs.argmin())
+        return float(costs[best]), orders[best].tolist(), int(zones[best]), float(arrivals[best, -1])
+
+    def _nearest_order(self, d: int, pickup: bool, stops: np.ndarray) -> np.ndarray:
+        if pickup:
+            zone = (self._start_zone[d][:, np.newaxis] + self._zone_stop[:, stops]).min(axis=1).argmin()
+            distances = self._zone_stop[zone, stops]
+        else:
+            distances = self._start_stop[d, stops]
+        remaining = list(stops)
+        order = []
+        while remaining:
+            index = int(np.argmin(distances))
+            order.append(remaining.pop(index))
+            distances = self._stop_stop[order[-1], remaining]
+        return np.array(order, dtype=int)
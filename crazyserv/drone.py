@@ -1,15 +1,29 @@
 from enum import Enum, auto
-import time
+from collections import deque
+from typing import Dict, List
+import functools
 import math
 import threading
+import json
 import numpy as np
 
 from cflib.crazyflie import Crazyflie
-from cflib.crazyflie.log import LogConfig
+from cflib.crazyflie.log import LogConfig, LogTocElement
+from cflib.crazyflie.mem import MemoryElement, Poly4D
 from cflib.utils.callbacks import Caller
 
 
+from .airspace import Airspace
 from .arena import Arena
+from .clock import Clock
+from .commandqueue import CommandQueue
+from .flightrecorder import FlightRecorder
+from .radioscheduler import Lane, RadioScheduler
+from .simulation import SimulationEngine
+from .telemetryhistory import TelemetryHistory
+from .telemetryprofile import TelemetryProfile, standard_profile
+from .toccache import SharedTocCache
+from .trajectory import fit_trajectory
 
 
 class DroneState(Enum):
@@ -24,8 +38,13 @@ class DroneState(Enum):
 class Drone:
     """Represents a CrazyFlie drone."""
 
-    def __init__(self, drone_id: str,  arena: Arena, radio_id: int = 0, channel: int = 80, address: str = "E7E7E7E7E7", data_rate: str = "2M"):
-        """ Initializes the drone with the given uri."""
+    def __init__(self, drone_id: str,  arena: Arena, radio_id: int = 0, channel: int = 80, address: str = "E7E7E7E7E7", data_rate: str = "2M",
+                 simulation: SimulationEngine = None, radio: RadioScheduler = None, telemetry_profile: TelemetryProfile = None,
+                 toc_cache: SharedTocCache = None):
+        """ Initializes the drone with the given uri. The drone is simulated if a simulation engine is given.
+        Everything sent to the drone is accounted by the scheduler of its radio, drones on the same radio should share it.
+        The telemetry profile selects the log blocks, by default all values are streamed as floats.
+        Real drones should share the TOC cache, by default a cache of their own in ./cache is used."""
 
         # Initialize public variables
         self.id: str = drone_id
@@ -39,9 +58,13 @@ class Drone:
         self.roll: float = 0
         self.yaw: float = 0
         self.battery_voltage: float = 0
+        # Crazyflie timestamp (ms) and receive time (s) of the latest position sample
+        self.position_timestamp: int = None
+        self.position_time: float = None
         self.is_connected: bool = False
         self.status: DroneState = DroneState.OFFLINE
-        self.link_uri: str = "radio://" + str(radio_id) + "/" + str(channel) + "/" + data_rate + "/" + address
+        self.is_simulated: bool = simulation is not None
+        self.link_uri: str = ("sim://" if self.is_simulated else "radio://") + str(radio_id) + "/" + str(channel) + "/" + data_rate + "/" + address
 
         # Initialize limits
         self._max_velocity: float = 1.0
@@ -49,59 +72,128 @@ class Drone:
         self._max_yaw_rotations: float = 1.0
         self._arena = arena
 
-        # Event to asynchronously wait for the connection
+        # Initialize the estimator convergence check
+        self._estimator_threshold: float = 0.001
+        self._estimator_window: int = 3
+        self._estimator_timeout: float = 5.0
+        self._estimator_poll_interval: float = 0.02
+        self._estimator_log_period: int = 100
+        self._variance_history = deque(maxlen=self._estimator_window)
+        self._calibrating: bool = False
+
+        # Log periods in ms of the variance and battery, the position and the attitude (the rate classes of the log
+        # blocks) in each state, the position is streamed fast while moving and everything slowly on the ground
+        self.log_periods: Dict[DroneState, List[int]] = {
+            DroneState.IDLE: [1000, 1000, 2000],
+            DroneState.HOVERING: [500, 200, 500],
+            DroneState.STARTING: [500, 100, 250],
+            DroneState.LANDING: [500, 100, 250],
+            DroneState.NAVIGATING: [500, 100, 250]
+        }
+
+        # Timers for the remaining legs of a flight along waypoints or a delayed go_to and for the arrival
+        self._waypoint_timers = []
+
+        # Velocity from the latest position samples and the segment the drone flies, used to extrapolate the position
+        self._velocity = np.zeros(3)
+        self._segment = None
+        self._max_extrapolation: float = 0.5
+
+        # Time to wait for the Crazyflie to confirm a parameter write. After connecting, cflib downloads the values of
+        # all parameters and a confirmation would queue behind them, so the setup waits for the download first.
+        self._param_timeout: float = 1.0
+        self._param_download_timeout: float = 5.0
+        self._params_updated = threading.Event()
+
+        # Missions are uploaded to the start of the trajectory memory under this id
+        self._mission_trajectory_id: int = 1
+        self._memory_write_chunk: int = 24
+        self._memory_write_timeout: float = 5.0
+        # A piece has 8 coefficients for each of x, y, z and yaw and its duration, all as 4 byte floats
+        self._trajectory_piece_size: int = 33 * 4
+
+        # Airspace of the swarm which the flight segments are checked against, set when the drone joins a swarm
+        self.airspace: Airspace = None
+
+        # Recorder of the telemetry and the commands of the swarm, None to record nothing
+        self.recorder: FlightRecorder = None
+
+        # Simulated drones share the clock of the simulation, which may be virtual
+        self._clock: Clock = simulation.clock if self.is_simulated else Clock()
+
+        # Commands which run one after the other, each is done when the drone arrived
+        self.jobs = CommandQueue(self._clock)
+
+        self.radio: RadioScheduler = radio if radio is not None else RadioScheduler(self.link_uri.rsplit('/', 3)[0], data_rate, self._clock)
+
+        # Event to asynchronously wait for the connection and the time a synchronous connect waits for it
         self._connect_event = threading.Event()
+        self._connect_timeout: float = 10.0
 
-        # Initialize the crazyflie
-        self._cf = Crazyflie(rw_cache='./cache')
+        # Initialize the crazyflie (or its simulated stand-in which is placed in the corner of the arena)
+        if self.is_simulated:
+            self._cf = simulation.create_crazyflie([arena.transform_x(arena.min_x), arena.transform_y(arena.min_y), arena.transform_z(arena.min_z)])
+        else:
+            toc_cache = toc_cache if toc_cache is not None else SharedTocCache('./cache')
+            self._cf = Crazyflie(rw_cache=toc_cache.directory)
+            toc_cache.attach(self._cf)
 
         # Initialize the callbacks
         self._cf.connected.add_callback(self._connected)
         self._cf.disconnected.add_callback(self._disconnected)
         self._cf.connection_failed.add_callback(self._connection_failed)
         self._cf.connection_lost.add_callback(self._connection_lost)
+        self._cf.param.all_updated.add_callback(self._params_updated.set)
 
         # Initialize events
         self.drone_lost = Caller()
+        # Called with the drone and the status fields which were updated by the telemetry
+        self.telemetry_updated = Caller()
+        self.history = TelemetryHistory()
+        # Incremented whenever the status changed, the serialized status is cached per version
+        self.status_version: int = 0
+        self._status_json = (-1, None)
+        self._version_lock = threading.Lock()
 
         # Define the log configuration
-        self._log_config_1 = LogConfig(name='DroneLog_1', period_in_ms=500)
-        self._log_config_1.add_variable('kalman.varPX', 'float')
-        self._log_config_1.add_variable('kalman.varPY', 'float')
-        self._log_config_1.add_variable('kalman.varPZ', 'float')
-        self._log_config_1.add_variable('pm.vbat', 'float')
-        self._log_config_2 = LogConfig(name='DroneLog_2', period_in_ms=100)
-        self._log_config_2.add_variable('kalman.stateX', 'float')
-        self._log_config_2.add_variable('kalman.stateY', 'float')
-        self._log_config_2.add_variable('kalman.stateZ', 'float')
-        self._log_config_3 = LogConfig(name='DroneLog_3', period_in_ms=500)
-        self._log_config_3.add_variable('stabilizer.pitch', 'float')
-        self._log_config_3.add_variable('stabilizer.roll', 'float')
-        self._log_config_3.add_variable('stabilizer.yaw', 'float')
-
-    def connect(self, synchronous: bool = False):
-        """Connects to the Crazyflie."""
+        self.telemetry_profile: TelemetryProfile = telemetry_profile if telemetry_profile is not None else standard_profile
+        self._log_configs: List[LogConfig] = self.telemetry_profile.create_log_configs()
+
+    def connect(self, synchronous: bool = False) -> bool:
+        """Connects to the Crazyflie, a synchronous connect gives up and closes the link after the connect timeout.
+
+        Returns:
+            bool -- False if a synchronous connect timed out, True otherwise.
+        """
+
         self._connect_crazyflie()
-        if synchronous:
-            self._connect_event.wait()
+        if synchronous and not self._connect_event.wait(self._connect_timeout):
+            print('Connection to %s timed out' % self.link_uri)
+            self._cf.close_link()
+            return False
+        return True
 
     def disconnect(self):
         """Disconnects from the Crazyflie and stops all logging."""
+        self.jobs.cancel()
+        self._cancel_waypoints()
         self._disconnect_crazyflie()
 
     def enable_high_level_commander(self):
         """Enables the drones high level commander."""
-        self._cf.param.set_value('commander.enHighLevel', '1')
-        time.sleep(0.1)
+        self._set_param('commander.enHighLevel', '1')
 
     def disable_motion_tracking(self):
         """Disables to motion control (x/y) from the flow-deck."""
-        self._cf.param.set_value('motion.disable', '1')
-        time.sleep(0.1)
+        self._set_param('motion.disable', '1')
 
-    def get_status(self) -> str:
-        """Gets various information of the drone."""
-        return {
+    def get_status(self, extrapolated: bool = False) -> str:
+        """Gets various information of the drone.
+
+        The position is the latest sample, received at position_time (on the clock of the drone) and taken at
+        position_timestamp (on the clock of the Crazyflie). An extrapolated status contains the age of the
+        sample and the position extrapolated to now instead."""
+        status = {
             "id": self.id,
             "var_x": self.var_x,
             "var_y": self.var_y,
@@ -114,66 +206,328 @@ class Drone:
             "yaw": self.yaw,
             "status": self.status.name,
             "battery_voltage": self.battery_voltage,
-            "battery_percentage:": (self.battery_voltage - 3.4) / (4.18 - 3.4) * 100
+            "battery_percentage:": self._battery_percentage(),
+            "position_time": self.position_time,
+            "position_timestamp": self.position_timestamp
         }
-
-    def reset_estimator(self) -> bool:
-        """Resets the position estimates."""
-        self._cf.param.set_value('kalman.resetEstimation', '1')
-        time.sleep(0.1)
-        self._cf.param.set_value('kalman.resetEstimation', '0')
-        time.sleep(2.0)
-        # TODO: wait_for_position_estimator(cf)
-        return True
+        if extrapolated:
+            status["x"], status["y"], status["z"] = self.get_position(extrapolated=True)
+            status["position_age"] = self.get_position_age()
+            status["extrapolated"] = True
+        return status
+
+    def get_position(self, extrapolated: bool = False) -> list:
+        """Gets the position of the drone in the coordinates of the arena.
+
+        Arguments:
+            extrapolated {bool} -- Extrapolate the latest sample to now with the velocity of the latest samples,
+                                   at most until the end of the current flight segment and for a limited time.
+        """
+
+        position = np.array([self.pos_x, self.pos_y, self.pos_z])
+        if extrapolated and self.position_time is not None:
+            now = self._clock.time()
+            horizon = min(now - self.position_time, self._max_extrapolation)
+            if self._segment is None or self._segment[3] < now:
+                # The drone does not move after its segment ended
+                horizon = min(horizon, self._segment[3] - self.position_time) if self._segment is not None else 0.0
+            position += self._velocity * max(horizon, 0.0)
+        return [self._arena.transform_x_inverse(float(position[0])), self._arena.transform_y_inverse(float(position[1])), float(position[2])]
+
+    def get_position_age(self) -> float:
+        """Gets the time since the latest position sample was received in seconds, None without a sample."""
+        if self.position_time is None:
+            return None
+        return self._clock.time() - self.position_time
+
+    def get_status_json(self) -> str:
+        """Gets the status serialized as JSON, it is only serialized again after it changed."""
+        version, status_json = self._status_json
+        if version != self.status_version:
+            version = self.status_version
+            status_json = json.dumps(self.get_status())
+            self._status_json = (version, status_json)
+        return status_json
+
+    def reset_estimator(self) -> float:
+        """Resets the position estimates and waits for the estimator to converge.
+
+        The estimator converged when the position variance of the last samples stayed below the threshold.
+        Returns the time needed to converge in seconds or None if the estimator did not converge before the timeout."""
+        started = self._clock.time()
+        # Stream the variance faster while waiting
+        self._calibrating = True
+        self._apply_log_periods()
+        try:
+            self._set_param('kalman.resetEstimation', '1')
+            self._set_param('kalman.resetEstimation', '0')
+            # Only samples after the reset count
+            self._variance_history.clear()
+            while self._clock.time() - started < self._estimator_timeout:
+                if len(self._variance_history) == self._estimator_window and max(self._variance_history) < self._estimator_threshold:
+                    return self._clock.time() - started
+                self._clock.sleep(self._estimator_poll_interval)
+            print('Position estimator of %s did not converge' % self.id)
+            return None
+        finally:
+            self._calibrating = False
+            self._apply_log_periods()
 
     def takeoff(self, absolute_height: float, velocity: float, synchronous: bool = False) -> float:
+        """Takes off after the estimator converged, returns None if it did not converge."""
         absolute_height = self._sanitize_z(absolute_height, False)
-        self.reset_estimator()
+        self._cancel_waypoints()
+        convergence_time = self.reset_estimator()
+        if convergence_time is None:
+            return None
         duration = self._convert_velocity_to_time(absolute_height, velocity)
-        self._cf.high_level_commander.takeoff(absolute_height, duration)
-        self.status = DroneState.STARTING
+        self._send(Lane.COMMAND, self._cf.high_level_commander.takeoff, absolute_height, duration)
+        self._record_command('takeoff', [self.pos_x, self.pos_y, absolute_height], None, duration)
+        position = self.get_position()
+        self._reserve(position, position[:2] + [absolute_height], 0.0, duration)
+        self._set_status(DroneState.STARTING)
+        self._expect_arrival(duration, DroneState.HOVERING)
         if synchronous:
-            time.sleep(duration)
+            self._clock.sleep(duration)
         return {
             "duration": duration,
-            "target_z": absolute_height
+            "target_z": absolute_height,
+            "convergence_time": convergence_time
         }
 
     def land(self, absolute_height: float, velocity: float, synchronous: bool = False) -> float:
         absolute_height = self._sanitize_z(absolute_height, False)
+        self._cancel_waypoints()
         duration = self._convert_velocity_to_time(absolute_height, velocity)
-        self._cf.high_level_commander.land(absolute_height, duration)
-        self.status = DroneState.LANDING
+        self._send(Lane.EMERGENCY, self._cf.high_level_commander.land, absolute_height, duration)
+        self._record_command('land', [self.pos_x, self.pos_y, absolute_height], None, duration)
+        position = self.get_position()
+        self._reserve(position, position[:2] + [absolute_height], 0.0, duration)
+        self._set_status(DroneState.LANDING)
+        self._expect_arrival(duration, DroneState.IDLE)
         if synchronous:
-            time.sleep(duration)
+            self._clock.sleep(duration)
         return {
             "duration": duration,
             "target_z": absolute_height
         }
 
-    def go_to(self, x: float, y: float, z: float, yaw: float, velocity: float, relative: bool = False, synchronous: bool = False) -> float:
+    def go_to(self, x: float, y: float, z: float, yaw: float, velocity: float, relative: bool = False, synchronous: bool = False,
+              on_conflict: str = 'report') -> float:
+        """Flies to the given position after checking the flight against the other drones of the swarm.
+
+        Arguments:
+            on_conflict {str} -- What to do if another drone comes too close: 'report' flies anyway, 'delay' starts
+                                 the flight as soon as it is free and 'reject' does not fly at all.
+
+        Returns:
+            dict -- The planned flight with the conflicts, accepted is False if the flight was rejected.
+        """
+
+        self._cancel_waypoints()
+        plan = self.plan_go_to(x, y, z, yaw, velocity, relative)
+        result = {
+            "duration": plan["duration"],
+            "target_x": self._arena.transform_x_inverse(plan["x"]),
+            "target_y": self._arena.transform_y_inverse(plan["y"]),
+            "target_z": plan["z"],
+            "target_yaw": plan["yaw"],
+            "relative": relative,
+            "accepted": True,
+            "delay": 0.0,
+            "conflicts": []
+        }
+        if self.airspace is not None:
+            now = self.airspace.clock.time()
+            segment = (plan["start"], plan["end"], now, now + plan["duration"])
+            result["conflicts"] = self.airspace.conflicts(self.id, *segment, now)
+            if result["conflicts"] and on_conflict == 'delay':
+                delay = self.airspace.find_delay(self.id, *segment, now)
+                result["accepted"] = delay is not None
+                if delay is not None:
+                    result["delay"] = delay
+                    result["conflicts"] = []
+            elif result["conflicts"] and on_conflict == 'reject':
+                result["accepted"] = False
+        if not result["accepted"]:
+            return result
+        if result["delay"] > 0:
+            self._reserve(plan["start"], plan["end"], result["delay"], plan["duration"])
+            self._waypoint_timers.append(self._clock.call_later(result["delay"], functools.partial(self._send_go_to, plan)))
+        else:
+            self._send_go_to(plan)
+        self._expect_arrival(result["delay"] + plan["duration"], DroneState.HOVERING)
+        if synchronous:
+            self._clock.sleep(result["delay"] + plan["duration"])
+        return result
+
+    def plan_go_to(self, x: float, y: float, z: float, yaw: float, velocity: float, relative: bool = False) -> dict:
+        """Plans a go_to without flying it.
+
+        Returns:
+            dict -- The sanitized target (x, y, z in the coordinates of the drone), yaw, duration, relative flag
+                    and the start and end of the segment in the coordinates of the arena.
+        """
+
         x = self._sanitize_x(x, relative)
         y = self._sanitize_y(y, relative)
         z = self._sanitize_z(z, relative)
         yaw = self._sanitize_yaw(yaw)
         distance = self._calculate_distance(x, y, z, relative)
         duration = self._convert_velocity_to_time(distance, velocity)
-        self._cf.high_level_commander.go_to(x, y, z, yaw, duration, relative)
-        self.status = DroneState.NAVIGATING
-        if synchronous:
-            time.sleep(duration)
         return {
+            "x": x,
+            "y": y,
+            "z": z,
+            "yaw": yaw,
             "duration": duration,
-            "target_x": self._arena.transform_x_inverse(x),
-            "target_y": self._arena.transform_y_inverse(y),
-            "target_z": z,
-            "target_yaw": yaw,
-            "relative": relative
+            "relative": relative,
+            "start": self.get_position(),
+            "end": [self._arena.transform_x_inverse(x), self._arena.transform_y_inverse(y), z]
+        }
+
+    def go_to_waypoints(self, waypoints: List[List[float]], yaw: float, velocity: float) -> dict:
+        """Flies along the waypoints (x, y, z in the coordinates of the arena) with one go_to per leg.
+
+        The first leg starts right away, the following ones are started by timers when the previous leg is done."""
+        self._cancel_waypoints()
+        yaw = self._sanitize_yaw(yaw)
+        durations = self.estimate_waypoint_durations(waypoints, velocity)
+        self._fly_leg(waypoints[0], yaw, durations[0])
+        delay = durations[0]
+        for waypoint, duration in zip(waypoints[1:], durations[1:]):
+            self._waypoint_timers.append(self._clock.call_later(delay, functools.partial(self._fly_leg, waypoint, yaw, duration)))
+            delay += duration
+        self._expect_arrival(delay, DroneState.HOVERING)
+        return {
+            "duration": delay,
+            "durations": durations,
+            "waypoints": waypoints,
+            "target_yaw": yaw
+        }
+
+    def fly_mission(self, waypoints: List[List[float]], yaw: float, velocity: float) -> dict:
+        """Flies through the waypoints (x, y, z in the coordinates of the arena) without stopping in between.
+
+        The waypoints are fitted into polynomial pieces which are uploaded to the trajectory memory of the Crazyflie
+        at once, so the whole mission runs on the drone without further commands.
+
+        Returns:
+            dict -- The duration of the mission and its pieces, None if the mission could not be uploaded.
+        """
+
+        self._cancel_waypoints()
+        waypoints = [[self._sanitize_number(waypoint[0], self._arena.min_x, self._arena.max_x),
+                      self._sanitize_number(waypoint[1], self._arena.min_y, self._arena.max_y),
+                      self._sanitize_z(waypoint[2], False)] for waypoint in waypoints]
+        yaw = self._sanitize_yaw(yaw)
+        # The velocity is the mean velocity of each piece
+        durations = self.estimate_waypoint_durations(waypoints, velocity)
+        route = [self.get_position()] + waypoints
+        points = np.array(route)
+        points[:, 0] = self._arena.transform_x(points[:, 0])
+        points[:, 1] = self._arena.transform_y(points[:, 1])
+        # Turn the shorter way from the current yaw (in degrees) to the target yaw
+        current_yaw = math.radians(self.yaw)
+        target_yaw = current_yaw + (yaw - current_yaw + math.pi) % (2 * math.pi) - math.pi
+        yaws = np.full((len(points), 1), target_yaw)
+        yaws[0] = current_yaw
+        coefficients = fit_trajectory(np.hstack((points, yaws)), np.array(durations))
+        if not self._upload_trajectory(coefficients, durations):
+            return None
+        self._send(Lane.COMMAND, self._cf.high_level_commander.start_trajectory, self._mission_trajectory_id, 1.0, False)
+        self._record_command('mission', points[-1].tolist(), target_yaw, sum(durations))
+        # The smooth trajectory is announced as the straight legs between the waypoints
+        self._reserve_route(route, 0.0, durations)
+        self._set_status(DroneState.NAVIGATING)
+        self._expect_arrival(sum(durations), DroneState.HOVERING)
+        return {
+            "duration": sum(durations),
+            "durations": durations,
+            "waypoints": waypoints,
+            "target_yaw": yaw
         }
 
+    def estimate_waypoint_durations(self, waypoints: List[List[float]], velocity: float) -> List[float]:
+        """Estimates the duration of each leg from the current position along the waypoints."""
+        positions = [self.get_position()] + waypoints
+        return [self._convert_velocity_to_time(float(np.linalg.norm(np.subtract(end, start))), velocity) for start, end in zip(positions, positions[1:])]
+
     def stop(self):
-        self._cf.high_level_commander.stop()
-        self.status = DroneState.IDLE
+        """Stops the motors right away, the queued commands are cancelled."""
+        self.jobs.cancel()
+        self._cancel_waypoints()
+        self._send(Lane.EMERGENCY, self._cf.high_level_commander.stop)
+        self._record_command('stop', None, None, 0.0)
+        position = self.get_position()
+        self._reserve(position, position, 0.0, 0.0)
+        self._set_status(DroneState.IDLE)
+
+    def _fly_leg(self, waypoint: List[float], yaw: float, duration: float):
+        x = self._sanitize_x(waypoint[0], False)
+        y = self._sanitize_y(waypoint[1], False)
+        z = self._sanitize_z(waypoint[2], False)
+        self._send(Lane.COMMAND, self._cf.high_level_commander.go_to, x, y, z, yaw, duration, False)
+        self._record_command('go_to', [x, y, z], yaw, duration)
+        self._reserve(self.get_position(), [self._arena.transform_x_inverse(x), self._arena.transform_y_inverse(y), z], 0.0, duration)
+        self._set_status(DroneState.NAVIGATING)
+
+    def _upload_trajectory(self, coefficients: np.ndarray, durations: List[float]) -> bool:
+        """Uploads the pieces of a trajectory to the trajectory memory and defines it as the mission trajectory."""
+        memories = self._cf.mem.get_mems(MemoryElement.TYPE_TRAJ)
+        if len(memories) == 0:
+            print('%s has no trajectory memory' % self.id)
+            return False
+        trajectory_memory = memories[0]
+        size = len(durations) * self._trajectory_piece_size
+        if size > trajectory_memory.size:
+            print('The trajectory for %s does not fit into its memory' % self.id)
+            return False
+        trajectory_memory.poly4Ds = [Poly4D(duration, *[Poly4D.Poly(axis.tolist()) for axis in piece]) for piece, duration in zip(coefficients, durations)]
+        # The memory is written in bulk by cflib, the radio only accounts for it
+        self.radio.record_sent(self, -(-size // self._memory_write_chunk), size)
+        written = threading.Event()
+        trajectory_memory.write_data(lambda memory, address: written.set())
+        if not written.wait(self._memory_write_timeout):
+            print('Upload of the trajectory to %s failed' % self.id)
+            return False
+        self._send(Lane.COMMAND, self._cf.high_level_commander.define_trajectory, self._mission_trajectory_id, 0, len(durations))
+        return True
+
+    def _send_go_to(self, plan: dict):
+        self._send(Lane.COMMAND, self._cf.high_level_commander.go_to, plan["x"], plan["y"], plan["z"], plan["yaw"], plan["duration"], plan["relative"])
+        target = [plan["x"], plan["y"], plan["z"]]
+        if plan["relative"]:
+            target = [self.pos_x + plan["x"], self.pos_y + plan["y"], self.pos_z + plan["z"]]
+        self._record_command('go_to', target, plan["yaw"], plan["duration"])
+        self._reserve(plan["start"], plan["end"], 0.0, plan["duration"])
+        self._set_status(DroneState.NAVIGATING)
+
+    def _reserve(self, start: List[float], end: List[float], delay: float, duration: float):
+        """Announces the segment the drone flies from now on to the airspace of the swarm."""
+        self._reserve_route([start, end], delay, [duration])
+
+    def _reserve_route(self, waypoints: List[List[float]], delay: float, durations: List[float]):
+        """Announces the route along the waypoints the drone flies from now on to the airspace of the swarm."""
+        start_time = self._clock.time() + delay
+        self._segment = (waypoints[0], waypoints[-1], start_time, start_time + sum(durations))
+        if self.airspace is not None:
+            # The airspace compares the drones of the swarm on the clock of the swarm instead of the one of the drone
+            times = self.airspace.clock.time() + delay + np.cumsum([0.0] + list(durations))
+            self.airspace.update_route(self.id, waypoints, times.tolist())
+
+    def _expect_arrival(self, seconds: float, status: DroneState):
+        """Changes the status when the drone arrived, unless another command came first."""
+        self._waypoint_timers.append(self._clock.call_later(seconds, functools.partial(self._arrive, status)))
+
+    def _arrive(self, status: DroneState):
+        if self.is_connected:
+            self._set_status(status)
+
+    def _cancel_waypoints(self):
+        for timer in self._waypoint_timers:
+            timer.cancel()
+        self._waypoint_timers = []
 
     def _connect_crazyflie(self):
         print('Connecting to %s' % self.link_uri)
@@ -182,39 +536,49 @@ class Drone:
     def _disconnect_crazyflie(self):
         print('Disconnecting from %s' % self.link_uri)
         # Stop the loggers
-        self._log_config_1.stop()
-        self._log_config_2.stop()
-        self._log_config_3.stop()
+        for logconf in self._log_configs:
+            self._send(Lane.BACKGROUND, logconf.stop)
         # Shutdown the rotors
         self._shutdown()
         # Disconnect
         self._cf.close_link()
+        self._release_telemetry()
+        self.radio.remove_link(self)
 
     def _connected(self, link_uri):
         """This callback is called when the Crazyflie has been connected and the TOCs have been downloaded."""
         print('Connected to %s' % link_uri)
+        # cflib requests the values of all parameters right after this callback
+        self._params_updated.clear()
+        # The callback runs on the thread of the link which also delivers the confirmations of parameter writes
+        threading.Thread(target=self._setup, name='Setup ' + self.id, daemon=True).start()
+
+    def _setup(self):
+        """Sets the parameters and starts the logging of a connected Crazyflie."""
+        if not self._params_updated.wait(self._param_download_timeout):
+            print('The parameters of %s were not downloaded in time' % self.id)
         # Setup parameters
         self.disable_motion_tracking()
-        # Add the logger
-        self._cf.log.add_config(self._log_config_1)
-        self._cf.log.add_config(self._log_config_2)
-        self._cf.log.add_config(self._log_config_3)
-        # This callback will receive the data
-        self._log_config_1.data_received_cb.add_callback(self._log_config_1_data)
-        self._log_config_2.data_received_cb.add_callback(self._log_config_2_data)
-        self._log_config_3.data_received_cb.add_callback(self._log_config_3_data)
-        # This callback will be called on errors
-        self._log_config_1.error_cb.add_callback(self._log_config_error)
-        self._log_config_2.error_cb.add_callback(self._log_config_error)
-        self._log_config_3.error_cb.add_callback(self._log_config_error)
+        # Log with the periods of a drone on the ground from the start
+        self.radio.telemetry_scale_changed.add_callback(self._telemetry_scale_changed)
+        self._apply_log_periods(DroneState.IDLE)
+        for logconf in self._log_configs:
+            # Add the logger
+            self._cf.log.add_config(logconf)
+            # This callback will receive the data
+            logconf.data_received_cb.add_callback(self._log_data)
+            # This callback will be called on errors
+            logconf.error_cb.add_callback(self._log_config_error)
         # Start the logging
-        self._log_config_1.start()
-        self._log_config_2.start()
-        self._log_config_3.start()
+        for logconf in self._log_configs:
+            self._send(Lane.BACKGROUND, logconf.start)
+        if not self._cf.is_connected():
+            # The connect timed out and closed the link meanwhile
+            return
         # Set the connected event
         self._connect_event.set()
         self.is_connected = True
-        self.status = DroneState.IDLE
+        self._set_status(DroneState.IDLE)
 
     def _connection_failed(self, link_uri, msg):
         """Callback when the initial connection fails."""
@@ -226,54 +590,169 @@ class Drone:
         """Callback when the Crazyflie is disconnected."""
         print('Disconnected from %s' % link_uri)
         self.is_connected = False
-        self.status = DroneState.OFFLINE
+        self._set_status(DroneState.OFFLINE)
 
     def _connection_lost(self, link_uri, msg):
         """Callback when the connection is lost after a connection has been made."""
         print('Connection to %s lost: %s' % (link_uri, msg))
+        self.jobs.cancel()
+        self._cancel_waypoints()
+        self._release_telemetry()
         self.drone_lost.call(self)
         self._connect_event.set()
         self.is_connected = False
-        self.status = DroneState.OFFLINE
+        self._set_status(DroneState.OFFLINE)
 
     def _log_config_error(self, logconf, msg):
         """Callback from the log API when an error occurs."""
         print('Error when logging %s: %s' % (logconf.name, msg))
 
-    def _log_config_1_data(self, timestamp, data, logconf):
-        """Callback from the log API when data arrives."""
-        self.var_x = data['kalman.varPX']
-        self.var_y = data['kalman.varPY']
-        self.var_z = data['kalman.varPZ']
-        self.battery_voltage = data['pm.vbat']
-
-    def _log_config_2_data(self, timestamp, data, logconf):
-        """Callback from the log API when data arrives."""
-        self.pos_x = data['kalman.stateX']
-        self.pos_y = data['kalman.stateY']
-        self.pos_z = data['kalman.stateZ']
-
-    def _log_config_3_data(self, timestamp, data, logconf):
-        self.pitch = data['stabilizer.pitch']
-        self.roll = data['stabilizer.roll']
-        self.yaw = data['stabilizer.yaw']
+    def _log_data(self, timestamp, data, logconf):
+        """Callback from the log API when data arrives, the telemetry profile decodes it to physical units."""
+        decoded = self.telemetry_profile.decode(logconf, data)
+        if self.recorder is not None:
+            self.recorder.record_telemetry(self.id, self._clock.time(), timestamp, decoded, self.status.value)
+        if "pos_x" in decoded:
+            self._update_velocity(timestamp, decoded)
+        for attribute, value in decoded.items():
+            setattr(self, attribute, value)
+        values = {}
+        if "var_x" in decoded:
+            self._variance_history.append(max(self.var_x, self.var_y, self.var_z))
+            values.update({"var_x": self.var_x, "var_y": self.var_y, "var_z": self.var_z})
+        if "battery_voltage" in decoded:
+            values.update({"battery_voltage": self.battery_voltage, "battery_percentage:": self._battery_percentage()})
+        if "pos_x" in decoded:
+            values.update({"x": self._arena.transform_x_inverse(self.pos_x), "y": self._arena.transform_y_inverse(self.pos_y), "z": self.pos_z})
+        if "pitch" in decoded:
+            values.update({"pitch": self.pitch, "roll": self.roll, "yaw": self.yaw})
+        values["status"] = self.status.name
+        self._telemetry_received(timestamp, values, logconf)
+
+    def _update_velocity(self, timestamp: int, decoded: dict):
+        """Estimates the velocity from the previous and the new position sample and remembers when it was taken."""
+        if self.position_timestamp is not None and 0 < timestamp - self.position_timestamp < 1000:
+            elapsed = (timestamp - self.position_timestamp) / 1000.0
+            self._velocity = np.array([decoded["pos_x"] - self.pos_x, decoded["pos_y"] - self.pos_y, decoded["pos_z"] - self.pos_z]) / elapsed
+        else:
+            self._velocity = np.zeros(3)
+        self.position_timestamp = timestamp
+        self.position_time = self._clock.time()
+
+    def _telemetry_received(self, timestamp: int, values: dict, logconf: LogConfig = None):
+        """Records the updated status fields and announces them."""
+        if logconf is not None:
+            self.radio.record_received(self, 1, self._log_packet_size(logconf))
+        self.history.record(self._clock.time(), timestamp, values)
+        self._changed()
+        self.telemetry_updated.call(self, values)
+
+    def _send(self, lane: Lane, function, *args):
+        """Sends to the Crazyflie, the scheduler of the radio accounts the traffic."""
+        return self.radio.send(self, lane, function, *args)
+
+    def _set_param(self, complete_name: str, value: str) -> bool:
+        """Writes a parameter and waits until the Crazyflie confirmed the new value.
+
+        Returns True if the write was confirmed before the timeout."""
+        group, name = complete_name.split('.', 1)
+        confirmed = threading.Event()
+
+        def updated(_, new_value):
+            confirmed.set()
+
+        self._cf.param.add_update_callback(group=group, name=name, cb=updated)
+        try:
+            self._send(Lane.BACKGROUND, self._cf.param.set_value, complete_name, value)
+            if not confirmed.wait(self._param_timeout):
+                print('Parameter %s of %s was not confirmed' % (complete_name, self.id))
+                return False
+            return True
+        finally:
+            self._cf.param.remove_update_callback(group=group, name=name, cb=updated)
+
+    def _record_command(self, command: str, target: List[float], yaw: float, duration: float):
+        """Records a command sent to the Crazyflie with its target in the coordinates of the drone."""
+        if self.recorder is not None:
+            self.recorder.record_command(self.id, self._clock.time(), command, target, yaw, duration, self.status.value)
+
+    def _log_packet_size(self, logconf: LogConfig) -> int:
+        # Header, block id and timestamp followed by the values
+        return 5 + sum([LogTocElement.get_size_from_id(variable.fetch_as) for variable in logconf.variables])
+
+    def _set_status(self, status: DroneState):
+        if status == self.status:
+            return
+        self.status = status
+        self._changed()
+        self.telemetry_updated.call(self, {"status": status.name})
+        if self.is_connected:
+            self._apply_log_periods()
+
+    def _changed(self):
+        # Telemetry and commands change the status on different threads
+        with self._version_lock:
+            self.status_version += 1
+
+    def _battery_percentage(self) -> float:
+        return (self.battery_voltage - 3.4) / (4.18 - 3.4) * 100
+
+    def _apply_log_periods(self, status: DroneState = None):
+        """Requests the telemetry of the state (default the current one) from the radio and sets the log periods."""
+        periods = self.log_periods.get(status if status is not None else self.status)
+        if periods is None:
+            return
+        rate_classes = [self.telemetry_profile.get_rate_class(logconf) for logconf in self._log_configs]
+        scale = self.radio.request_telemetry(self, sum([1000.0 / periods[rate_class] for rate_class in rate_classes]))
+        self._set_log_periods(periods, scale)
+
+    def _set_log_periods(self, periods: List[int], scale: float):
+        for logconf in self._log_configs:
+            rate_class = self.telemetry_profile.get_rate_class(logconf)
+            # Periods are sent in units of 10 ms in a single byte
+            period = min(max(int(round(periods[rate_class] * scale / 10.0)) * 10, 10), 2550)
+            if rate_class == 0 and self._calibrating:
+                period = min(period, self._estimator_log_period)
+            self._set_log_period(logconf, period)
+
+    def _telemetry_scale_changed(self, scale: float):
+        periods = self.log_periods.get(self.status)
+        if periods is not None and self.is_connected:
+            self._set_log_periods(periods, scale)
+
+    def _release_telemetry(self):
+        if self._telemetry_scale_changed in self.radio.telemetry_scale_changed.callbacks:
+            self.radio.telemetry_scale_changed.remove_callback(self._telemetry_scale_changed)
+        self.radio.request_telemetry(self, 0)
+
+    def _set_log_period(self, logconf: LogConfig, period_in_ms: int):
+        """Changes the period of a log configuration, a started configuration is restarted with the new period."""
+        if logconf.period_in_ms == period_in_ms:
+            return
+        started = self.is_connected
+        if started:
+            self._send(Lane.BACKGROUND, logconf.stop)
+        logconf.period_in_ms = period_in_ms
+        logconf.period = int(period_in_ms / 10)
+        if started:
+            self._send(Lane.BACKGROUND, logconf.start)
 
     def _unlock(self):
         # Unlock startup thrust protection (only needed for low lewel commands)
-        self._cf.commander.send_setpoint(0, 0, 0, 0)
+        self._send(Lane.COMMAND, self._cf.commander.send_setpoint, 0, 0, 0, 0)
 
     def _shutdown(self):
-        self._cf.commander.send_setpoint(0, 0, 0, 0)
+        self._send(Lane.EMERGENCY, self._cf.commander.send_setpoint, 0, 0, 0, 0)
         # Make sure that the last packet leaves before the link is closed
         # since the message queue is not flushed before closing
-        time.sleep(0.1)
+        self._clock.sleep(0.1)
 
     def _keep_setpoint(self, roll, pitch, yawrate, thrust, keeptime):
         """Keeps the drone at the given setpoint for the given amount of time."""
         while keeptime > 0:
-            self._cf.commander.send_setpoint(roll, pitch, yawrate, thrust)
+            self._send(Lane.COMMAND, self._cf.commander.send_setpoint, roll, pitch, yawrate, thrust)
             keeptime -= 0.1
-            time.sleep(0.1)
+            self._clock.sleep(0.1)
 
     def _convert_velocity_to_time(self, distance: float, velocity: float) -> float:
         """Converts a distance and a velocity to a time."""
@@ -0,0 +1,304 @@
+from typing import Dict, List
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Values of the telemetry in the units and coordinates of the drone, the columns of command rows hold the target
+telemetry_fields: List[str] = ['pos_x', 'pos_y', 'pos_z', 'var_x', 'var_y', 'var_z', 'pitch', 'roll', 'yaw', 'battery_voltage']
+
+# Commands are stored as their index + 1, 0 means no command
+commands: List[str] = ['takeoff', 'land', 'go_to', 'mission', 'stop']
+
+# Rows are telemetry samples or commands, 0 marks the unused rows at the end of the last chunk
+TELEMETRY = 1
+COMMAND = 2
+
+columns: List[tuple] = ([('time', '<f8'), ('timestamp', '<i8'), ('drone', '<u2'), ('kind', 'u1'), ('status', 'u1'), ('command', 'u1')] +
+                        [(name, '<f4') for name in telemetry_fields] + [('duration', '<f4')])
+
+
+def chunk_dtype(rows: int) -> np.dtype:
+    """Gets the type of a chunk, every column of the chunk is stored contiguously."""
+    return np.dtype([(name, dtype, (rows,)) for name, dtype in columns])
+
+
+class FlightRecorder:
+    """Records the telemetry and the commands of the drones of a swarm into a columnar file.
+
+    The file is a sequence of chunks of a fixed number of rows, within a chunk every column is contiguous. The file
+    grows by several chunks at once which are memory-mapped together, rows are written into the current chunk
+    directly. The schema, the drone ids and the number of rows are kept in a JSON file next to it, which a background
+    thread rewrites periodically and close writes a last time, so recording a row never touches the file system.
+    Telemetry rows hold the values of one log block, the values of the other blocks are NaN. Command rows hold the
+    target and the duration.
+    """
+
+    def __init__(self, directory: str, swarm_id: str, session: str = None, chunk_rows: int = 4096, grow_chunks: int = 8,
+                 schema_interval: float = 1.0):
+        """Creates the files of a new session and starts writing its schema.
+
+        Arguments:
+            directory {str} -- The directory of the recordings, it is created if needed.
+            swarm_id {str} -- The id of the recorded swarm.
+            session {str} -- The name of the session, by default the current date and time.
+            chunk_rows {int} -- The number of rows of a chunk.
+            grow_chunks {int} -- The number of chunks the file grows by when it is full.
+            schema_interval {float} -- The interval in seconds in which a changed schema is written.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.swarm_id: str = swarm_id
+        self.session: str = session if session is not None else time.strftime('%Y%m%d-%H%M%S')
+        self.path: str = os.path.join(directory, '%s_%s.flight' % (swarm_id, self.session))
+        self.chunk_rows: int = chunk_rows
+        self.grow_chunks: int = grow_chunks
+        self.schema_interval: float = schema_interval
+        self.rows: int = 0
+        self.drones: List[str] = []
+        self._drone_indices: Dict[str, int] = {}
+        self._started: float = time.time()
+        self._dtype = chunk_dtype(chunk_rows)
+        # The mapped chunks and the index of the first of them in the file
+        self._chunks = None
+        self._first_chunk: int = 0
+        self._columns: Dict[str, np.ndarray] = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._written_schema = None
+        open(self.path, 'wb').close()
+        self._write_schema(self._get_schema())
+        self._closing = threading.Event()
+        self._schema_writer = threading.Thread(target=self._write_schemas, name='Flight recorder ' + swarm_id, daemon=True)
+        self._schema_writer.start()
+
+    def record_telemetry(self, drone_id: str, receive_time: float, timestamp: int, values: Dict[str, float], status: int):
+        """Records the decoded values of a log block.
+
+        Arguments:
+            drone_id {str} -- The id of the drone.
+            receive_time {float} -- The time the block was received on the clock of the drone.
+            timestamp {int} -- The timestamp of the Crazyflie in ms.
+            values {Dict[str, float]} -- The values by their attribute of the drone.
+            status {int} -- The value of the state of the drone.
+        """
+
+        with self._lock:
+            index = self._next_row(drone_id)
+            if index is None:
+                return
+            self._columns['time'][index] = receive_time
+            self._columns['timestamp'][index] = timestamp
+            self._columns['status'][index] = status
+            for name, value in values.items():
+                self._columns[name][index] = value
+            self._columns['kind'][index] = TELEMETRY
+
+    def record_command(self, drone_id: str, command_time: float, command: str, target: List[float], yaw: float, duration: float, status: int):
+        """Records a command sent to a drone.
+
+        Arguments:
+            drone_id {str} -- The id of the drone.
+            command_time {float} -- The time the command was sent on the clock of the drone.
+            command {str} -- The name of the command.
+            target {List[float]} -- The target position in the coordinates of the drone, None if there is none.
+            yaw {float} -- The target yaw, None if there is none.
+            duration {float} -- The duration of the command in seconds.
+            status {int} -- The value of the state of the drone.
+        """
+
+        with self._lock:
+            index = self._next_row(drone_id)
+            if index is None:
+                return
+            self._columns['time'][index] = command_time
+            self._columns['status'][index] = status
+            self._columns['command'][index] = commands.index(command) + 1
+            if target is not None:
+                self._columns['pos_x'][index], self._columns['pos_y'][index], self._columns['pos_z'][index] = target
+            if yaw is not None:
+                self._columns['yaw'][index] = yaw
+            self._columns['duration'][index] = duration
+            self._columns['kind'][index] = COMMAND
+
+    def close(self):
+        """Writes the mapped chunks and the schema and cuts off the unused chunks, later rows are dropped."""
+        self._closing.set()
+        self._schema_writer.join()
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._chunks is not None:
+                self._chunks.flush()
+                self._chunks = None
+                self._columns = {}
+            with open(self.path, 'r+b') as recording:
+                recording.truncate(-(-self.rows // self.chunk_rows) * self._dtype.itemsize)
+            schema = self._get_schema()
+        self._write_schema(schema)
+
+    def _next_row(self, drone_id: str) -> int:
+        """Gets the index of the next row in the current chunk, the next chunk is started when it is full."""
+        if self._closed:
+            return None
+        if drone_id not in self._drone_indices:
+            # The drone is added to the schema file by the next periodic write
+            self._drone_indices[drone_id] = len(self.drones)
+            self.drones.append(drone_id)
+        index = self.rows % self.chunk_rows
+        if index == 0:
+            self._add_chunk()
+        self.rows += 1
+        self._columns['drone'][index] = self._drone_indices[drone_id]
+        return index
+
+    def _add_chunk(self):
+        chunk = self.rows // self.chunk_rows
+        if self._chunks is None or chunk >= self._first_chunk + self.grow_chunks:
+            # The file is only resized and mapped again when all of its chunks are used
+            if self._chunks is not None:
+                self._chunks.flush()
+            with open(self.path, 'r+b') as recording:
+                recording.truncate((chunk + self.grow_chunks) * self._dtype.itemsize)
+            self._chunks = np.memmap(self.path, dtype=self._dtype, mode='r+', offset=chunk * self._dtype.itemsize, shape=(self.grow_chunks,))
+            self._first_chunk = chunk
+        self._columns = {name: self._chunks[name][chunk - self._first_chunk] for name, _ in columns}
+        # Only the rows which are written get values, all others are missing
+        for name in telemetry_fields + ['duration']:
+            self._columns[name][:] = np.nan
+
+    def _write_schemas(self):
+        while not self._closing.wait(self.schema_interval):
+            with self._lock:
+                schema = self._get_schema()
+            if schema != self._written_schema:
+                self._write_schema(schema)
+
+    def _get_schema(self) -> dict:
+        return {
+            'swarm_id': self.swarm_id,
+            'session': self.session,
+            'started': self._started,
+            'chunk_rows': self.chunk_rows,
+            'columns': columns,
+            'commands': commands,
+            'drones': list(self.drones),
+            'rows': self.rows
+        }
+
+    def _write_schema(self, schema: dict):
+        # The schema is replaced at once, so a session opened meanwhile never reads half of it
+        with open(self.path + '.json.tmp', 'w') as schema_file:
+            json.dump(schema, schema_file)
+        os.replace(self.path + '.json.tmp', self.path + '.json')
+        self._written_schema = schema
+
+
+class FlightSession:
+    """A recorded session, the file is memory-mapped read-only and only the columns which are used are read.
+
+    A session which is still recorded (or whose recorder crashed) may have rows of drones which are not in its schema
+    yet, these rows are skipped.
+    """
+
+    def __init__(self, path: str):
+        """Maps the recording.
+
+        Arguments:
+            path {str} -- The .flight file of the session.
+        """
+
+        with open(path + '.json') as schema_file:
+            schema = json.load(schema_file)
+        self.path: str = path
+        self.swarm_id: str = schema['swarm_id']
+        self.session: str = schema['session']
+        self.started: float = schema['started']
+        self.drones: List[str] = schema['drones']
+        self.commands: List[str] = schema['commands']
+        self.chunk_rows: int = schema['chunk_rows']
+        dtype = np.dtype([(name, dtype, (schema['chunk_rows'],)) for name, dtype in schema['columns']])
+        chunks = os.path.getsize(path) // dtype.itemsize
+        self._chunks = np.memmap(path, dtype=dtype, mode='r', shape=(chunks,)) if chunks > 0 else np.zeros(0, dtype=dtype)
+        # The rows in the schema may be behind after a crash, the unused rows and chunks at the end have no kind
+        self.rows: int = 0
+        while chunks > 0:
+            used = np.flatnonzero(self._chunks['kind'][chunks - 1])
+            if len(used) > 0:
+                self.rows = (chunks - 1) * self.chunk_rows + int(used[-1]) + 1
+                break
+            chunks -= 1
+        self._chunks = self._chunks[:chunks]
+        # Row indices within each chunk by drone and kind
+        self._selections: Dict[tuple, List[np.ndarray]] = {}
+
+    def column(self, name: str) -> np.ndarray:
+        """Gets a copy of a column of all rows, long sessions are better read chunk by chunk with chunks()."""
+        return np.concatenate([chunk[name] for chunk in self.chunks()] + [np.zeros(0, dtype=self._chunks.dtype[name].base)])
+
+    def chunks(self):
+        """Iterates over the chunks, each as the views on its columns."""
+        for index, rows in enumerate(self._chunk_rows()):
+            yield {name: self._chunks[name][index][:rows] for name in self._chunks.dtype.names}
+
+    def telemetry(self, drone_id: str) -> Dict[str, np.ndarray]:
+        """Gets the telemetry rows of a drone.
+
+        Returns:
+            Dict[str, np.ndarray] -- The time, timestamp, status and telemetry fields of each row of the drone.
+        """
+
+        rows = self._select(drone_id, TELEMETRY)
+        return {name: self._gather(name, rows) for name in ['time', 'timestamp', 'status'] + telemetry_fields}
+
+    def get_commands(self, drone_id: str = None) -> List[dict]:
+        """Gets the commands sent to a drone (all drones if None) in chronological order."""
+        rows = self._select(drone_id, COMMAND)
+        drones = self._gather('drone', rows)
+        names = self._gather('command', rows)
+        values = {name: self._gather(name, rows) for name in ['time', 'pos_x', 'pos_y', 'pos_z', 'yaw', 'duration']}
+        return [{
+            'drone_id': self.drones[drones[index]],
+            'command': self.commands[names[index] - 1],
+            'time': float(values['time'][index]),
+            'target': [float(values[name][index]) for name in ['pos_x', 'pos_y', 'pos_z']],
+            'yaw': float(values['yaw'][index]),
+            'duration': float(values['duration'][index])
+        } for index in range(len(drones))]
+
+    def _select(self, drone_id: str, kind: int) -> List[np.ndarray]:
+        """Gets the indices of the rows of a drone (all known drones if None) and a kind within each chunk.
+
+        The selection is cached, only the kind and drone columns of one chunk are read at a time.
+        """
+
+        key = (drone_id, kind)
+        if key not in self._selections:
+            kinds, drones = np.asarray(self._chunks['kind']), np.asarray(self._chunks['drone'])
+            self._selections[key] = [self._select_chunk(kinds[index, :rows], drones[index, :rows], drone_id, kind)
+                                     for index, rows in enumerate(self._chunk_rows())]
+        return self._selections[key]
+
+    def _select_chunk(self, kinds: np.ndarray, drones: np.ndarray, drone_id: str, kind: int) -> np.ndarray:
+        selected = kinds == kind
+        if drone_id is None:
+            # Drones which joined after the schema was written last are not known yet
+            selected &= drones < len(self.drones)
+        elif drone_id in self.drones:
+            selected &= drones == self.drones.index(drone_id)
+        else:
+            selected[:] = False
+        return np.flatnonzero(selected)
+
+    def _chunk_rows(self) -> List[int]:
+        """Gets the number of used rows of each chunk."""
+        return [min(self.rows - index * self.chunk_rows, self.chunk_rows) for index in range(len(self._chunks))]
+
+    def _gather(self, name: str, rows: List[np.ndarray]) -> np.ndarray:
+        """Copies the selected rows of a column, chunk by chunk."""
+        column = np.asarray(self._chunks[name])
+        return np.concatenate([column[index, indices] for index, indices in enumerate(rows) if len(indices) > 0] +
+                              [np.zeros(0, dtype=self._chunks.dtype[name].base)])
@@ -0,0 +1,211 @@
+from typing import Dict, List
+import functools
+import threading
+import time
+
+import numpy as np
+
+from cflib.utils.callbacks import Caller
+
+from .clock import Clock, VirtualClock
+from .flightrecorder import FlightSession, telemetry_fields
+from .simulation import _SimulatedParam, _fetch
+from .telemetryprofile import telemetry_profiles
+
+
+class ReplayEngine:
+    """Plays a recorded session back as the log data of stand-ins for Crazyflies.
+
+    It takes the place of a SimulationEngine: drones created with it receive the recorded telemetry at the recorded
+    pace, the commands they send are ignored. The drones get the recorded drones in the order they were recorded,
+    the playback starts when the first of them connects.
+    """
+
+    def __init__(self, session: FlightSession, clock: Clock = None, tick: float = 0.01):
+        """Initializes the playback.
+
+        Arguments:
+            session {FlightSession} -- The recorded session.
+            clock {Clock} -- The clock of the playback. With a VirtualClock the session plays as fast as it is advanced.
+            tick {float} -- The interval in seconds in which the due log data is sent.
+        """
+
+        self.session: FlightSession = session
+        self.clock: Clock = clock if clock is not None else Clock()
+        self.tick: float = tick
+        self._created: int = 0
+        self._crazyflies: List['ReplayCrazyflie'] = []
+        self._offset: float = None
+        self._thread = None
+        self._lock = threading.RLock()
+        # Log variables of all telemetry profiles with the attribute they are decoded to and its scale
+        self._variables: Dict[str, tuple] = {variable: (attribute, scale) for profile in telemetry_profiles.values()
+                                             for block in profile.blocks for variable, _, attribute, scale in block['variables']}
+        if isinstance(self.clock, VirtualClock):
+            self.clock.advanced.add_callback(self._clock_advanced)
+
+    def create_crazyflie(self, origin: List[float] = None) -> 'ReplayCrazyflie':
+        """Creates a stand-in for the next recorded drone, a drone beyond the recorded ones gets no data.
+
+        Arguments:
+            origin {List[float]} -- Unused, the drones are where they were recorded.
+
+        Returns:
+            ReplayCrazyflie -- A stand-in for cflib.crazyflie.Crazyflie.
+        """
+
+        with self._lock:
+            index = self._created
+            self._created += 1
+        drone_id = self.session.drones[index] if index < len(self.session.drones) else None
+        return ReplayCrazyflie(self, drone_id)
+
+    def time(self) -> float:
+        """Gets the time of the session which is played right now, None before the playback started."""
+        if self._offset is None:
+            return None
+        return self.clock.time() - self._offset
+
+    def step(self, now: float):
+        """Sends the log data recorded up to the given time of the session."""
+        samples = []
+        with self._lock:
+            for crazyflie in self._crazyflies:
+                samples.extend(crazyflie._due(now))
+        # Callbacks are called outside of the lock so they can safely send new commands
+        for logconf, timestamp, data in samples:
+            logconf.data_received_cb.call(timestamp, data, logconf)
+
+    def encode(self, logconf, values: Dict[str, float]) -> dict:
+        """Converts the values of the drone attributes to the log data of a configuration, like the Crazyflie sends it."""
+        data = {}
+        for variable in logconf.variables:
+            attribute, scale = self._variables.get(variable.name, (None, 1.0))
+            data[variable.name] = _fetch(variable.fetch_as, values.get(attribute, 0.0) / scale)
+        return data
+
+    def _add(self, crazyflie: 'ReplayCrazyflie'):
+        with self._lock:
+            if self._offset is None:
+                # The session plays from its first row on
+                first = next(self.session.chunks(), {'time': []})['time'][:1]
+                self._offset = self.clock.time() - (float(first[0]) if len(first) > 0 else 0.0)
+            self._crazyflies.append(crazyflie)
+            if self._thread is None and not isinstance(self.clock, VirtualClock):
+                self._thread = threading.Thread(target=self._run, name='ReplayEngine', daemon=True)
+                self._thread.start()
+        crazyflie._skip(self.time())
+
+    def _remove(self, crazyflie: 'ReplayCrazyflie'):
+        with self._lock:
+            if crazyflie in self._crazyflies:
+                self._crazyflies.remove(crazyflie)
+
+    def _reset_estimator(self, slot):
+        # The recorded variance shows the recorded resets
+        pass
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            self.step(self.time())
+
+    def _clock_advanced(self, now: float):
+        if self._offset is not None:
+            self.step(now - self._offset)
+
+
+class ReplayCrazyflie:
+    """Stand-in for cflib.crazyflie.Crazyflie which streams the telemetry of a recorded drone."""
+
+    def __init__(self, engine: ReplayEngine, drone_id: str):
+        self.drone_id: str = drone_id
+        self.link = None
+        self.link_uri: str = ''
+        self.connected = Caller()
+        self.disconnected = Caller()
+        self.connection_failed = Caller()
+        self.connection_lost = Caller()
+        self.param = _SimulatedParam(self)
+        self.log = _ReplayLog(self)
+        self.commander = _IgnoredCommander()
+        self.high_level_commander = _IgnoredCommander()
+        self.mem = _ReplayMemory()
+        self._engine = engine
+        self._slot = None
+        self._log_configs = {}
+        # The rows of the drone, the attributes which are not part of a row are NaN
+        telemetry = engine.session.telemetry(drone_id) if drone_id is not None else {name: np.zeros(0) for name in ['time', 'timestamp'] + telemetry_fields}
+        self._times: np.ndarray = telemetry['time']
+        self._timestamps: np.ndarray = telemetry['timestamp']
+        self._values: np.ndarray = np.column_stack([telemetry[name] for name in telemetry_fields])
+        self._latest: Dict[str, float] = {}
+        self._next: int = 0
+
+    def open_link(self, link_uri: str):
+        self.link_uri = link_uri
+        self._slot = 0
+        self._engine._add(self)
+        self.connected.call(link_uri)
+        self.param.all_updated.call()
+
+    def close_link(self):
+        if self._slot is None:
+            return
+        self._engine._remove(self)
+        self._slot = None
+        self._log_configs = {}
+        self.disconnected.call(self.link_uri)
+
+    def is_connected(self) -> bool:
+        return self._slot is not None
+
+    def _skip(self, now: float):
+        """Skips the rows before the given time, only their latest values are kept."""
+        end = int(np.searchsorted(self._times, now, side='right'))
+        for row in range(self._next, end):
+            self._update(row)
+        self._next = max(self._next, end)
+
+    def _due(self, now: float) -> list:
+        """Gets the log data of the rows up to the given time for every started configuration they are part of."""
+        end = int(np.searchsorted(self._times, now, side='right'))
+        samples = []
+        for row in range(self._next, end):
+            fields = self._update(row)
+            for logconf, started in list(self._log_configs.items()):
+                attributes = [self._engine._variables.get(variable.name, (None,))[0] for variable in logconf.variables]
+                if started and fields.intersection(attributes):
+                    samples.append((logconf, int(self._timestamps[row]), self._engine.encode(logconf, self._latest)))
+        self._next = max(self._next, end)
+        return samples
+
+    def _update(self, row: int) -> set:
+        values = self._values[row]
+        fields = {name for name, value in zip(telemetry_fields, values) if not np.isnan(value)}
+        self._latest.update({name: float(value) for name, value in zip(telemetry_fields, values) if name in fields})
+        return fields
+
+
+class _ReplayLog:
+    def __init__(self, crazyflie: ReplayCrazyflie):
+        self._cf = crazyflie
+
+    def add_config(self, logconf):
+        # Without a link LogConfig would not send anything, so starting and stopping only marks the configuration
+        logconf.cf = self._cf
+        logconf.start = functools.partial(self._cf._log_configs.__setitem__, logconf, True)
+        logconf.stop = functools.partial(self._cf._log_configs.__setitem__, logconf, False)
+        self._cf._log_configs[logconf] = False
+
+
+class _IgnoredCommander:
+    """Accepts every command, the replayed drone flies as it was recorded."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class _ReplayMemory:
+    def get_mems(self, type):
+        return ()
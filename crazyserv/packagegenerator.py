@@ -1,17 +1,23 @@
 import random
+import threading
 import numpy as np
 from .arena import Arena
+from .deliveryjournal import DeliveryJournal, read_journal
 from .deliverylogger import DeliveryLogger
 from .drone import Drone
 
 
 class PackageGenerator:
-    def __init__(self):
+    def __init__(self, journal: DeliveryJournal = None):
         self.coordinate_pool = self.define_coordinate_pool()
         self.pool_size = self.coordinate_pool.shape[0]
         self.package_weights = [0.5, 0.75, 1]
         self.rng = {}
         self.delivery_loggers = {}
+        # Packages are drawn one at a time, so the sequence of a seed does not depend on concurrent requests
+        self._lock = threading.Lock()
+        # Records the packages of all swarms, None to keep no journal
+        self.journal = journal
 
     def define_coordinate_pool(self):
         arena = Arena(0)
@@ -30,7 +36,42 @@ class PackageGenerator:
     def initialize_swarm(self, swarm_id, seed):
         self.rng[swarm_id] = random.Random()
         self.rng[swarm_id].seed(seed)
-        self.delivery_loggers[swarm_id] = DeliveryLogger()
+        self.delivery_loggers[swarm_id] = DeliveryLogger(swarm_id, self.journal)
+        if self.journal is not None:
+            self.journal.record(swarm_id, 'reset', seed=seed)
+        return True
+
+    def restore_swarm(self, swarm_id):
+        """Rebuilds the packages of a swarm from the journal, for example after the server crashed.
+
+        The pending packages, the loads of the drones and the scores are replayed from the events since the last reset
+        of the swarm and the generator continues where it stopped.
+
+        Arguments:
+            swarm_id {str} -- The id of the swarm.
+
+        Returns:
+            bool -- True if the swarm was restored, False if the journal has no events of the swarm.
+        """
+
+        if self.journal is None:
+            return False
+        # The events of a swarm which is still live may not be written yet
+        self.journal.flush()
+        events = read_journal(self.journal.path, swarm_id)
+        if not events:
+            return False
+        rng = random.Random()
+        rng.seed(events[0]['seed'])
+        delivery_logger = DeliveryLogger(swarm_id, self.journal)
+        for event in events:
+            if event['event'] == 'created':
+                # Skip the packages which were ordered already
+                self.draw_package(rng)
+            delivery_logger.apply(event)
+        with self._lock:
+            self.rng[swarm_id] = rng
+            self.delivery_loggers[swarm_id] = delivery_logger
         return True
 
     def generate_number(self, swarm_id, lower_limit, upper_limit):
@@ -40,19 +81,65 @@ class PackageGenerator:
         return self.rng[swarm_id].getrandbits(128)
 
     def get_package(self, swarm_id):
+        with self._lock:
+            return self._get_package(swarm_id)
+
+    def _get_package(self, swarm_id):
         if self.delivery_loggers[swarm_id].log_is_full(swarm_id):
             return None
 
-        rand = self.generate_number(swarm_id, 0, self.pool_size - 1)
-        weightIndex = self.generate_number(swarm_id, 0, len(self.package_weights)-1)
-        weight = self.package_weights[weightIndex]
-        id = self.generate_hash(swarm_id)
-
-        package = {'id': str(id), 'coordinates': self.coordinate_pool[rand].tolist(), 'weight': weight, 'drone': None, 'picked': False}
+        package = self.draw_package(self.rng[swarm_id])
 
         self.delivery_loggers[swarm_id].add_package(swarm_id, package)
         return package
 
+    def get_packages(self, swarm_id, count):
+        """Orders several packages at once, as many as fit into the pending packages.
+
+        Arguments:
+            swarm_id {str} -- The id of the swarm.
+            count {int} -- The number of packages to order at most.
+
+        Returns:
+            list -- The ordered packages, the same ones as ordering them one by one.
+        """
+
+        with self._lock:
+            packages = []
+            for _ in range(min(count, self.delivery_loggers[swarm_id].get_free_slots())):
+                packages.append(self._get_package(swarm_id))
+            return packages
+
+    def preview_packages(self, swarm_id, count):
+        """Gets the next packages without ordering them.
+
+        The packages are drawn from a copy of the generator, so they are exactly the packages the next orders return
+        while the seed is not reset.
+
+        Arguments:
+            swarm_id {str} -- The id of the swarm.
+            count {int} -- The number of packages to look ahead.
+
+        Returns:
+            list -- The next packages, which are neither pending nor used up.
+        """
+
+        with self._lock:
+            rng = random.Random()
+            rng.setstate(self.rng[swarm_id].getstate())
+        return [self.draw_package(rng) for _ in range(count)]
+
+    def draw_package(self, rng):
+        rand = rng.randint(0, self.pool_size - 1)
+        weightIndex = rng.randint(0, len(self.package_weights)-1)
+        weight = self.package_weights[weightIndex]
+        id = rng.getrandbits(128)
+
+        return {'id': str(id), 'coordinates': self.coordinate_pool[rand].tolist(), 'pad': rand, 'weight': weight, 'drone': None, 'picked': False}
+
+    def get_pending(self, swarm_id, pad=None, weight=None):
+        return self.delivery_loggers[swarm_id].get_pending(pad, weight)
+
     def pickup(self, swarm_id, package_id, drone: Drone):
         success = self.delivery_loggers[swarm_id].pickup(swarm_id, package_id, drone)
         return success
@@ -61,6 +148,12 @@ class PackageGenerator:
         success = self.delivery_loggers[swarm_id].deliver(swarm_id, package_id, drone)
         return success
 
+    def eligible_actions(self, swarm_id, drones, auto_deliver=False):
+        return self.delivery_loggers[swarm_id].eligible_actions(drones, auto_deliver)
+
+    def dispatch(self, swarm_id, drones, budget=0.05):
+        return self.delivery_loggers[swarm_id].dispatch(drones, budget)
+
     def print_deliveries(self, swarm_id):
         success = self.delivery_loggers[swarm_id].print_deliveries()
         return success
@@ -0,0 +1,108 @@
+from typing import List
+
+import numpy as np
+
+from .arena import Arena
+
+
+class PathPlanner:
+    """Plans paths around the buildings of an arena on a visibility graph.
+
+    The graph and the shortest paths between all of its nodes are computed once when the planner is created,
+    a query only has to connect the start and the goal to the graph.
+    """
+
+    def __init__(self, arena: Arena, clearance: float = 0.15):
+        """Builds the roadmap of the arena.
+
+        Arguments:
+            arena {Arena} -- The arena with its bounds and buildings.
+            clearance {float} -- The minimal distance between the center of a drone and a building.
+        """
+
+        self.arena_id: int = arena.arena_id
+        buildings = np.array(arena.buildings, dtype=float).reshape(-1, 3)[:, :2]
+        half_size = arena.building_size / 2 + clearance
+        self._lower = buildings - half_size
+        self._upper = buildings + half_size
+        self._min = np.array([arena.min_x, arena.min_y])
+        self._max = np.array([arena.max_x, arena.max_y])
+
+        # The nodes are the corners of the inflated buildings, pushed out a bit so that the sides are free
+        corners = np.array([[-1, -1], [-1, 1], [1, -1], [1, 1]]) * (half_size + 0.01)
+        nodes = (buildings[:, np.newaxis, :] + corners[np.newaxis, :, :]).reshape(-1, 2)
+        inside_arena = np.all((nodes >= self._min) & (nodes <= self._max), axis=1)
+        self.nodes = nodes[inside_arena & ~self._inside_building(nodes).any(axis=1)]
+
+        # Connect all nodes which see each other and compute the shortest paths between all of them
+        count = len(self.nodes)
+        first, second = np.triu_indices(count, 1)
+        visible = ~self._blocked(self.nodes[first], self.nodes[second], np.zeros((len(first), len(buildings)), dtype=bool))
+        self.distances = np.full((count, count), np.inf)
+        np.fill_diagonal(self.distances, 0.0)
+        lengths = np.linalg.norm(self.nodes[first] - self.nodes[second], axis=1)
+        self.distances[first[visible], second[visible]] = lengths[visible]
+        self.distances[second[visible], first[visible]] = lengths[visible]
+        self._next = np.tile(np.arange(count), (count, 1))
+        for k in range(count):
+            through_k = self.distances[:, k, np.newaxis] + self.distances[np.newaxis, k, :]
+            shorter = through_k < self.distances
+            self.distances = np.where(shorter, through_k, self.distances)
+            self._next = np.where(shorter, self._next[:, k, np.newaxis], self._next)
+
+    def plan(self, start: List[float], goal: List[float]) -> List[List[float]]:
+        """Finds the shortest path from start to goal which does not cross a building.
+
+        Arguments:
+            start {List[float]} -- The start position (x, y, z) in the coordinates of the arena.
+            goal {List[float]} -- The goal position (x, y, z) in the coordinates of the arena.
+
+        Returns:
+            List[List[float]] -- The waypoints after the start up to the goal, None if there is no path.
+                                 The waypoints between start and goal have the height of the goal.
+        """
+
+        start_xy = np.array(start[:2], dtype=float)
+        goal_xy = np.array(goal[:2], dtype=float)
+        # Buildings containing the start or the goal do not block, otherwise there would be no way out
+        ignored = self._inside_building(np.array([start_xy, goal_xy])).any(axis=0)
+        if not self._blocked(start_xy[np.newaxis], goal_xy[np.newaxis], ignored[np.newaxis])[0]:
+            return [list(goal)]
+        if len(self.nodes) == 0:
+            return None
+        ignored = np.tile(ignored, (len(self.nodes), 1))
+        from_start = np.where(self._blocked(np.tile(start_xy, (len(self.nodes), 1)), self.nodes, ignored), np.inf,
+                              np.linalg.norm(self.nodes - start_xy, axis=1))
+        to_goal = np.where(self._blocked(self.nodes, np.tile(goal_xy, (len(self.nodes), 1)), ignored), np.inf,
+                           np.linalg.norm(self.nodes - goal_xy, axis=1))
+        costs = from_start[:, np.newaxis] + self.distances + to_goal[np.newaxis, :]
+        first, last = np.unravel_index(np.argmin(costs), costs.shape)
+        if not np.isfinite(costs[first, last]):
+            return None
+        path = [first]
+        while path[-1] != last:
+            path.append(self._next[path[-1], last])
+        waypoints = [[float(self.nodes[node][0]), float(self.nodes[node][1]), float(goal[2])] for node in path]
+        waypoints.append(list(goal))
+        return waypoints
+
+    def _inside_building(self, points: np.ndarray) -> np.ndarray:
+        """Checks for all points (n x 2) whether they are inside the inflated buildings (n x m)."""
+        return np.all((points[:, np.newaxis, :] > self._lower[np.newaxis]) & (points[:, np.newaxis, :] < self._upper[np.newaxis]), axis=2)
+
+    def _blocked(self, starts: np.ndarray, ends: np.ndarray, ignored: np.ndarray) -> np.ndarray:
+        """Checks for all segments (n x 2 starts and ends) whether they cross a building which is not ignored (n x m)."""
+        origin = starts[:, np.newaxis, :]
+        direction = (ends - starts)[:, np.newaxis, :]
+        moving = direction != 0
+        safe_direction = np.where(moving, direction, 1.0)
+        # Slab test, an axis without movement either always or never overlaps
+        near = (self._lower[np.newaxis] - origin) / safe_direction
+        far = (self._upper[np.newaxis] - origin) / safe_direction
+        inside_slab = (origin > self._lower[np.newaxis]) & (origin < self._upper[np.newaxis])
+        entry = np.where(moving, np.minimum(near, far), np.where(inside_slab, -np.inf, np.inf))
+        exit = np.where(moving, np.maximum(near, far), np.where(inside_slab, np.inf, -np.inf))
+        entry = entry.max(axis=2)
+        exit = exit.min(axis=2)
+        crossing = (entry < exit) & (exit > 0) & (entry < 1)
+        return (crossing & ~ignored).any(axis=1)
@@ -0,0 +1,190 @@
+from enum import IntEnum
+from typing import Callable, Dict
+import math
+import threading
+import time
+
+from cflib.utils.callbacks import Caller
+
+from .clock import Clock
+
+
+class Lane(IntEnum):
+    """Kind of the traffic sent over a radio, the traffic is accounted per lane and emergencies hold the background."""
+    EMERGENCY = 0
+    COMMAND = 1
+    BACKGROUND = 2
+
+
+class RadioScheduler:
+    """Accounts the traffic of all links of a (real or simulated) radio and shares its telemetry budget.
+
+    Everything which sends packets to a drone of the radio goes through send, which calls cflib on the calling thread
+    and accounts the packets per drone and lane. Emergency commands (stop, land and the zero setpoint) take precedence
+    over the background traffic (log configurations and parameters) of all drones on the radio: while an emergency
+    command is sent and for a short hold afterwards, background sends wait, so the queues of the links do not grow
+    while the stop goes out. cflib queues the packets of a link itself and does not expose that queue, so a stop can
+    still not overtake packets which are already queued there. The received telemetry is accounted per drone as well
+    to estimate the utilisation of the radio.
+
+    The telemetry of all drones on the radio shares a budget, when the drones request more telemetry than the budget
+    allows all of them stretch their log periods by the same scale.
+    """
+
+    # Estimated number of packets per second a radio can transfer at each data rate
+    capacities: Dict[str, int] = {'250K': 250, '1M': 500, '2M': 1000}
+
+    def __init__(self, radio: str, data_rate: str = '2M', clock: Clock = None):
+        """Initializes the scheduler.
+
+        Arguments:
+            radio {str} -- The name of the radio, the scheme and radio id of its links (e.g. radio://0).
+            data_rate {str} -- The data rate of the links, it determines the capacity of the radio.
+            clock {Clock} -- The clock to measure rates with.
+        """
+
+        self.radio: str = radio
+        self.capacity: int = self.capacities.get(data_rate, self.capacities['2M'])
+        self.window: float = 1.0
+        # Time in seconds background traffic is held after an emergency command and the longest it waits at all. The
+        # links of a simulated radio have no queues, only the emergency command itself holds their background traffic.
+        self.emergency_hold: float = 0.0 if radio.startswith('sim://') else 0.1
+        self.max_hold: float = 1.0
+        # Share of the capacity the telemetry may use, the rest is left for commands
+        self.telemetry_budget: float = 0.5 * self.capacity
+        # Called with the new scale of the log periods whenever it changed
+        self.telemetry_scale_changed = Caller()
+        self._telemetry_requests: Dict[object, float] = {}
+        self._telemetry_scale: float = 1.0
+        self._clock: Clock = clock if clock is not None else Clock()
+        self._lock = threading.Lock()
+        # Notified when an emergency command was sent
+        self._emergency_sent = threading.Condition(self._lock)
+        self._emergencies: int = 0
+        self._hold_until: float = 0.0
+        # Traffic of each drone, keyed by the drone as the link uris of drones (e.g. simulated ones) may be the same
+        self._links: Dict[object, dict] = {}
+        self._lanes: Dict[Lane, int] = {lane: 0 for lane in Lane}
+        self._held: Dict[Lane, int] = {lane: 0 for lane in Lane}
+        self._window_start: float = self._clock.time()
+        self._window_packets: int = 0
+        self._packets_per_second: float = 0.0
+
+    def send(self, owner, lane: Lane, function: Callable, *args, packets: int = 1, size: int = 32):
+        """Sends over the radio by calling the function and returns its result, background traffic waits for emergencies.
+
+        Arguments:
+            owner {object} -- The drone the traffic belongs to.
+            lane {Lane} -- The kind of the traffic.
+            function {Callable} -- Sends the packets, for example a method of the commander.
+            packets {int} -- The estimated number of packets which are sent.
+            size {int} -- The estimated number of bytes which are sent.
+        """
+
+        if lane == Lane.BACKGROUND:
+            self._wait_for_emergencies()
+        with self._lock:
+            self._lanes[lane] += packets
+            if lane == Lane.EMERGENCY:
+                self._emergencies += 1
+        self._account(owner, 'sent', packets, size)
+        if lane != Lane.EMERGENCY:
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._emergencies -= 1
+                self._hold_until = time.monotonic() + self.emergency_hold
+                self._emergency_sent.notify_all()
+
+    def record_received(self, owner, packets: int, size: int):
+        """Accounts packets received from a drone of the radio."""
+        self._account(owner, 'received', packets, size)
+
+    def record_sent(self, owner, packets: int, size: int):
+        """Accounts packets sent to a drone of the radio without send, for example bulk memory writes."""
+        self._account(owner, 'sent', packets, size)
+
+    def request_telemetry(self, owner, packets_per_second: float) -> float:
+        """Sets the telemetry rate requested by a drone and returns the scale of the log periods.
+
+        Arguments:
+            owner {object} -- The drone requesting the telemetry.
+            packets_per_second {float} -- The number of log packets per second at the unscaled log periods, 0 to release.
+
+        Returns:
+            float -- The factor all drones on the radio stretch their log periods by to stay within the budget.
+        """
+
+        with self._lock:
+            if packets_per_second > 0:
+                self._telemetry_requests[owner] = packets_per_second
+            else:
+                self._telemetry_requests.pop(owner, None)
+            # Quarter steps keep the drones from restarting their log configurations for every small change
+            requested = sum(self._telemetry_requests.values())
+            scale = max(1.0, math.ceil(requested / self.telemetry_budget * 4) / 4)
+            changed = scale != self._telemetry_scale
+            self._telemetry_scale = scale
+        if changed:
+            self.telemetry_scale_changed.call(scale)
+        return scale
+
+    def get_telemetry_scale(self) -> float:
+        return self._telemetry_scale
+
+    def remove_link(self, owner):
+        with self._lock:
+            self._links.pop(owner, None)
+
+    def get_stats(self) -> dict:
+        """Gets the utilisation of the radio, the traffic of each drone and the packets sent in each lane."""
+        with self._lock:
+            self._roll_window()
+            return {
+                'radio': self.radio,
+                'capacity': self.capacity,
+                'packets_per_second': self._packets_per_second,
+                'utilisation': self._packets_per_second / self.capacity,
+                'telemetry_budget': self.telemetry_budget,
+                'telemetry_requested': sum(self._telemetry_requests.values()),
+                'telemetry_scale': self._telemetry_scale,
+                'lanes': {lane.name.lower(): {'sent': packets, 'held': self._held[lane]} for lane, packets in self._lanes.items()},
+                'links': [dict(link) for link in self._links.values()]
+            }
+
+    def _wait_for_emergencies(self):
+        # The hold is in real time, the air time of the radio does not pass with a virtual clock
+        with self._lock:
+            if self._emergencies == 0 and time.monotonic() >= self._hold_until:
+                return
+            self._held[Lane.BACKGROUND] += 1
+            deadline = time.monotonic() + self.max_hold
+            while self._emergencies > 0 or time.monotonic() < self._hold_until:
+                now = time.monotonic()
+                if now >= deadline:
+                    print('Background traffic on %s was held for more than %.1f s' % (self.radio, self.max_hold))
+                    return
+                self._emergency_sent.wait((deadline if self._emergencies > 0 else min(deadline, self._hold_until)) - now)
+
+    def _account(self, owner, direction: str, packets: int, size: int):
+        with self._lock:
+            link = self._links.get(owner)
+            if link is None:
+                link = {'drone_id': getattr(owner, 'id', None), 'link_uri': getattr(owner, 'link_uri', None),
+                        'sent_packets': 0, 'sent_bytes': 0, 'received_packets': 0, 'received_bytes': 0}
+                self._links[owner] = link
+            link[direction + '_packets'] += packets
+            link[direction + '_bytes'] += size
+            self._roll_window()
+            self._window_packets += packets
+
+    def _roll_window(self):
+        # The rate of the last complete window is reported
+        now = self._clock.time()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self._packets_per_second = self._window_packets / elapsed
+            self._window_start = now
+            self._window_packets = 0
@@ -0,0 +1,31 @@
+import argparse
+import json
+
+from .deliveryjournal import read_journal, read_swarm_ids
+from .deliverylogger import DeliveryLogger
+
+
+def replay(path: str, swarm_id: str) -> DeliveryLogger:
+    """Rebuilds the delivery logger of a swarm from the events in a journal since the last reset of the swarm.
+
+    Arguments:
+        path {str} -- The journal file.
+        swarm_id {str} -- The id of the swarm.
+
+    Returns:
+        DeliveryLogger -- The logger with the pending packages, the loads of the drones and the scores.
+    """
+
+    delivery_logger = DeliveryLogger(swarm_id)
+    for event in read_journal(path, swarm_id):
+        delivery_logger.apply(event)
+    return delivery_logger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuilds the deliveries of the swarms from a delivery journal and prints their scores.")
+    parser.add_argument("journal", help="The journal file of the server.")
+    parser.add_argument("--swarm", action="append", help="The id of a swarm to replay, all swarms by default.")
+    args = parser.parse_args()
+    for swarm_id in args.swarm or read_swarm_ids(args.journal):
+        print(json.dumps(dict(replay(args.journal, swarm_id).get_scores(), swarm_id=swarm_id)))
@@ -0,0 +1,64 @@
+import queue
+import threading
+
+from werkzeug.serving import BaseWSGIServer
+
+
+class Server:
+    """Serves a WSGI application with a fixed pool of worker threads until it is shut down.
+
+    Unlike the development server of Flask there is no reloader or debugger and the number of requests which are
+    handled at the same time is bounded. Long-polls and telemetry streams hold a worker while they are open, so the
+    pool should be larger than the number of clients streaming at once.
+    """
+
+    def __init__(self, app, host: str = '0.0.0.0', port: int = 5000, threads: int = 32):
+        """Initializes the server and binds its socket.
+
+        Arguments:
+            app {Callable} -- The WSGI application.
+            host {str} -- The interface to listen on.
+            port {int} -- The port to listen on, 0 for any free port.
+            threads {int} -- The number of requests handled at the same time.
+        """
+
+        self._server = _PooledWSGIServer(host, port, app, threads)
+        self.host: str = host
+        self.port: int = self._server.server_port
+
+    def serve(self):
+        """Handles requests until the server is shut down or the process is interrupted."""
+        print('Serving on http://%s:%d with %d threads' % (self.host, self.port, self._server.threads))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def shutdown(self):
+        """Stops serving, the request calling it is still answered."""
+        threading.Thread(target=self._server.shutdown, name='Shutdown', daemon=True).start()
+
+
+class _PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int):
+        super().__init__(host, port, app)
+        self.threads: int = threads
+        self._requests = queue.Queue()
+        # Daemon workers, so open streams do not keep the process alive after the shutdown
+        for index in range(threads):
+            threading.Thread(target=self._work, name='Worker %d' % index, daemon=True).start()
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+    def _work(self):
+        while True:
+            request, client_address = self._requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
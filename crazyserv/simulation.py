@@ -0,0 +1,486 @@
+import functools
+import heapq
+import itertools
+import struct
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from cflib.crazyflie.log import LogTocElement
+from cflib.crazyflie.mem import MemoryElement
+from cflib.utils.callbacks import Caller
+
+from .clock import Clock, VirtualClock
+from .trajectory import evaluate_trajectory
+
+# Struct format and value range of each log type, values are sent in the type they are fetched as
+_FETCH_FORMATS = {type_id: (fmt, -2 ** (8 * size - 1) if fmt[1].islower() else 0, 2 ** (8 * size - (1 if fmt[1].islower() else 0)) - 1)
+                  for type_id, (_, fmt, size) in LogTocElement.types.items()}
+_FP16 = LogTocElement.get_id_from_cstring('FP16')
+
+
+class SimulationEngine:
+    """Steps the state of all simulated Crazyflies together and streams their log data."""
+
+    def __init__(self, clock: Clock = None, tick: float = 0.01):
+        """Initializes an empty simulation.
+
+        Arguments:
+            clock {Clock} -- The clock of the simulation. With a VirtualClock the simulation runs as fast as it is advanced.
+            tick {float} -- The simulation step in seconds. Log data is sent on multiples of this step.
+        """
+
+        self.clock: Clock = clock if clock is not None else Clock()
+        self.tick: float = tick
+        # Kinematics and parameters
+        self.home_spacing: float = 0.4
+        self.home_columns: int = 8
+        self.variance_reset: float = 1.0
+        self.variance_floor: float = 0.0001
+        self.variance_time_constant: float = 0.15
+        self.battery_full: float = 4.15
+        self.battery_drain_idle: float = 0.00005
+        self.battery_drain_flying: float = 0.0008
+
+        self._lock = threading.RLock()
+        self._thread = None
+        self._start_time: float = self.clock.time()
+        self._created: int = 0
+        self._free_slots: List[int] = []
+        self._crazyflies: List['SimulatedCrazyflie'] = []
+        self._log_queue = []
+        self._log_sequence = itertools.count()
+
+        # State of all drones, one row per slot
+        self._start = np.zeros((0, 3))
+        self._target = np.zeros((0, 3))
+        self._start_yaw = np.zeros(0)
+        self._target_yaw = np.zeros(0)
+        self._start_time_of_move = np.zeros(0)
+        self._duration = np.zeros(0)
+        self._reset_time = np.zeros(0)
+        self._battery = np.zeros(0)
+        self._battery_time = np.zeros(0)
+        self._boot_time = np.zeros(0)
+        # Start time, durations and coefficients of the trajectory each drone is following
+        self._trajectories: Dict[int, tuple] = {}
+        self._allocate(16)
+        if isinstance(self.clock, VirtualClock):
+            self.clock.advanced.add_callback(self._clock_advanced)
+
+    def create_crazyflie(self, origin: List[float]) -> 'SimulatedCrazyflie':
+        """Creates a new simulated Crazyflie standing on the ground next to the given origin.
+
+        Arguments:
+            origin {List[float]} -- The global position of the corner where the drones are lined up.
+
+        Returns:
+            SimulatedCrazyflie -- A stand-in for cflib.crazyflie.Crazyflie.
+        """
+
+        with self._lock:
+            column = self._created % self.home_columns
+            row = self._created // self.home_columns
+            self._created += 1
+            home = [origin[0] + column * self.home_spacing, origin[1] + row * self.home_spacing, origin[2]]
+        return SimulatedCrazyflie(self, home)
+
+    def time(self) -> float:
+        """Gets the current simulation time in seconds."""
+        return self.clock.time() - self._start_time
+
+    def advance(self, seconds: float) -> float:
+        """Advances a simulation with a virtual clock by the given number of seconds and returns the new time."""
+        if not isinstance(self.clock, VirtualClock):
+            raise RuntimeError('Only a simulation with a virtual clock can be advanced')
+        return self.clock.advance(seconds) - self._start_time
+
+    def step(self, now: float):
+        """Advances all drones to the given time and sends the log data which became due in chronological order."""
+        last_tick = int(np.floor(now / self.tick + 1e-9))
+        while True:
+            samples = []
+            with self._lock:
+                if not self._log_queue or self._log_queue[0][0] > last_tick:
+                    return
+                due_tick = self._log_queue[0][0]
+                due = []
+                while self._log_queue and self._log_queue[0][0] == due_tick:
+                    _, _, slot, crazyflie, logconf, generation = heapq.heappop(self._log_queue)
+                    if self._crazyflies[slot] is not crazyflie or crazyflie._log_configs.get(logconf) != generation:
+                        # The link was closed or the config was stopped or restarted in the meantime
+                        continue
+                    due.append((slot, logconf))
+                    self._schedule_log(due_tick, slot, crazyflie, logconf)
+                # All drones are evaluated at once for every tick with due log data
+                due_time = due_tick * self.tick
+                position, yaw = self._evaluate(due_time)
+                variance = self._evaluate_variance(due_time)
+                self._drain_battery(due_time, position)
+                for slot, logconf in due:
+                    values = {
+                        'kalman.stateX': position[slot, 0],
+                        'kalman.stateY': position[slot, 1],
+                        'kalman.stateZ': position[slot, 2],
+                        'kalman.varPX': variance[slot],
+                        'kalman.varPY': variance[slot],
+                        'kalman.varPZ': variance[slot],
+                        'pm.vbat': self._battery[slot],
+                        'pm.vbatMV': self._battery[slot] * 1000.0,
+                        'stateEstimateZ.x': position[slot, 0] * 1000.0,
+                        'stateEstimateZ.y': position[slot, 1] * 1000.0,
+                        'stateEstimateZ.z': position[slot, 2] * 1000.0,
+                        'stabilizer.pitch': 0.0,
+                        'stabilizer.roll': 0.0,
+                        'stabilizer.yaw': np.degrees(yaw[slot]),
+                    }
+                    data = {variable.name: _fetch(variable.fetch_as, values.get(variable.name, 0.0)) for variable in logconf.variables}
+                    timestamp = int(round((due_time - self._boot_time[slot]) * 1000))
+                    samples.append((logconf, timestamp, data))
+            # Callbacks are called outside of the lock so they can safely send new commands
+            for logconf, timestamp, data in samples:
+                logconf.data_received_cb.call(timestamp, data, logconf)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            self.step(self.time())
+
+    def _clock_advanced(self, now: float):
+        self.step(now - self._start_time)
+
+    def _ensure_running(self):
+        # A virtual clock steps the simulation whenever it is advanced, a real one needs a thread
+        if self._thread is None and not isinstance(self.clock, VirtualClock):
+            self._thread = threading.Thread(target=self._run, name='SimulationEngine', daemon=True)
+            self._thread.start()
+
+    def _allocate(self, capacity: int):
+        """Grows the state arrays to hold the given number of drones."""
+        size = len(self._crazyflies)
+
+        def grow(array, fill):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:size] = array[:size]
+            return grown
+
+        self._start = grow(self._start, 0.0)
+        self._target = grow(self._target, 0.0)
+        self._start_yaw = grow(self._start_yaw, 0.0)
+        self._target_yaw = grow(self._target_yaw, 0.0)
+        self._start_time_of_move = grow(self._start_time_of_move, 0.0)
+        self._duration = grow(self._duration, 1.0)
+        self._reset_time = grow(self._reset_time, -np.inf)
+        self._battery = grow(self._battery, self.battery_full)
+        self._battery_time = grow(self._battery_time, 0.0)
+        self._boot_time = grow(self._boot_time, 0.0)
+        self._free_slots.extend(range(capacity - 1, size - 1, -1))
+        self._crazyflies.extend([None] * (capacity - size))
+
+    def _add(self, crazyflie: 'SimulatedCrazyflie') -> int:
+        """Adds a crazyflie with an opened link to the simulation and returns its slot."""
+        with self._lock:
+            if not self._free_slots:
+                self._allocate(2 * len(self._crazyflies))
+            slot = self._free_slots.pop()
+            now = self.time()
+            self._crazyflies[slot] = crazyflie
+            self._start[slot] = crazyflie.home
+            self._target[slot] = crazyflie.home
+            self._start_yaw[slot] = 0.0
+            self._target_yaw[slot] = 0.0
+            self._start_time_of_move[slot] = now
+            self._duration[slot] = 1.0
+            self._reset_time[slot] = -np.inf
+            self._battery[slot] = self.battery_full
+            self._battery_time[slot] = now
+            self._boot_time[slot] = now
+            self._ensure_running()
+        return slot
+
+    def _remove(self, slot: int):
+        """Removes the crazyflie in the given slot from the simulation."""
+        with self._lock:
+            crazyflie = self._crazyflies[slot]
+            if crazyflie is not None:
+                crazyflie.home = self._position(slot, self.time()).tolist()
+                crazyflie.home[2] = 0.0
+            self._crazyflies[slot] = None
+            self._trajectories.pop(slot, None)
+            self._free_slots.append(slot)
+
+    def _start_log(self, crazyflie: 'SimulatedCrazyflie', logconf):
+        """Starts (or restarts with its current period) the streaming of a log configuration."""
+        with self._lock:
+            if crazyflie._slot is None or logconf not in crazyflie._log_configs:
+                return
+            crazyflie._log_configs[logconf] += 1
+            self._schedule_log(int(np.ceil(self.time() / self.tick - 1e-9)), crazyflie._slot, crazyflie, logconf)
+
+    def _stop_log(self, crazyflie: 'SimulatedCrazyflie', logconf):
+        with self._lock:
+            if logconf in crazyflie._log_configs:
+                crazyflie._log_configs[logconf] += 1
+
+    def _schedule_log(self, last_tick: int, slot: int, crazyflie: 'SimulatedCrazyflie', logconf):
+        # Due times are counted in ticks so that drones share the evaluation of their states
+        period = max(int(round(logconf.period_in_ms / 1000.0 / self.tick)), 1)
+        generation = crazyflie._log_configs[logconf]
+        heapq.heappush(self._log_queue, (last_tick + period, next(self._log_sequence), slot, crazyflie, logconf, generation))
+
+    def _move(self, slot: int, target: List[float], yaw: float, duration: float):
+        """Starts a smooth movement of the drone in the given slot from its current position."""
+        with self._lock:
+            now = self.time()
+            position, current_yaw = self._evaluate(now)
+            self._start[slot] = position[slot]
+            self._start_yaw[slot] = current_yaw[slot]
+            self._target[slot] = target
+            self._target_yaw[slot] = yaw
+            self._start_time_of_move[slot] = now
+            self._duration[slot] = max(duration, self.tick)
+            self._trajectories.pop(slot, None)
+
+    def _follow(self, slot: int, coefficients: np.ndarray, durations: np.ndarray, time_scale: float, offset: List[float]):
+        """Starts following a trajectory (pieces x 4 axes x 8 coefficients) shifted by the offset."""
+        with self._lock:
+            coefficients = coefficients.copy()
+            coefficients[:, :3, 0] += offset
+            durations = durations * time_scale
+            # Every power of the time is stretched by the time scale
+            coefficients /= time_scale ** np.arange(8)
+            final = evaluate_trajectory(coefficients, durations, np.inf)
+            now = self.time()
+            # The trajectory overrides the movement until it ends, the drone stays at its end afterwards
+            self._start[slot] = final[:3]
+            self._target[slot] = final[:3]
+            self._start_yaw[slot] = final[3]
+            self._target_yaw[slot] = final[3]
+            self._start_time_of_move[slot] = now
+            self._trajectories[slot] = (now, durations, coefficients)
+
+    def _drop(self, slot: int):
+        """Cuts the motors of the drone in the given slot so it falls to the ground."""
+        with self._lock:
+            now = self.time()
+            position = self._position(slot, now)
+            position[2] = 0.0
+            self._start[slot] = position
+            self._target[slot] = position
+            self._start_time_of_move[slot] = now
+            self._trajectories.pop(slot, None)
+
+    def _reset_estimator(self, slot: int):
+        with self._lock:
+            self._reset_time[slot] = self.time()
+
+    def _current_position(self, slot: int) -> np.ndarray:
+        with self._lock:
+            return self._position(slot, self.time())
+
+    def _current_yaw(self, slot: int) -> float:
+        with self._lock:
+            _, yaw = self._evaluate(self.time())
+            return yaw[slot]
+
+    def _position(self, slot: int, now: float) -> np.ndarray:
+        position, _ = self._evaluate(now)
+        return position[slot].copy()
+
+    def _evaluate(self, now: float):
+        """Evaluates the positions and yaws of all drones at the given time."""
+        progress = np.clip((now - self._start_time_of_move) / self._duration, 0.0, 1.0)
+        # Smoothstep profile, starts and stops with zero velocity like the high-level commander
+        progress = progress * progress * (3.0 - 2.0 * progress)
+        position = self._start + (self._target - self._start) * progress[:, np.newaxis]
+        yaw = self._start_yaw + (self._target_yaw - self._start_yaw) * progress
+        for slot, (started, durations, coefficients) in self._trajectories.items():
+            if now - started < durations.sum():
+                values = evaluate_trajectory(coefficients, durations, now - started)
+                position[slot] = values[:3]
+                yaw[slot] = values[3]
+        return position, yaw
+
+    def _evaluate_variance(self, now: float) -> np.ndarray:
+        """Evaluates the position variance of the estimators which decays after a reset."""
+        decay = np.exp(-(now - self._reset_time) / self.variance_time_constant)
+        return self.variance_floor + (self.variance_reset - self.variance_floor) * decay
+
+    def _drain_battery(self, now: float, position: np.ndarray):
+        flying = position[:, 2] > 0.01
+        elapsed = now - self._battery_time
+        self._battery -= elapsed * np.where(flying, self.battery_drain_flying, self.battery_drain_idle)
+        self._battery_time[:] = now
+
+
+def _fetch(type_id: int, value: float):
+    """Converts a value to the type it is fetched as, like the Crazyflie does before sending it."""
+    fmt, minimum, maximum = _FETCH_FORMATS[type_id]
+    if type_id == _FP16:
+        # The bits of the half precision float, cflib 0.1.7 unpacks them as int16
+        return struct.unpack(fmt, struct.pack('<e', value))[0]
+    if fmt == '<f':
+        return struct.unpack(fmt, struct.pack(fmt, value))[0]
+    return min(max(int(round(value)), minimum), maximum)
+
+
+class SimulatedCrazyflie:
+    """Stand-in for cflib.crazyflie.Crazyflie that is backed by a SimulationEngine instead of a radio."""
+
+    def __init__(self, engine: SimulationEngine, home: List[float]):
+        self.home: List[float] = home
+        self.link = None
+        self.link_uri: str = ''
+        self.connected = Caller()
+        self.disconnected = Caller()
+        self.connection_failed = Caller()
+        self.connection_lost = Caller()
+        self.param = _SimulatedParam(self)
+        self.log = _SimulatedLog(self)
+        self.commander = _SimulatedCommander(self)
+        self.high_level_commander = _SimulatedHighLevelCommander(self)
+        self.mem = _SimulatedMemory(self)
+        self._engine = engine
+        self._slot = None
+        self._log_configs = {}
+
+    def open_link(self, link_uri: str):
+        self.link_uri = link_uri
+        self._slot = self._engine._add(self)
+        self.connected.call(link_uri)
+        # There are no parameter values to download
+        self.param.all_updated.call()
+
+    def close_link(self):
+        if self._slot is None:
+            return
+        self._engine._remove(self._slot)
+        self._slot = None
+        self._log_configs = {}
+        self.disconnected.call(self.link_uri)
+
+    def is_connected(self) -> bool:
+        return self._slot is not None
+
+
+class _SimulatedParam:
+    def __init__(self, crazyflie: SimulatedCrazyflie):
+        self.values = {}
+        self.param_update_callbacks = {}
+        self.all_updated = Caller()
+        self._cf = crazyflie
+
+    def set_value(self, complete_name: str, value: str):
+        self.values[complete_name] = value
+        if complete_name == 'kalman.resetEstimation' and str(value) == '1':
+            self._cf._engine._reset_estimator(self._cf._slot)
+        # The written value is confirmed right away
+        if complete_name in self.param_update_callbacks:
+            self.param_update_callbacks[complete_name].call(complete_name, str(value))
+
+    def add_update_callback(self, group: str, name: str, cb):
+        self.param_update_callbacks.setdefault(group + '.' + name, Caller()).add_callback(cb)
+
+    def remove_update_callback(self, group: str, name: str, cb):
+        if group + '.' + name in self.param_update_callbacks:
+            self.param_update_callbacks[group + '.' + name].remove_callback(cb)
+
+
+class _SimulatedLog:
+    def __init__(self, crazyflie: SimulatedCrazyflie):
+        self._cf = crazyflie
+
+    def add_config(self, logconf):
+        # Without a link LogConfig would not send anything, so starting and stopping is redirected to the engine
+        logconf.cf = self._cf
+        logconf.start = functools.partial(self._cf._engine._start_log, self._cf, logconf)
+        logconf.stop = functools.partial(self._cf._engine._stop_log, self._cf, logconf)
+        self._cf._log_configs[logconf] = 0
+
+
+class _SimulatedCommander:
+    def __init__(self, crazyflie: SimulatedCrazyflie):
+        self._cf = crazyflie
+
+    def send_setpoint(self, roll, pitch, yawrate, thrust):
+        # Only the zero setpoint (motors off) is emulated
+        if thrust == 0 and self._cf._slot is not None:
+            self._cf._engine._drop(self._cf._slot)
+
+
+class _SimulatedHighLevelCommander:
+    def __init__(self, crazyflie: SimulatedCrazyflie):
+        self._cf = crazyflie
+        self._trajectories = {}
+
+    def takeoff(self, absolute_height_m, duration_s, group_mask=0, yaw=None):
+        self._vertical(absolute_height_m, duration_s, yaw)
+
+    def land(self, absolute_height_m, duration_s, group_mask=0, yaw=None):
+        self._vertical(absolute_height_m, duration_s, yaw)
+
+    def stop(self, group_mask=0):
+        self._cf._engine._drop(self._cf._slot)
+
+    def define_trajectory(self, trajectory_id, offset, n_pieces, type=0):
+        self._trajectories[trajectory_id] = self._cf.mem.trajectory_memory.read_pieces(offset, n_pieces)
+
+    def start_trajectory(self, trajectory_id, time_scale=1.0, relative_position=False, relative_yaw=False, reversed=False, group_mask=0):
+        # Reversed and relative yaw trajectories are not emulated
+        engine = self._cf._engine
+        durations, coefficients = self._trajectories[trajectory_id]
+        offset = engine._current_position(self._cf._slot) if relative_position else np.zeros(3)
+        engine._follow(self._cf._slot, coefficients, durations, time_scale, offset)
+
+    def go_to(self, x, y, z, yaw, duration_s, relative=False, linear=False, group_mask=0):
+        engine = self._cf._engine
+        target = np.array([x, y, z], dtype=float)
+        if relative:
+            target += engine._current_position(self._cf._slot)
+            yaw += engine._current_yaw(self._cf._slot)
+        engine._move(self._cf._slot, target, yaw, duration_s)
+
+    def _vertical(self, absolute_height_m, duration_s, yaw):
+        engine = self._cf._engine
+        target = engine._current_position(self._cf._slot)
+        target[2] = absolute_height_m
+        if yaw is None:
+            yaw = engine._current_yaw(self._cf._slot)
+        engine._move(self._cf._slot, target, yaw, duration_s)
+
+
+class _SimulatedMemory:
+    def __init__(self, crazyflie: SimulatedCrazyflie):
+        self.trajectory_memory = _SimulatedTrajectoryMemory()
+
+    def get_mems(self, type):
+        return (self.trajectory_memory,) if type == MemoryElement.TYPE_TRAJ else ()
+
+
+class _SimulatedTrajectoryMemory:
+    """Stand-in for the trajectory memory which keeps the uploaded bytes in the format of the Crazyflie."""
+
+    # x, y, z and yaw with 8 coefficients each and the duration
+    piece_format = '<33f'
+
+    def __init__(self, size: int = 4096):
+        self.type = MemoryElement.TYPE_TRAJ
+        self.size: int = size
+        self.poly4Ds = []
+        self._data = bytearray(size)
+
+    def write_data(self, write_finished_cb):
+        # Like the Crazyflie a write which does not fit is never confirmed
+        data = b''.join([struct.pack(self.piece_format, *(piece.x.values + piece.y.values + piece.z.values + piece.yaw.values + [piece.duration]))
+                         for piece in self.poly4Ds])
+        if len(data) <= self.size:
+            self._data[:len(data)] = data
+            write_finished_cb(self, 0x00)
+
+    def read_pieces(self, offset: int, count: int) -> tuple:
+        """Gets the durations (n) and coefficients (n x 4 x 8) of the pieces at the given offset."""
+        size = struct.calcsize(self.piece_format)
+        values = np.frombuffer(bytes(self._data[offset:offset + count * size]), dtype='<f4').reshape(count, 33).astype(float)
+        return values[:, 32], values[:, :32].reshape(count, 4, 8)
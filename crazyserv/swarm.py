@@ -1,45 +1,132 @@
-from typing import Dict
+from typing import Callable, Dict, List
+from concurrent.futures import Executor
 import threading
-from .drone import Drone
+import time
+from cflib.utils.callbacks import Caller
+from .airspace import Airspace
+from .drone import Drone, DroneState
+from .flightrecorder import FlightRecorder
+from .flightreplay import ReplayEngine
 from .arena import Arena
+from .clock import Clock
+from .radioscheduler import RadioScheduler
+from .simulation import SimulationEngine
+from .telemetryprofile import TelemetryProfile
+from .toccache import SharedTocCache
 
 
 class Swarm:
-    """Class that handles a swarm."""
+    """Class that handles a swarm.
 
-    def __init__(self, swarm_id: str):
+    The maps of the drones and of the connection progress are copy-on-write: they are replaced under the lock of the
+    swarm and never changed in place, so readers use them without locking, even while drones are added or lost.
+    """
+
+    def __init__(self, swarm_id: str, simulated: bool = False, telemetry_profile: TelemetryProfile = None,
+                 toc_cache: SharedTocCache = None, recorder: FlightRecorder = None, replay: ReplayEngine = None, clock: Clock = None):
         self.id: str = swarm_id
+        # The time base of the swarm, simulated and real drones of the swarm are compared on it
+        self.clock: Clock = clock if clock is not None else Clock()
+        self.simulated: bool = simulated
+        # Records the telemetry and the commands of all drones of the swarm, None to record nothing
+        self.recorder: FlightRecorder = recorder
+        # Plays a recorded session back instead of simulating or flying the drones, None for live drones
+        self.replay: ReplayEngine = replay
+        # The log blocks of the drones of the swarm, None for the default profile
+        self.telemetry_profile: TelemetryProfile = telemetry_profile
+        # The TOCs known from earlier connections, shared by the real drones of all swarms
+        self.toc_cache: SharedTocCache = toc_cache
         self.drones: Dict[str, Drone] = {}
+        # Stage of the latest connection attempt of each drone
+        self.connection_progress: Dict[str, dict] = {}
+        # Called with the drone id and the changed status fields of a drone of the swarm
+        self.telemetry_updated = Caller()
+        # Flight segments of all drones to detect conflicts between their flights
+        self.airspace = Airspace(clock=self.clock)
+        # Incremented whenever a drone or its status changed, the serialized status is cached per version
+        self.status_version: int = 0
+        self._status_json = (-1, None)
+        self._version_lock = threading.Lock()
         self._lock = threading.Lock()
 
-    def add_drone(self, drone_id: str, arena: Arena, radio_id: int, channel: int, address: str, data_rate: str) -> bool:
+    def add_drone(self, drone_id: str, arena: Arena, radio_id: int, channel: int, address: str, data_rate: str,
+                  simulation: SimulationEngine = None, radio: RadioScheduler = None) -> bool:
         """Adds a new drone with the given id to the swarm.
 
         Arguments:
             drone_id {str} -- The id of the drone that should be added.
+            simulation {SimulationEngine} -- The simulation to add a simulated drone to, None for a real drone.
+            radio {RadioScheduler} -- The scheduler of the radio of the drone, None for a radio of its own.
 
         Returns:
             bool -- True if the drone was added successfully, False otherwise.
         """
 
+        started = time.time()
         # Try to create and connect to the drone
-        drone = Drone(drone_id, arena, radio_id, channel, address, data_rate)
+        self._report_progress(drone_id, 'connecting', started)
+        drone = Drone(drone_id, arena, radio_id, channel, address, data_rate, simulation, radio, self.telemetry_profile,
+                      self.toc_cache)
+        drone.recorder = self.recorder
         drone.connect(synchronous=True)
         # Check if the connection to the drone was successfull
         if (not drone.is_connected):
             # Connection failed
+            self._report_progress(drone_id, 'failed', started)
             return False
         # Connection successfull, configure the drone
+        self._report_progress(drone_id, 'configuring', started)
         drone.enable_high_level_commander()
+        self._report_progress(drone_id, 'calibrating', started)
         drone.reset_estimator()
-        # Remove a possible existing drone from the swarm
-        self.remove_drone(drone.id)
-        # Add the new drone to the swarm
-        self.drones[drone.id] = drone
+        drone.airspace = self.airspace
         # Add a callback when the drone is lost
         drone.drone_lost.add_callback(self._drone_connection_lost)
+        drone.telemetry_updated.add_callback(self._drone_telemetry_updated)
+        with self._lock:
+            # Replace a possible existing drone of the swarm
+            replaced = self.drones.get(drone.id)
+            drones = dict(self.drones)
+            drones[drone.id] = drone
+            self.drones = drones
+            self.airspace.hold(drone.id, drone.get_position())
+        if replaced is not None:
+            replaced.airspace = None
+            self._disconnect(replaced)
+        self._changed()
+        self.telemetry_updated.call(drone.id, drone.get_status())
+        self._report_progress(drone_id, 'connected', started)
         return True
 
+    def add_drones(self, connections: List[dict], arena: Arena, executor: Executor) -> List[dict]:
+        """Connects and configures several drones concurrently and adds them to the swarm.
+
+        Arguments:
+            connections {List[dict]} -- The drone_id, radio_id, channel, address, data_rate, simulation and radio of each drone.
+            arena {Arena} -- The arena of the swarm.
+            executor {Executor} -- The worker pool to connect the drones on.
+
+        Returns:
+            List[dict] -- The final connection progress of each drone in the order of the connections.
+        """
+
+        started = time.time()
+        futures = []
+        for connection in connections:
+            self._report_progress(connection['drone_id'], 'pending', started)
+            futures.append(executor.submit(self.add_drone, connection['drone_id'], arena, connection['radio_id'], connection['channel'],
+                                           connection['address'], connection['data_rate'], connection.get('simulation'),
+                                           connection.get('radio')))
+        results = []
+        for connection, future in zip(connections, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print('Connection of %s failed: %s' % (connection['drone_id'], e))
+                self._report_progress(connection['drone_id'], 'failed', started)
+            results.append(self.connection_progress[connection['drone_id']])
+        return results
+
     def remove_drone(self, drone_id: str) -> bool:
         """Tries to disconnect and remove the drone with the given id from the swarm.
 
@@ -50,17 +137,7 @@ class Swarm:
             bool -- True if the drone was found and removed, false if the drone was not found.
         """
 
-        if drone_id in self.drones:
-            drone = self.drones.get(drone_id)
-            self.drones.pop(drone_id)
-            # Try to disconnect the drone
-            try:
-                drone.drone_lost.remove_callback(self._drone_connection_lost)
-                drone.disconnect()
-            except:
-                pass
-            return True
-        return False
+        return self._remove_drone(drone_id)
 
     def get_drone(self, drone_id: str) -> Drone:
         """Gets the drone with the given id from the swarm.
@@ -72,9 +149,92 @@ class Swarm:
             Drone -- The drone object or None if no drone with the given id exists.
         """
 
-        if drone_id in self.drones:
-            return self.drones.get(drone_id)
-        return None
+        return self.drones.get(drone_id)
+
+    def get_status_json(self) -> str:
+        """Gets the status of all drones serialized as a JSON list, it is only serialized again after it changed.
+
+        Returns:
+            str -- The serialized status of all drones.
+        """
+
+        version, status_json = self._status_json
+        if version != self.status_version:
+            version = self.status_version
+            # Only drones whose status changed are serialized again
+            status_json = '[' + ', '.join([drone.get_status_json() for drone in self.drones.values()]) + ']'
+            self._status_json = (version, status_json)
+        return status_json
+
+    def execute_commands(self, commands: List[dict], handler: Callable[[Drone, dict], dict], executor: Executor) -> List[dict]:
+        """Executes commands for several drones of the swarm concurrently.
+
+        Arguments:
+            commands {List[dict]} -- The commands, each with a drone_id and a command name.
+            handler {Callable[[Drone, dict], dict]} -- Executes a single command on a drone and returns its result.
+            executor {Executor} -- The worker pool to execute the commands on.
+
+        Returns:
+            List[dict] -- The result of each command in the order of the commands.
+        """
+
+        futures = []
+        for command in commands:
+            drone = self.get_drone(str(command.get('drone_id')))
+            futures.append(None if drone is None else executor.submit(handler, drone, command))
+        results = []
+        for command, future in zip(commands, futures):
+            result = {'drone_id': command.get('drone_id'), 'command': command.get('command'), 'success': False}
+            if future is None:
+                result['error'] = 'Drone not found.'
+            else:
+                try:
+                    result['result'] = future.result()
+                    result['success'] = True
+                except Exception as e:
+                    result['error'] = str(e)
+            results.append(result)
+        return results
+
+    def _remove_drone(self, drone_id: str, expected: Drone = None) -> bool:
+        """Removes the drone with the given id, if expected is given only if it is still that drone."""
+        with self._lock:
+            drone = self.drones.get(drone_id)
+            if drone is None or (expected is not None and drone is not expected):
+                return False
+            drones = dict(self.drones)
+            drones.pop(drone_id)
+            self.drones = drones
+            self.airspace.remove(drone_id)
+        drone.airspace = None
+        self._disconnect(drone)
+        self._changed()
+        self.telemetry_updated.call(drone_id, {'status': DroneState.OFFLINE.name})
+        return True
+
+    def _disconnect(self, drone: Drone):
+        # Try to disconnect the drone
+        try:
+            drone.drone_lost.remove_callback(self._drone_connection_lost)
+            drone.telemetry_updated.remove_callback(self._drone_telemetry_updated)
+            drone.disconnect()
+        except:
+            pass
+
+    def _changed(self):
+        with self._version_lock:
+            self.status_version += 1
+
+    def _report_progress(self, drone_id: str, stage: str, started: float):
+        with self._lock:
+            progress = dict(self.connection_progress)
+            progress[drone_id] = {'drone_id': drone_id, 'stage': stage, 'elapsed': time.time() - started}
+            self.connection_progress = progress
+
+    def _drone_telemetry_updated(self, drone: Drone, values: dict):
+        self._changed()
+        self.telemetry_updated.call(drone.id, values)
 
     def _drone_connection_lost(self, drone: Drone):
-        self.remove_drone(drone.id)
+        # A replaced drone may lose its connection after its successor was added
+        self._remove_drone(drone.id, drone)
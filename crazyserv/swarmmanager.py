@@ -1,28 +1,96 @@
-from typing import Dict
+from typing import Callable, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import os
 import threading
 from .drone import Drone
+from .flightrecorder import FlightRecorder, FlightSession
+from .flightreplay import ReplayEngine
 from .swarm import Swarm
 from .arena import Arena
+from .clock import Clock
+from .pathplanner import PathPlanner
+from .radioscheduler import RadioScheduler
+from .simulation import SimulationEngine
+from .telemetryprofile import TelemetryProfile
+from .toccache import SharedTocCache
 
 
 class SwarmManager:
-    """Class that handles swarms."""
+    """Class that handles swarms.
 
-    def __init__(self):
+    Like the drones of a swarm, the maps of the swarms, arenas, path planners and radios are copy-on-write, they are
+    replaced under the lock of the manager and read without locking.
+    """
+
+    def __init__(self, toc_cache: str = './cache', recordings: str = None):
         self.swarms: Dict[str, Swarm] = {}
         self.arenas = {}
+        # The roadmaps are built once per arena and shared by all swarms in it
+        self.path_planners: Dict[int, PathPlanner] = {}
+        self.simulation = SimulationEngine()
+        # One scheduler per physical (or simulated) radio, shared by the drones of all swarms on it
+        self.radios: Dict[str, RadioScheduler] = {}
+        # The TOCs of the firmwares of all real drones, keyed by their CRC
+        self.toc_cache = SharedTocCache(toc_cache)
+        # Directory of the flight recordings with one session per swarm, None to record nothing
+        self.recordings: str = recordings
         self._lock = threading.Lock()
+        # Connects wait for the drones, they get workers of their own so they can not starve the commands
+        self._executor = ThreadPoolExecutor(max_workers=32)
+        self._connect_executor = ThreadPoolExecutor(max_workers=32)
+
+    def register_swarm(self, swarm_id, arena_id, simulated: bool = False, telemetry_profile: TelemetryProfile = None, replay: str = None):
+        """Registers a swarm in an arena.
+
+        Arguments:
+            swarm_id {str} -- The id of the swarm.
+            arena_id {int} -- The id of the arena.
+            simulated {bool} -- True to simulate the drones by default.
+            telemetry_profile {TelemetryProfile} -- The log blocks of the drones, None for the default profile.
+            replay {str} -- The name of a recorded session to play back instead of flying, the drones get the
+                            recorded drones in the order they connect.
+
+        Returns:
+            bool -- True if the swarm was registered, False if it exists already or the session was not found.
+        """
 
-    def register_swarm(self, swarm_id, arena_id):
-        self._lock.acquire()
-        try:
-            if swarm_id in self.arenas: 
+        engine = None
+        if replay is not None:
+            session = self.get_session(replay)
+            if session is None:
+                return False
+            engine = ReplayEngine(session, self.simulation.clock)
+        with self._lock:
+            if swarm_id in self.arenas:
                 return False
-            self.arenas[swarm_id] = Arena(arena_id)
-            self.swarms[swarm_id] = Swarm(swarm_id)
+            arena = Arena(arena_id)
+            if arena_id not in self.path_planners:
+                self.path_planners = {**self.path_planners, arena_id: PathPlanner(arena)}
+            self.arenas = {**self.arenas, swarm_id: arena}
+            recorder = FlightRecorder(self.recordings, swarm_id) if self.recordings and engine is None else None
+            # A simulated swarm runs on the clock of the simulation, which may be virtual
+            clock = self.simulation.clock if simulated or engine is not None else Clock()
+            # The swarm is published last, so its arena and path planner exist as soon as it can be found
+            swarm = Swarm(swarm_id, simulated, telemetry_profile, self.toc_cache, recorder, engine, clock)
+            self.swarms = {**self.swarms, swarm_id: swarm}
             return True
-        finally:
-            self._lock.release()
+
+    def get_session(self, name: str) -> FlightSession:
+        """Maps a recorded session of the recordings directory.
+
+        Arguments:
+            name {str} -- The name of the session file without its extension, e.g. swarm_20181117-101500.
+
+        Returns:
+            FlightSession -- The session, None if it does not exist.
+        """
+
+        if not self.recordings or os.path.basename(name) != name:
+            return None
+        path = os.path.join(self.recordings, name + '.flight')
+        if not os.path.exists(path + '.json'):
+            return None
+        return FlightSession(path)
 
     def get_swarm(self, swarm_id: str) -> Swarm:
         """Gets the swarm with the given id.
@@ -34,21 +102,35 @@ class SwarmManager:
             Swarm -- The swarm with the given id, None if no such swarm exists.
         """
 
-        if not swarm_id in self.swarms:
-            return None
         return self.swarms.get(swarm_id)
 
     def get_arena(self, swarm_id: str) -> Swarm:
-        if not swarm_id in self.arenas:
+        return self.arenas.get(swarm_id)
+
+    def get_path_planner(self, swarm_id: str) -> PathPlanner:
+        arena = self.get_arena(swarm_id)
+        if arena is None:
             return None
-        return self.arenas[swarm_id]
+        return self.path_planners[arena.arena_id]
+
+    def get_radio(self, radio_id: int, data_rate: str, simulated: bool) -> RadioScheduler:
+        """Gets the scheduler of the given radio, it is created when the first drone of the radio is added."""
+        radio = ("sim://" if simulated else "radio://") + str(radio_id)
+        with self._lock:
+            if radio not in self.radios:
+                self.radios = {**self.radios, radio: RadioScheduler(radio, data_rate, self.simulation.clock if simulated else None)}
+            return self.radios[radio]
 
-    def add_drone(self, swarm_id: str, drone_id: str, radio_id: int, channel: int, address: str, data_rate: str) -> Drone:
+    def get_radio_stats(self) -> List[dict]:
+        return [radio.get_stats() for radio in self.radios.values()]
+
+    def add_drone(self, swarm_id: str, drone_id: str, radio_id: int, channel: int, address: str, data_rate: str, simulated: bool = None) -> Drone:
         """Adds a drone to the swarm. Creates the swarm if it does not exist yet.
 
         Arguments:
             swarm_id {str} -- The swarm id to add the drone to.
             drone_id {str} -- The drone id of the drone to add to the swarm.
+            simulated {bool} -- True to add a simulated drone, None to use the default of the swarm.
 
         Returns:
             Drone -- The added drone or None if adding failed.
@@ -56,11 +138,43 @@ class SwarmManager:
 
         swarm = self.get_swarm(swarm_id)
         arena = self.get_arena(swarm_id)
-        success = swarm.add_drone(drone_id, arena, radio_id, channel, address, data_rate)
+        if simulated is None:
+            simulated = swarm.simulated
+        simulation = self.simulation if simulated else None
+        if swarm.replay is not None:
+            # The recorded drones are played back, whatever the connection asks for
+            simulated, simulation = True, swarm.replay
+        radio = self.get_radio(radio_id, data_rate, simulated)
+        success = swarm.add_drone(drone_id, arena, radio_id, channel, address, data_rate, simulation, radio)
         if success:
             return swarm.get_drone(drone_id)
         return None
 
+    def add_drones(self, swarm_id: str, connections: List[dict]) -> List[dict]:
+        """Connects several drones of a swarm concurrently on the worker pool for connects.
+
+        Arguments:
+            swarm_id {str} -- The swarm id to add the drones to.
+            connections {List[dict]} -- The drone_id, radio_id, channel, address, data_rate and simulated flag of each drone.
+
+        Returns:
+            List[dict] -- The final connection progress of each drone or None if the swarm does not exist.
+        """
+
+        swarm = self.get_swarm(swarm_id)
+        if swarm is None:
+            return None
+        arena = self.get_arena(swarm_id)
+        for connection in connections:
+            simulated = connection.get('simulated')
+            if simulated is None:
+                simulated = swarm.simulated
+            connection['simulation'] = self.simulation if simulated else None
+            if swarm.replay is not None:
+                simulated, connection['simulation'] = True, swarm.replay
+            connection['radio'] = self.get_radio(connection['radio_id'], connection['data_rate'], simulated)
+        return swarm.add_drones(connections, arena, self._connect_executor)
+
     def remove_drone(self, swarm_id: str, drone_id: str) -> bool:
         """Removes a drone from a swarm.
 
@@ -77,6 +191,18 @@ class SwarmManager:
             return swarm.remove_drone(drone_id)
         return False
 
+    def remove_all_drones(self):
+        """Disconnects and removes the drones of all swarms, for example before the server shuts down."""
+        for swarm in self.swarms.values():
+            for drone_id in swarm.drones:
+                swarm.remove_drone(drone_id)
+
+    def close_recordings(self):
+        """Writes the recordings of all swarms, for example before the server shuts down."""
+        for swarm in self.swarms.values():
+            if swarm.recorder is not None:
+                swarm.recorder.close()
+
     def get_drone(self, swarm_id: str, drone_id: str) -> Drone:
         """Gets a specific drone from a specific swarm.
 
@@ -92,3 +218,20 @@ class SwarmManager:
         if swarm is None:
             return None
         return swarm.get_drone(drone_id)
+
+    def execute_commands(self, swarm_id: str, commands: List[dict], handler: Callable[[Drone, dict], dict]) -> List[dict]:
+        """Executes commands for several drones of a swarm concurrently on the shared worker pool.
+
+        Arguments:
+            swarm_id {str} -- The id of the swarm of the drones.
+            commands {List[dict]} -- The commands, each with a drone_id and a command name.
+            handler {Callable[[Drone, dict], dict]} -- Executes a single command on a drone and returns its result.
+
+        Returns:
+            List[dict] -- The result of each command or None if the swarm does not exist.
+        """
+
+        swarm = self.get_swarm(swarm_id)
+        if swarm is None:
+            return None
+        return swarm.execute_commands(commands, handler, self._executor)
@@ -0,0 +1,86 @@
+from typing import Dict, List
+import threading
+
+import numpy as np
+
+
+class TelemetryHistory:
+    """Fixed-size ring buffer of the telemetry samples of a drone.
+
+    Every sample is a complete row with the latest values of all fields, the time the sample was received
+    and the timestamp of the Crazyflie. Fields which were not received yet are missing (NaN in the buffer, None in a
+    query). Nothing is allocated when a sample is recorded.
+    """
+
+    fields: List[str] = ['time', 'timestamp', 'x', 'y', 'z', 'var_x', 'var_y', 'var_z', 'pitch', 'roll', 'yaw', 'battery_voltage']
+
+    types: Dict[str, type] = {'time': np.float64, 'timestamp': np.int64}
+
+    def __init__(self, capacity: int = 10000):
+        """Initializes an empty history.
+
+        Arguments:
+            capacity {int} -- The number of samples to keep, the default keeps about ten minutes of all log configurations.
+        """
+
+        self.capacity: int = capacity
+        self._data = np.zeros(capacity, dtype=[(name, self.types.get(name, np.float32)) for name in self.fields])
+        # Views on the columns, created once so that recording only writes into them
+        self._columns: Dict[str, np.ndarray] = {name: self._data[name] for name in self.fields}
+        self._latest: Dict[str, float] = {name: float('nan') for name in self.fields}
+        self._count: int = 0
+        self._lock = threading.Lock()
+
+    def record(self, receive_time: float, timestamp: int, values: Dict[str, float]):
+        """Records a sample with the given values, the other fields keep their latest values."""
+        with self._lock:
+            latest = self._latest
+            latest.update(values)
+            latest['time'] = receive_time
+            latest['timestamp'] = timestamp
+            index = self._count % self.capacity
+            for name, column in self._columns.items():
+                column[index] = latest[name]
+            self._count += 1
+
+    def query(self, since: float = None, until: float = None, fields: List[str] = None) -> Dict[str, list]:
+        """Gets the samples received in the given time range.
+
+        Arguments:
+            since {float} -- Only samples received after this time, None for all samples.
+            until {float} -- Only samples received up to this time, None for all samples.
+            fields {List[str]} -- The fields to get, None for all fields.
+
+        Returns:
+            Dict[str, list] -- The values of each field in chronological order, None where a field was not received yet.
+        """
+
+        fields = self.fields if fields is None else [name for name in fields if name in self._columns]
+        with self._lock:
+            # The buffer holds up to two chronological segments, the older one starts at the write position
+            start = self._count % self.capacity
+            if self._count <= self.capacity:
+                segments = [(0, self._count)]
+            else:
+                segments = [(start, self.capacity), (0, start)]
+            result = {name: [] for name in fields}
+            times = self._columns['time']
+            for begin, end in segments:
+                # Binary search on the receive times of each segment, only the matching slice is copied
+                if since is not None:
+                    begin += int(np.searchsorted(times[begin:end], since, side='right'))
+                if until is not None:
+                    end = begin + int(np.searchsorted(times[begin:end], until, side='right'))
+                if begin >= end:
+                    continue
+                for name in fields:
+                    values = self._columns[name][begin:end]
+                    if values.dtype.kind == 'f' and np.isnan(values).any():
+                        # NaN is not valid JSON
+                        result[name].extend([None if np.isnan(value) else value for value in values.tolist()])
+                    else:
+                        result[name].extend(values.tolist())
+            return result
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
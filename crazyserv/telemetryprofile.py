@@ -0,0 +1,104 @@
+from typing import Dict, List
+import struct
+
+from cflib.crazyflie.log import LogConfig, LogTocElement
+
+
+class TelemetryProfile:
+    """Log blocks a drone streams and how their values are decoded to physical units.
+
+    Every block has a rate class which selects its period from the log periods of the drone:
+    0 for the variance and battery, 1 for the position and 2 for the attitude.
+    """
+
+    def __init__(self, name: str, blocks: List[dict]):
+        """Initializes the profile.
+
+        Arguments:
+            name {str} -- The name of the profile.
+            blocks {List[dict]} -- The name, rate class and variables of each log block. Every variable is a tuple of
+                                   the log variable, the type it is fetched as, the attribute of the drone it is
+                                   decoded to and the scale to physical units.
+        """
+
+        self.name: str = name
+        self.blocks: List[dict] = blocks
+        self._decoders: Dict[str, list] = {block['name']: [(variable, attribute, scale, fetch_as == 'FP16')
+                                                            for variable, fetch_as, attribute, scale in block['variables']]
+                                           for block in blocks}
+
+    def create_log_configs(self) -> List[LogConfig]:
+        """Creates a log configuration for each block, the periods are set by the drone."""
+        log_configs = []
+        for block in self.blocks:
+            logconf = LogConfig(name=block['name'], period_in_ms=1000)
+            for variable, fetch_as, _, _ in block['variables']:
+                logconf.add_variable(variable, fetch_as)
+            log_configs.append(logconf)
+        return log_configs
+
+    def get_rate_class(self, logconf: LogConfig) -> int:
+        for block in self.blocks:
+            if block['name'] == logconf.name:
+                return block['rate']
+        return None
+
+    def get_payload_size(self) -> int:
+        """Gets the number of bytes of the values of all blocks."""
+        return sum([LogTocElement.get_size_from_id(LogTocElement.get_id_from_cstring(fetch_as))
+                    for block in self.blocks for _, fetch_as, _, _ in block['variables']])
+
+    def decode(self, logconf: LogConfig, data: dict) -> dict:
+        """Decodes the data of a log block to the attributes of the drone in physical units (m, V and degrees)."""
+        return {attribute: (_to_half_float(data[variable]) if half_float else data[variable]) * scale
+                for variable, attribute, scale, half_float in self._decoders[logconf.name]}
+
+
+def _to_half_float(value) -> float:
+    # cflib 0.1.7 unpacks FP16 as '<h', so the value is the bit pattern of the half precision float as int16.
+    # Later versions unpack it as '<e' and already give the float.
+    if isinstance(value, int):
+        return struct.unpack('<e', struct.pack('<h', value))[0]
+    return value
+
+
+# Every variable as float in three blocks
+standard_profile = TelemetryProfile('standard', [
+    {'name': 'DroneLog_1', 'rate': 0, 'variables': [
+        ('kalman.varPX', 'float', 'var_x', 1.0),
+        ('kalman.varPY', 'float', 'var_y', 1.0),
+        ('kalman.varPZ', 'float', 'var_z', 1.0),
+        ('pm.vbat', 'float', 'battery_voltage', 1.0)
+    ]},
+    {'name': 'DroneLog_2', 'rate': 1, 'variables': [
+        ('kalman.stateX', 'float', 'pos_x', 1.0),
+        ('kalman.stateY', 'float', 'pos_y', 1.0),
+        ('kalman.stateZ', 'float', 'pos_z', 1.0)
+    ]},
+    {'name': 'DroneLog_3', 'rate': 2, 'variables': [
+        ('stabilizer.pitch', 'float', 'pitch', 1.0),
+        ('stabilizer.roll', 'float', 'roll', 1.0),
+        ('stabilizer.yaw', 'float', 'yaw', 1.0)
+    ]}
+])
+
+# The position in mm as int16, the battery in mV as uint16 and the rest as half precision floats in two blocks,
+# the attitude is streamed with the position
+compact_profile = TelemetryProfile('compact', [
+    {'name': 'DroneLog_Compact_1', 'rate': 0, 'variables': [
+        ('kalman.varPX', 'FP16', 'var_x', 1.0),
+        ('kalman.varPY', 'FP16', 'var_y', 1.0),
+        ('kalman.varPZ', 'FP16', 'var_z', 1.0),
+        ('pm.vbatMV', 'uint16_t', 'battery_voltage', 0.001)
+    ]},
+    {'name': 'DroneLog_Compact_2', 'rate': 1, 'variables': [
+        ('stateEstimateZ.x', 'int16_t', 'pos_x', 0.001),
+        ('stateEstimateZ.y', 'int16_t', 'pos_y', 0.001),
+        ('stateEstimateZ.z', 'int16_t', 'pos_z', 0.001),
+        ('stabilizer.pitch', 'FP16', 'pitch', 1.0),
+        ('stabilizer.roll', 'FP16', 'roll', 1.0),
+        ('stabilizer.yaw', 'FP16', 'yaw', 1.0)
+    ]}
+])
+
+telemetry_profiles: Dict[str, TelemetryProfile] = {profile.name: profile for profile in [standard_profile, compact_profile]}
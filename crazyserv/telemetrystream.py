@@ -0,0 +1,76 @@
+from typing import Dict, Iterator, List
+import json
+import threading
+import time
+
+
+class TelemetryStream:
+    """Subscription to the telemetry of a swarm which collects the changed values of the drones until they are sent."""
+
+    def __init__(self, drone_id: str = None, fields: List[str] = None, max_rate: float = None):
+        """Initializes the subscription.
+
+        Arguments:
+            drone_id {str} -- Only stream this drone, None to stream all drones of the swarm.
+            fields {List[str]} -- Only stream these status fields, None to stream all fields.
+            max_rate {float} -- The maximum number of updates per second, None to send every change immediately.
+        """
+
+        self.drone_id: str = drone_id
+        self.fields = set(fields) if fields else None
+        self.min_interval: float = 1.0 / max_rate if max_rate else 0.0
+        self.keep_alive_interval: float = 15.0
+        self._pending: Dict[str, dict] = {}
+        self._last_sent: Dict[str, dict] = {}
+        self._condition = threading.Condition()
+        self._closed: bool = False
+
+    def publish(self, drone_id: str, values: dict):
+        """Adds the changed values of a drone to the next update."""
+        if self.drone_id is not None and drone_id != self.drone_id:
+            return
+        with self._condition:
+            last_sent = self._last_sent.setdefault(drone_id, {})
+            pending = self._pending.get(drone_id, {})
+            for name, value in values.items():
+                if self.fields is not None and name not in self.fields:
+                    continue
+                if name in last_sent and last_sent[name] == value:
+                    pending.pop(name, None)
+                else:
+                    pending[name] = value
+            if pending:
+                self._pending[drone_id] = pending
+                self._condition.notify()
+            else:
+                self._pending.pop(drone_id, None)
+
+    def close(self):
+        """Ends the stream."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def events(self) -> Iterator[str]:
+        """Yields a server-sent event with the changed values of each drone, waiting for changes in between."""
+        while True:
+            with self._condition:
+                if not self._pending and not self._closed:
+                    self._condition.wait(self.keep_alive_interval)
+                if self._closed:
+                    return
+                updates = self._pending
+                self._pending = {}
+                for drone_id, values in updates.items():
+                    self._last_sent[drone_id].update(values)
+            if not updates:
+                # Lets the server notice disconnected clients
+                yield ': keep-alive\n\n'
+                continue
+            for drone_id, values in updates.items():
+                event = {'id': drone_id}
+                event.update(values)
+                yield 'data: ' + json.dumps(event) + '\n\n'
+            # Changes during the interval are merged into the next update
+            if self.min_interval > 0:
+                time.sleep(self.min_interval)
@@ -0,0 +1,80 @@
+from glob import glob
+from typing import Dict
+import os
+import threading
+
+from cflib.crazyflie import Crazyflie
+from cflib.crazyflie.toccache import TocCache
+
+
+class SharedTocCache(TocCache):
+    """TOC cache which is shared by all drones and keeps the TOCs in memory.
+
+    The log and parameter TOCs of a firmware are stored as JSON files named after their CRC, so drones with the same
+    firmware (or a drone reconnecting after a lost link) skip the download of the TOCs. The files are parsed once,
+    either when the cache is prewarmed at startup or on the first hit.
+    """
+
+    def __init__(self, directory: str):
+        """Initializes the cache.
+
+        Arguments:
+            directory {str} -- The directory the TOCs are read from and written to, it is created with the first TOC.
+        """
+
+        self.directory: str = os.path.abspath(directory)
+        super().__init__()
+        self._rw_cache = self.directory
+        self._cache_files = glob(self.directory + '/*.json')
+        self._tocs: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def prewarm(self) -> int:
+        """Loads all TOCs of the directory into memory.
+
+        Returns:
+            int -- The number of TOCs in memory.
+        """
+
+        self._cache_files = glob(self.directory + '/*.json')
+        for filename in self._cache_files:
+            try:
+                crc = int(os.path.splitext(os.path.basename(filename))[0], 16)
+            except ValueError:
+                continue
+            self.fetch(crc)
+        return len(self._tocs)
+
+    def fetch(self, crc: int) -> dict:
+        """Gets the TOC with the given CRC, None if it is not cached."""
+        with self._lock:
+            toc = self._tocs.get(crc)
+            if toc is None:
+                toc = super().fetch(crc)
+                if toc is None:
+                    return None
+                self._tocs[crc] = toc
+            # Every drone gets its own groups, the elements are never changed and are shared
+            return {group: dict(elements) for group, elements in toc.items()}
+
+    def insert(self, crc: int, toc: dict):
+        """Saves a downloaded TOC to the directory and keeps it in memory."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            super().insert(crc, toc)
+            self._tocs[crc] = {group: dict(elements) for group, elements in toc.items()}
+
+    def attach(self, crazyflie: Crazyflie):
+        """Makes a Crazyflie use the cache, it has to be attached before the link is opened.
+
+        Arguments:
+            crazyflie {Crazyflie} -- The Crazyflie, created with the directory of the cache as its rw_cache.
+        """
+
+        # The constructor of Crazyflie only accepts directories and creates a TocCache of its own, which would parse
+        # the files again for every drone. Its log and param TOCs are fetched through _toc_cache when the link is
+        # set up, so the shared cache replaces it before that.
+        crazyflie._toc_cache = self
+
+    def get_size(self) -> int:
+        return len(self._tocs)
@@ -0,0 +1,61 @@
+import numpy as np
+
+# Boundary conditions at the end of a piece for the coefficients 4 to 7 of a polynomial over the normalized time,
+# the coefficients 0 to 3 follow directly from the conditions at the start
+_END_CONDITIONS = np.array([
+    [1.0, 1.0, 1.0, 1.0],           # position
+    [4.0, 5.0, 6.0, 7.0],           # velocity
+    [12.0, 20.0, 30.0, 42.0],       # acceleration
+    [24.0, 60.0, 120.0, 210.0]      # jerk
+])
+
+
+def fit_trajectory(points: np.ndarray, durations: np.ndarray) -> np.ndarray:
+    """Fits 7th order polynomials through the given points as used by the high level commander.
+
+    The trajectory starts and ends at rest and passes every point in between without stopping, the velocity at a
+    point is the mean of the velocities of the adjacent pieces (zero where they point in opposite directions) and the
+    acceleration and jerk are zero, so the trajectory is smooth up to the jerk.
+
+    Arguments:
+        points {np.ndarray} -- The points (n + 1 x k) of each axis, for example x, y, z and yaw.
+        durations {np.ndarray} -- The duration (n) of each piece in seconds.
+
+    Returns:
+        np.ndarray -- The coefficients (n x k x 8) of each piece and axis in ascending order of the powers of the time
+                      since the start of the piece.
+    """
+
+    points = np.asarray(points, dtype=float)
+    durations = np.asarray(durations, dtype=float)[:, np.newaxis]
+    slopes = np.diff(points, axis=0) / durations
+    velocities = np.zeros_like(points)
+    velocities[1:-1] = np.where(slopes[:-1] * slopes[1:] >= 0, (slopes[:-1] + slopes[1:]) / 2, 0.0)
+
+    # Solve the end conditions over the normalized time for all pieces and axes at once
+    start, end = points[:-1], points[1:]
+    start_velocity = velocities[:-1] * durations
+    end_velocity = velocities[1:] * durations
+    conditions = np.stack((end - start - start_velocity, end_velocity - start_velocity,
+                           np.zeros_like(start), np.zeros_like(start)), axis=-1)
+    normalized = np.linalg.solve(_END_CONDITIONS, conditions[..., np.newaxis])[..., 0]
+
+    coefficients = np.zeros(start.shape + (8,))
+    coefficients[..., 0] = start
+    coefficients[..., 1] = velocities[:-1]
+    coefficients[..., 4:] = normalized / durations[..., np.newaxis] ** np.arange(4, 8)
+    return coefficients
+
+
+def evaluate_trajectory(coefficients: np.ndarray, durations: np.ndarray, elapsed: float) -> np.ndarray:
+    """Evaluates a trajectory at the given time since its start, it stays at the end afterwards.
+
+    Returns:
+        np.ndarray -- The value (k) of each axis.
+    """
+
+    ends = np.cumsum(durations)
+    elapsed = min(max(elapsed, 0.0), ends[-1])
+    piece = min(int(np.searchsorted(ends, elapsed, side='right')), len(ends) - 1)
+    time = elapsed - (ends[piece] - durations[piece])
+    return coefficients[piece] @ time ** np.arange(8)
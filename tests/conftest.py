@@ -0,0 +1,17 @@
+import importlib.util
+import os
+
+import pytest
+
+from crazyserv import SimulationEngine, VirtualClock
+
+
+@pytest.fixture
+def server():
+    """Loads a fresh instance of the server module whose swarms are simulated on a virtual clock."""
+    # The module has the name of the package, so it is loaded from its file
+    spec = importlib.util.spec_from_file_location('crazyserv_server', os.path.join(os.path.dirname(__file__), '..', 'crazyserv.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.swarm_manager.simulation = SimulationEngine(VirtualClock())
+    return module
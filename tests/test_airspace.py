@@ -0,0 +1,58 @@
+import pytest
+
+from crazyserv.airspace import Airspace
+
+
+def test_closest_approach_of_crossing_drones():
+    airspace = Airspace()
+    airspace.update('a', [0.0, 1.0, 1.0], [2.0, 1.0, 1.0], 0.0, 2.0)
+
+    conflicts = airspace.conflicts('b', [1.0, 0.0, 1.0], [1.0, 2.0, 1.0], 0.0, 2.0, 0.0)
+
+    assert len(conflicts) == 1
+    assert conflicts[0]['drone_id'] == 'a'
+    assert conflicts[0]['time'] == pytest.approx(1.0)
+    assert conflicts[0]['distance'] == pytest.approx(0.0)
+
+
+def test_distance_is_measured_in_separations():
+    airspace = Airspace(separation=[0.3, 0.3, 0.6])
+    airspace.hold('a', [1.0, 1.0, 1.0])
+
+    # Passing 0.15 apart along y is half of the separation
+    conflicts = airspace.conflicts('b', [0.0, 1.15, 1.0], [2.0, 1.15, 1.0], 0.0, 2.0, 0.0)
+    assert conflicts[0]['distance'] == pytest.approx(0.5)
+    assert conflicts[0]['time'] == pytest.approx(1.0)
+    # 0.45 apart along z is still closer than the separation of 0.6 because of the downwash
+    assert airspace.conflicts('b', [0.0, 1.0, 1.45], [2.0, 1.0, 1.45], 0.0, 2.0, 0.0)
+    assert airspace.conflicts('b', [0.0, 1.4, 1.0], [2.0, 1.4, 1.0], 0.0, 2.0, 0.0) == []
+
+
+def test_drones_at_different_times_do_not_conflict():
+    airspace = Airspace()
+    airspace.update('a', [0.0, 1.0, 1.0], [2.0, 1.0, 1.0], 0.0, 2.0)
+
+    # The crossing is passed at 1 s, the other drone gets there at 4 s
+    assert airspace.conflicts('b', [1.0, 0.0, 1.0], [1.0, 2.0, 1.0], 3.0, 5.0, 0.0) == []
+    delay = airspace.find_delay('b', [1.0, 0.5, 1.0], [1.0, 1.5, 1.0], 0.5, 1.5, 0.0)
+    assert delay is not None and delay > 0
+    assert airspace.conflicts('b', [1.0, 0.5, 1.0], [1.0, 1.5, 1.0], 0.5 + delay, 1.5 + delay, 0.0) == []
+
+
+def test_route_covers_each_leg_only_while_it_is_flown():
+    airspace = Airspace()
+    airspace.update_route('a', [[0.0, 0.0, 1.0], [2.0, 0.0, 1.0], [2.0, 2.0, 1.0]], [0.0, 2.0, 4.0])
+
+    # The second leg passes (2, 1) at 3 s
+    conflicts = airspace.conflicts('b', [1.0, 1.0, 1.0], [3.0, 1.0, 1.0], 2.0, 4.0, 0.0)
+    assert [(conflict['drone_id'], round(conflict['time'], 6)) for conflict in conflicts] == [('a', 3.0)]
+    # At 1 s the drone is on its first leg
+    assert airspace.conflicts('b', [1.0, 1.0, 1.0], [3.0, 1.0, 1.0], 0.0, 2.0, 0.0) == []
+    # The first leg was left long ago and the end of the route is held
+    assert airspace.conflicts('b', [1.0, 0.0, 1.0], [1.0, 0.0, 1.0], 5.0, 5.0, 5.0) == []
+    assert airspace.conflicts('b', [2.0, 2.0, 1.0], [2.0, 2.0, 1.0], 10.0, 10.0, 10.0) != []
+
+    airspace.update('a', [3.0, 3.0, 1.0], [3.0, 3.0, 1.0], 0.0, 0.0)
+    assert airspace.conflicts('b', [2.0, 2.0, 1.0], [2.0, 2.0, 1.0], 10.0, 10.0, 10.0) == []
+    airspace.remove('a')
+    assert airspace.conflicts('b', [3.0, 3.0, 1.0], [3.0, 3.0, 1.0], 0.0, 0.0, 0.0) == []
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from crazyserv.clock import TimerWheel, VirtualClock
+
+
+def test_advance_steps_through_the_timers():
+    clock = VirtualClock(start=10.0, resolution=0.1)
+    steps, fired = [], []
+    clock.advanced.add_callback(steps.append)
+    clock.call_later(0.25, lambda: fired.append(('late', clock.time())))
+    clock.call_later(0.1, lambda: fired.append(('first', clock.time())))
+    clock.call_later(0.1, lambda: fired.append(('second', clock.time())))
+    clock.call_later(0.2, lambda: fired.append(('cancelled', clock.time()))).cancel()
+
+    assert clock.advance(0.25) == pytest.approx(10.25)
+
+    assert steps == pytest.approx([10.1, 10.2, 10.25])
+    assert [name for name, _ in fired] == ['first', 'second', 'late']
+    assert [now for _, now in fired] == pytest.approx([10.1, 10.1, 10.25])
+    # The clock never moves back
+    assert clock.advance_to(5.0) == pytest.approx(10.25)
+
+
+def test_sleep_moves_the_clock_to_its_end():
+    clock = VirtualClock()
+    woken = []
+    clock.call_later(0.5, lambda: woken.append(clock.time()))
+
+    clock.sleep(1.0)
+
+    assert clock.time() == pytest.approx(1.0)
+    assert woken == pytest.approx([0.5])
+
+
+def test_concurrent_sleeps_overlap():
+    clock = VirtualClock()
+    sleepers = [threading.Thread(target=clock.sleep, args=(seconds,)) for seconds in [1.0, 0.5, 1.0]]
+    # The sleeps all start at 0 while the clock is busy
+    with clock._lock:
+        for sleeper in sleepers:
+            sleeper.start()
+        time.sleep(0.05)
+    for sleeper in sleepers:
+        sleeper.join(5)
+
+    assert clock.time() == pytest.approx(1.0)
+
+
+def test_timer_wheel_runs_the_timers_in_order():
+    wheel = TimerWheel(tick=0.01)
+    fired = []
+    done = threading.Event()
+    start = time.time()
+    wheel.schedule(0.08, lambda: (fired.append(('late', time.time() - start)), done.set()))
+    wheel.schedule(0.03, lambda: fired.append(('first', time.time() - start)))
+    wheel.schedule(0.03, lambda: fired.append(('second', time.time() - start)))
+    wheel.schedule(0.05, lambda: fired.append(('cancelled', time.time() - start))).cancel()
+    # Beyond a turn of the wheel
+    wheel.schedule(0.01 * 512 + 10, lambda: fired.append(('next turn', time.time() - start)))
+
+    assert done.wait(5)
+
+    assert [name for name, _ in fired] == ['first', 'second', 'late']
+    assert fired[0][1] >= 0.03 and fired[2][1] >= 0.08
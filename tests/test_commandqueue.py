@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from crazyserv.clock import VirtualClock
+from crazyserv.commandqueue import CommandQueue
+
+
+def wait_until(condition, timeout=5.0):
+    # The commands are sent by threads of their own
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert condition()
+
+
+def flight(duration, delay=0.0):
+    return lambda: {'accepted': True, 'duration': duration, 'delay': delay}
+
+
+def test_jobs_finish_on_the_virtual_clock():
+    clock = VirtualClock()
+    jobs = CommandQueue(clock)
+    takeoff = jobs.submit('takeoff', flight(2.0))
+    go_to = jobs.submit('goto', flight(1.0, delay=0.5))
+    wait_until(lambda: takeoff._timer is not None)
+    assert go_to.status == 'queued'
+
+    clock.advance(1.9)
+    assert takeoff.status == 'running' and not takeoff.is_done()
+    clock.advance(0.1)
+    assert takeoff.status == 'done' and takeoff.finished == pytest.approx(2.0)
+    wait_until(lambda: go_to._timer is not None)
+    assert go_to.started == pytest.approx(2.0)
+    clock.advance(1.45)
+    assert not go_to.is_done()
+    clock.advance(0.1)
+
+    # Within a step of the clock
+    assert go_to.wait(0) and go_to.finished == pytest.approx(3.5, abs=clock.resolution)
+    assert [job.to_dict()['status'] for job in jobs.get_jobs()] == ['done', 'done']
+
+
+def test_failed_job_starts_the_next():
+    clock = VirtualClock()
+    jobs = CommandQueue(clock)
+    release = threading.Event()
+
+    def unreachable():
+        release.wait(5)
+        return {'accepted': False}
+
+    def broken():
+        raise RuntimeError('Position estimator did not converge.')
+
+    rejected = jobs.submit('goto', unreachable)
+    failed = jobs.submit('takeoff', broken)
+    landed = jobs.submit('land', lambda: None)
+    release.set()
+    wait_until(landed.is_done)
+
+    assert (rejected.status, rejected.error) == ('failed', 'The command was not accepted.')
+    assert (failed.status, failed.error) == ('failed', 'Position estimator did not converge.')
+    assert (landed.status, landed.error) == ('failed', 'The command failed.')
+
+
+def test_cancel_stops_the_running_and_the_queued_jobs():
+    clock = VirtualClock()
+    jobs = CommandQueue(clock)
+    running = jobs.submit('takeoff', flight(2.0))
+    queued = jobs.submit('goto', flight(1.0))
+    wait_until(lambda: running._timer is not None)
+
+    jobs.cancel()
+    clock.advance(5.0)
+
+    assert running.status == queued.status == 'cancelled'
+    assert queued.started is None
+    # The queue takes new jobs after a cancel
+    landing = jobs.submit('land', flight(1.0))
+    wait_until(lambda: landing._timer is not None)
+    clock.advance(1.0)
+    assert landing.status == 'done'
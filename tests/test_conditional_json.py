@@ -0,0 +1,34 @@
+def test_unchanged_status_is_not_modified(server):
+    client = server.app.test_client()
+    client.get('/api/s1/register_swarm?arena_id=0&sim=1')
+    assert client.get('/api/s1/d0/connect').status_code == 200
+
+    response = client.get('/api/s1/d0/status')
+    etag = response.headers['ETag']
+
+    assert response.status_code == 200 and response.json['id'] == 'd0'
+    cached = client.get('/api/s1/d0/status', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    assert client.get('/api/s1/status', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_changed_status_gets_a_new_etag(server):
+    client = server.app.test_client()
+    client.get('/api/s1/register_swarm?arena_id=0&sim=1')
+    client.get('/api/s1/d0/connect')
+    etag = client.get('/api/s1/status').headers['ETag']
+    assert client.get('/api/s1/status', headers={'If-None-Match': etag}).status_code == 304
+
+    server.swarm_manager.simulation.advance(1.0)
+
+    response = client.get('/api/s1/status', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_arena_is_not_modified(server):
+    client = server.app.test_client()
+    etag = client.get('/api/arena').headers['ETag']
+
+    assert client.get('/api/arena', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/arena', headers={'If-None-Match': '"other"'}).status_code == 200
@@ -0,0 +1,104 @@
+from crazyserv.deliveryjournal import DeliveryJournal, read_journal, read_swarm_ids
+from crazyserv.deliverylogger import DeliveryLogger
+from crazyserv.packagegenerator import PackageGenerator
+from crazyserv.replay import replay
+
+
+class LandedDrone:
+    """Stands in for a drone which landed at the given position."""
+
+    def __init__(self, drone_id, position):
+        self.id = drone_id
+        self.position = position
+
+    def get_position(self):
+        return self.position
+
+
+def create_package(package_id, coordinates, weight):
+    return {'id': package_id, 'coordinates': coordinates, 'pad': None, 'weight': weight, 'drone': None, 'picked': False}
+
+
+def test_replay_rebuilds_the_logger(tmp_path):
+    path = str(tmp_path / 'deliveries.jsonl')
+    journal = DeliveryJournal(path, flush_interval=0.01)
+    journal.record('s1', 'reset', seed=1)
+    logger = DeliveryLogger('s1', journal)
+    logger.max_weight = 2
+    logger.add_package('s1', create_package('0', [2.6, 0.6, 0.0], 1.0))
+    logger.add_package('s1', create_package('1', [0.6, 2.2, 0.0], 0.75))
+    logger.add_package('s1', create_package('2', [1.0, 1.6, 0.0], 0.5))
+    in_pickup_zone = LandedDrone('d0', [2.2, 1.6, 0.0])
+    assert logger.pickup('s1', '0', in_pickup_zone)
+    assert logger.pickup('s1', '1', in_pickup_zone)
+    # The package would exceed the maximum weight
+    assert not logger.pickup('s1', '2', in_pickup_zone)
+    assert logger.deliver('s1', '0', LandedDrone('d0', [2.6, 0.6, 0.0]))
+    journal.close()
+
+    replayed = replay(path, 's1')
+
+    assert replayed.get_scores() == logger.get_scores() == {'delivered': 1, 'pending': 2, 'picked': 1, 'weight_exceeded': 1}
+    assert replayed.drone_load == logger.drone_load
+    assert sorted(replayed.log) == ['1', '2']
+    assert replayed.get_pending(weight=0.5)[0]['id'] == '2'
+
+
+def test_only_events_since_the_last_reset_are_read(tmp_path):
+    path = str(tmp_path / 'deliveries.jsonl')
+    journal = DeliveryJournal(path)
+    journal.record('s1', 'reset', seed=1)
+    journal.record('s1', 'created', package_id='0', coordinates=[2.6, 0.6, 0.0], pad=0, weight=1.0)
+    journal.record('s2', 'reset', seed=2)
+    journal.record('s1', 'reset', seed=3)
+    journal.record('s1', 'created', package_id='1', coordinates=[2.4, 3.4, 0.0], pad=1, weight=0.5)
+    journal.close()
+    # A crash may cut off the last line
+    with open(path, 'a') as journal_file:
+        journal_file.write('{"swarm_id": "s1", "ev')
+
+    events = read_journal(path, 's1')
+
+    assert [event['event'] for event in events] == ['reset', 'created']
+    assert events[0]['seed'] == 3 and events[1]['package_id'] == '1'
+    assert read_swarm_ids(path) == ['s1', 's2']
+    assert read_journal(path, 'unknown') == []
+
+
+def test_restore_of_a_live_swarm_sees_the_unwritten_events(tmp_path):
+    # The writer would keep the events in memory for a minute
+    journal = DeliveryJournal(str(tmp_path / 'deliveries.jsonl'), flush_interval=60)
+    package_generator = PackageGenerator(journal)
+    package_generator.initialize_swarm('s1', 7)
+    packages = package_generator.get_packages('s1', 3)
+
+    assert package_generator.restore_swarm('s1')
+    assert [package['id'] for package in package_generator.get_pending('s1')] == [package['id'] for package in packages]
+    # The generator continues where it stopped
+    fresh = PackageGenerator()
+    fresh.initialize_swarm('s1', 7)
+    assert package_generator.get_package('s1')['id'] == fresh.get_packages('s1', 4)[-1]['id']
+    journal.close()
+
+
+def test_results_are_exported_by_the_writer(tmp_path):
+    journal = DeliveryJournal(str(tmp_path / 'deliveries.jsonl'))
+    journal.export(str(tmp_path / 'results.txt'), 'Swarm s1 has 0 deliveries')
+    journal.close()
+
+    assert (tmp_path / 'results.txt').read_text() == 'Swarm s1 has 0 deliveries'
+
+
+def test_a_failed_journal_drops_its_events(tmp_path):
+    path = str(tmp_path / 'deliveries.jsonl')
+    journal = DeliveryJournal(path, flush_interval=0.01)
+    # Writing to a file opened for reading fails like a full disk
+    journal._file.close()
+    journal._file = open(path)
+    journal.record('s1', 'reset', seed=1)
+    journal._writer.join(5)
+
+    assert journal.failed
+    journal.record('s1', 'reset', seed=2)
+    assert journal._events.empty()
+    journal.close()
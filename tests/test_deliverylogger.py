@@ -0,0 +1,62 @@
+from crazyserv.deliverylogger import DeliveryLogger
+
+
+class LandedDrone:
+    """Stands in for a drone at the given position."""
+
+    def __init__(self, drone_id, position):
+        self.id = drone_id
+        self.position = position
+
+    def get_position(self):
+        return self.position
+
+
+def create_logger(drones):
+    logger = DeliveryLogger('s1')
+    logger.max_weight = 2
+    for package_id, coordinates, weight in [('0', [2.6, 0.6, 0.0], 1.5), ('1', [0.6, 2.2, 0.0], 0.75), ('2', [1.0, 1.6, 0.0], 1.0)]:
+        logger.add_package('s1', {'id': package_id, 'coordinates': coordinates, 'pad': None, 'weight': weight, 'drone': None, 'picked': False})
+    # d1 carries package 2 to its destination, d3 carries package 0
+    assert logger.pickup('s1', '2', drones['d1'])
+    assert logger.pickup('s1', '0', drones['d3'])
+    drones['d1'].position = [1.0, 1.6, 0.0]
+    return logger
+
+
+def create_drones():
+    return {
+        'd0': LandedDrone('d0', [2.2, 1.6, 0.0]),
+        'd1': LandedDrone('d1', [2.2, 1.6, 0.0]),
+        # Above the pickup zone, but not landed
+        'd2': LandedDrone('d2', [2.2, 1.6, 0.5]),
+        # In the pickup zone, but the packages would exceed its maximum weight
+        'd3': LandedDrone('d3', [2.2, 1.6, 0.0])
+    }
+
+
+def test_eligible_actions_of_all_drones():
+    drones = create_drones()
+    logger = create_logger(drones)
+
+    actions = logger.eligible_actions(list(drones.values()))
+
+    assert actions['pickup'] == [{'drone_id': 'd0', 'package_id': '1', 'weight': 0.75}]
+    assert actions['deliver'] == [{'drone_id': 'd1', 'package_id': '2'}]
+    assert actions['delivered'] == []
+    # Nothing was changed
+    assert logger.get_scores() == {'delivered': 0, 'pending': 3, 'picked': 2, 'weight_exceeded': 0}
+    drones['d2'].position[2] = 0.0
+    assert {action['drone_id'] for action in logger.eligible_actions(list(drones.values()))['pickup']} == {'d0', 'd2'}
+
+
+def test_auto_deliver_delivers_what_can_be_delivered():
+    drones = create_drones()
+    logger = create_logger(drones)
+
+    actions = logger.eligible_actions(list(drones.values()), auto_deliver=True)
+
+    assert actions['delivered'] == [{'drone_id': 'd1', 'package_id': '2'}]
+    assert actions['deliver'] == []
+    assert logger.get_scores() == {'delivered': 1, 'pending': 2, 'picked': 1, 'weight_exceeded': 0}
+    assert logger.eligible_actions(list(drones.values()), auto_deliver=True)['delivered'] == []
@@ -0,0 +1,49 @@
+import random
+
+from crazyserv.dispatcher import Dispatcher
+
+# The landing pads of the packages, like the coordinate pool of the package generator
+pads = [[2.6, 0.6, 0.0], [2.4, 3.4, 0.0], [0.6, 2.2, 0.0], [1.4, 3.2, 0.0], [1.0, 1.6, 0.0], [3.6, 0.6, 0.0], [3.2, 3.2, 0.0], [3.4, 1.4, 0.0]]
+
+
+def create_packages(count, seed=1):
+    rng = random.Random(seed)
+    return [{'id': str(index), 'coordinates': rng.choice(pads), 'weight': rng.choice([0.5, 0.75, 1.0]), 'drone': None, 'picked': False}
+            for index in range(count)]
+
+
+def test_trips_stay_within_the_maximum_weight():
+    packages = create_packages(20)
+    packages[0].update(drone='d0', picked=True)
+    drones = [{'id': 'd%d' % index, 'position': [0.2 + 0.6 * index, 0.5, 0.0], 'load': 0.0} for index in range(4)]
+    drones[0]['load'] = packages[0]['weight']
+    weights = {package['id']: package['weight'] for package in packages}
+
+    plan = Dispatcher([[2.2, 1.6]], 3).dispatch(drones, packages, 0.02)
+
+    for trip, drone in zip(plan['trips'], drones):
+        assert drone['load'] + sum([weights[package_id] for package_id in trip['pickup']]) <= 3 + 1e-9
+        delivered = sorted([package_id for stop in trip['stops'] if stop['type'] == 'deliver' for package_id in stop['package_ids']])
+        assert delivered == sorted(trip['pickup'] + trip['carried'])
+    assigned = [package_id for trip in plan['trips'] for package_id in trip['pickup']]
+    assert len(assigned) == len(set(assigned))
+    assert set(assigned) | set(plan['unassigned']) == {package['id'] for package in packages if not package['picked']}
+    assert plan['trips'][0]['carried'] == ['0']
+
+
+def test_packages_beyond_the_capacity_are_unassigned():
+    packages = [{'id': str(index), 'coordinates': pads[index], 'weight': 0.75, 'drone': None, 'picked': False} for index in range(3)]
+    drones = [{'id': 'd0', 'position': [2.2, 1.6, 0.0], 'load': 0.0}]
+
+    plan = Dispatcher([[2.2, 1.6]], 1).dispatch(drones, packages, 0.02)
+
+    assert len(plan['trips'][0]['pickup']) == 1
+    assert len(plan['unassigned']) == 2
+    assert plan['trips'][0]['stops'][0]['type'] == 'pickup'
+
+
+def test_no_drones_leave_every_package_unassigned():
+    plan = Dispatcher([[2.2, 1.6]], 3).dispatch([], create_packages(3), 0.01)
+
+    assert plan['trips'] == []
+    assert sorted(plan['unassigned']) == ['0', '1', '2']
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from crazyserv.flightrecorder import FlightRecorder, FlightSession
+
+
+def record(recorder, count):
+    for index in range(count):
+        drone_id = 'd%d' % (index % 2)
+        if index % 3:
+            values = {'pos_x': index * 0.01, 'pos_y': 0.1, 'pos_z': 0.3}
+        else:
+            values = {'var_x': 0.0001, 'var_y': 0.0001, 'var_z': 0.0001, 'battery_voltage': 4.0}
+        recorder.record_telemetry(drone_id, 100.0 + index * 0.05, index * 50, values, 1)
+
+
+def test_session_reads_what_was_recorded(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), 's1', session='test', chunk_rows=16, grow_chunks=2)
+    record(recorder, 50)
+    recorder.record_command('d0', 103.0, 'go_to', [1.0, 2.0, 0.5], 0.0, 2.0, 3)
+    recorder.record_command('d1', 103.1, 'stop', None, None, 0.0, 1)
+    recorder.close()
+
+    session = FlightSession(recorder.path)
+
+    assert session.swarm_id == 's1' and session.drones == ['d0', 'd1']
+    assert session.rows == 52
+    # The unused chunks which the file grew by are cut off
+    assert os.path.getsize(recorder.path) == 4 * session._chunks.dtype.itemsize
+    assert [len(chunk['time']) for chunk in session.chunks()] == [16, 16, 16, 4]
+    assert np.all(np.diff(session.column('time')) > 0)
+    telemetry = session.telemetry('d0')
+    assert len(telemetry['time']) == 25
+    positions = ~np.isnan(telemetry['pos_x'])
+    assert np.allclose(telemetry['pos_x'][positions], [index * 0.01 for index in range(0, 50, 2) if index % 3])
+    assert np.all(np.isnan(telemetry['battery_voltage'][positions]))
+    commands = session.get_commands()
+    assert [(command['drone_id'], command['command']) for command in commands] == [('d0', 'go_to'), ('d1', 'stop')]
+    assert commands[0]['target'] == [1.0, 2.0, 0.5] and commands[0]['duration'] == 2.0
+    assert session.get_commands('d1')[0]['time'] == 103.1
+
+
+def test_session_of_an_unclosed_recorder(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), 's1', session='test', chunk_rows=16, grow_chunks=4, schema_interval=0.01)
+    record(recorder, 20)
+    deadline = time.time() + 5
+    while json.load(open(recorder.path + '.json'))['drones'] != ['d0', 'd1'] and time.time() < deadline:
+        time.sleep(0.01)
+    record(recorder, 3)
+
+    # The rows are found from the kind column, the empty chunks at the end of the file are skipped
+    session = FlightSession(recorder.path)
+
+    assert session.rows == 23
+    assert len(list(session.chunks())) == 2
+    assert len(session.telemetry('d1')['time']) == 11
+    recorder.close()
+
+
+def test_rows_after_close_are_dropped(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), 's1', session='test', chunk_rows=16)
+    record(recorder, 5)
+    recorder.close()
+    record(recorder, 5)
+    recorder.close()
+
+    assert FlightSession(recorder.path).rows == 5
@@ -0,0 +1,59 @@
+from crazyserv.packagegenerator import PackageGenerator
+
+
+def create_generator(seed=467859):
+    package_generator = PackageGenerator()
+    package_generator.initialize_swarm('s1', seed)
+    return package_generator
+
+
+def test_lookahead_previews_the_next_orders():
+    package_generator = create_generator()
+
+    preview = package_generator.preview_packages('s1', 5)
+
+    # Previewing orders nothing and does not change the sequence
+    assert package_generator.get_pending('s1') == []
+    assert package_generator.preview_packages('s1', 5) == preview
+    assert [package_generator.get_package('s1') for _ in range(5)] == preview
+
+
+def test_bulk_order_matches_single_orders():
+    bulk, single = create_generator(), create_generator()
+
+    packages = bulk.get_packages('s1', 8)
+
+    assert packages == [single.get_package('s1') for _ in range(8)]
+    # Only as many packages as fit into the pending packages are ordered
+    assert len(bulk.get_packages('s1', 100)) == bulk.delivery_loggers['s1'].max_pending - 8
+    assert bulk.get_packages('s1', 1) == []
+
+
+def test_pending_packages_are_filtered_by_pad_and_weight():
+    package_generator = create_generator()
+    packages = package_generator.get_packages('s1', 20)
+    pad, weight = packages[0]['pad'], packages[0]['weight']
+
+    def ids(pending):
+        return sorted([package['id'] for package in pending])
+
+    assert ids(package_generator.get_pending('s1')) == ids(packages)
+    assert ids(package_generator.get_pending('s1', pad=pad)) == ids([package for package in packages if package['pad'] == pad])
+    assert ids(package_generator.get_pending('s1', weight=weight)) == ids([package for package in packages if package['weight'] == weight])
+    assert ids(package_generator.get_pending('s1', pad, weight)) == ids([package for package in packages
+                                                                         if package['pad'] == pad and package['weight'] == weight])
+    assert package_generator.get_pending('s1', pad=len(package_generator.coordinate_pool)) == []
+
+
+def test_routes_reject_invalid_arguments(server):
+    client = server.app.test_client()
+    client.get('/api/s1/register_swarm?arena_id=0&seed=1')
+
+    assert len(client.get('/api/s1/lookahead?count=3').json) == 3
+    assert client.get('/api/s1/lookahead?count=%d' % (server.max_lookahead + 1)).status_code == 400
+    assert len(client.get('/api/s1/packages?count=3').json) == 3
+    assert client.get('/api/s1/packages?count=-1').status_code == 400
+    assert len(client.get('/api/s1/pending').json) == 3
+    assert client.get('/api/s1/pending?pad=first').status_code == 400
+    assert client.get('/api/s1/pending?weight=heavy').status_code == 400
+    assert client.get('/api/unknown/pending').status_code == 404
@@ -0,0 +1,48 @@
+import numpy as np
+
+from crazyserv.arena import Arena
+from crazyserv.pathplanner import PathPlanner
+
+
+def crosses_building(arena, start, end, margin):
+    """Checks whether the straight line between two points comes closer to a building than the margin."""
+    points = np.linspace(np.array(start[:2]), np.array(end[:2]), 200)
+    half_size = arena.building_size / 2 + margin
+    for building in arena.buildings:
+        if np.any(np.all(np.abs(points - building[:2]) < half_size, axis=1)):
+            return True
+    return False
+
+
+def test_path_avoids_the_buildings():
+    arena = Arena(0)
+    planner = PathPlanner(arena)
+    # The building at (1.5, 1.0) is between the start and the goal
+    start, goal = [1.5, 0.4, 0.5], [1.5, 1.6, 0.8]
+    assert crosses_building(arena, start, goal, 0.0)
+
+    path = planner.plan(start, goal)
+
+    assert len(path) > 1
+    assert path[-1] == goal
+    for leg_start, leg_end in zip([start] + path, path):
+        assert not crosses_building(arena, leg_start, leg_end, 0.14)
+    assert all([waypoint[2] == goal[2] for waypoint in path])
+
+
+def test_free_line_is_flown_directly():
+    planner = PathPlanner(Arena(0))
+
+    assert planner.plan([0.5, 0.5, 0.5], [0.5, 3.5, 0.5]) == [[0.5, 3.5, 0.5]]
+
+
+def test_path_is_not_longer_than_needed():
+    arena = Arena(0)
+    planner = PathPlanner(arena)
+    start, goal = [1.5, 0.4, 0.5], [1.5, 1.6, 0.5]
+
+    path = planner.plan(start, goal)
+
+    length = sum([np.linalg.norm(np.subtract(end[:2], begin[:2])) for begin, end in zip([start] + path, path)])
+    # Around one side of the inflated building, which is 0.6 wide
+    assert length < 1.2 + 2 * 0.35
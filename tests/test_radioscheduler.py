@@ -0,0 +1,82 @@
+import threading
+import time
+
+from crazyserv.clock import VirtualClock
+from crazyserv.radioscheduler import Lane, RadioScheduler
+from crazyserv.simulation import SimulationEngine
+from crazyserv.swarmmanager import SwarmManager
+
+
+def test_background_traffic_waits_for_an_emergency():
+    scheduler = RadioScheduler('radio://0')
+    sending, release = threading.Event(), threading.Event()
+    order = []
+
+    def stop():
+        sending.set()
+        release.wait(5)
+        order.append('stop')
+
+    emergency = threading.Thread(target=scheduler.send, args=('d0', Lane.EMERGENCY, stop))
+    emergency.start()
+    sending.wait(5)
+    background = threading.Thread(target=scheduler.send, args=('d1', Lane.BACKGROUND, order.append, 'param'))
+    background.start()
+    # Commands are not held
+    scheduler.send('d2', Lane.COMMAND, order.append, 'go_to')
+    time.sleep(0.05)
+    release.set()
+    emergency.join(5)
+    background.join(5)
+
+    assert order == ['go_to', 'stop', 'param']
+    lanes = scheduler.get_stats()['lanes']
+    assert lanes['background'] == {'sent': 1, 'held': 1}
+    assert lanes['emergency']['sent'] == 1
+
+
+def test_background_traffic_is_held_after_an_emergency():
+    scheduler = RadioScheduler('radio://0')
+    scheduler.emergency_hold = 0.2
+    assert RadioScheduler('sim://0').emergency_hold == 0.0
+    scheduler.send('d0', Lane.EMERGENCY, lambda: None)
+    start = time.monotonic()
+
+    scheduler.send('d1', Lane.BACKGROUND, lambda: None)
+
+    assert time.monotonic() - start >= 0.15
+    # Without a hold only the emergency command itself holds the background
+    scheduler.emergency_hold = 0.0
+    scheduler.send('d0', Lane.EMERGENCY, lambda: None)
+    scheduler.send('d1', Lane.BACKGROUND, lambda: None)
+    assert scheduler.get_stats()['lanes']['background']['held'] == 1
+
+
+def test_telemetry_is_scaled_to_the_budget():
+    scheduler = RadioScheduler('radio://0', '250K')
+    scales = []
+    scheduler.telemetry_scale_changed.add_callback(scales.append)
+
+    assert scheduler.request_telemetry('d0', 0.5 * scheduler.telemetry_budget) == 1.0
+    assert scheduler.request_telemetry('d1', 0.5 * scheduler.telemetry_budget) == 1.0
+    # 10 % more than the budget is rounded up to the next quarter
+    assert scheduler.request_telemetry('d2', 0.1 * scheduler.telemetry_budget) == 1.25
+    assert scheduler.request_telemetry('d2', 1.6 * scheduler.telemetry_budget) == 2.75
+    assert scheduler.get_stats()['telemetry_requested'] == 2.6 * scheduler.telemetry_budget
+    assert scheduler.request_telemetry('d2', 0) == 1.0
+
+    assert scales == [1.25, 2.75, 1.0]
+
+
+def test_drones_on_a_full_radio_stretch_their_log_periods():
+    swarm_manager = SwarmManager()
+    swarm_manager.simulation = SimulationEngine(VirtualClock())
+    swarm_manager.register_swarm('s1', 0, True)
+    # An idle drone requests 2.5 log packets per second
+    swarm_manager.get_radio(0, '2M', True).telemetry_budget = 4.0
+    drones = [swarm_manager.add_drone('s1', 'd%d' % index, 0, 80, 'E7E7E7E7E%d' % index, '2M') for index in range(2)]
+
+    for drone in drones:
+        assert [logconf.period_in_ms for logconf in drone._log_configs] == [1250, 1250, 2500]
+    drones[1].disconnect()
+    assert [logconf.period_in_ms for logconf in drones[0]._log_configs] == [1000, 1000, 2000]
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+from cflib.crazyflie.log import LogConfig
+
+from crazyserv.clock import VirtualClock
+from crazyserv.packagegenerator import PackageGenerator
+from crazyserv.simulation import SimulationEngine
+from crazyserv.swarmmanager import SwarmManager
+
+
+def connect(engine, origin=(0.0, 0.0, 0.0)):
+    crazyflie = engine.create_crazyflie(list(origin))
+    crazyflie.open_link('sim://0/80/2M/E7E7E7E7E7')
+    return crazyflie
+
+
+def stream(crazyflie, variables, period_in_ms, name='Log'):
+    """Starts a log configuration and returns the list its (timestamp, data) samples are appended to."""
+    samples = []
+    logconf = LogConfig(name=name, period_in_ms=period_in_ms)
+    for variable in variables:
+        logconf.add_variable(variable, 'float')
+    crazyflie.log.add_config(logconf)
+    logconf.data_received_cb.add_callback(lambda timestamp, data, logconf: samples.append((timestamp, data)))
+    logconf.start()
+    return samples
+
+
+def test_takeoff_and_go_to_reach_their_targets():
+    engine = SimulationEngine(VirtualClock())
+    crazyflie = connect(engine, (0.5, 0.5, 0.0))
+    samples = stream(crazyflie, ['kalman.stateX', 'kalman.stateY', 'kalman.stateZ'], 100)
+
+    crazyflie.high_level_commander.takeoff(0.5, 2.0)
+    engine.advance(1.0)
+    # Half way through the smooth takeoff
+    assert samples[-1][1]['kalman.stateZ'] == pytest.approx(0.25, abs=1e-6)
+    engine.advance(1.5)
+    crazyflie.high_level_commander.go_to(1.5, 2.0, 0.5, 0.0, 3.0)
+    engine.advance(3.0)
+
+    assert samples[-1][1] == pytest.approx({'kalman.stateX': 1.5, 'kalman.stateY': 2.0, 'kalman.stateZ': 0.5})
+    heights = [data['kalman.stateZ'] for _, data in samples[:25]]
+    assert heights == sorted(heights)
+
+
+def test_variance_decays_after_a_reset():
+    engine = SimulationEngine(VirtualClock())
+    crazyflie = connect(engine)
+    samples = stream(crazyflie, ['kalman.varPX'], 50)
+    engine.advance(0.5)
+    assert samples[-1][1]['kalman.varPX'] == pytest.approx(engine.variance_floor)
+
+    crazyflie.param.set_value('kalman.resetEstimation', '1')
+    engine.advance(2.0)
+
+    variances = [data['kalman.varPX'] for _, data in samples[10:]]
+    assert variances[0] > 0.5
+    assert variances == sorted(variances, reverse=True)
+    # The convergence threshold of the drones is reached about a second after the reset
+    assert variances[21] < 0.001 < variances[19]
+
+
+def test_battery_drains_faster_while_flying():
+    engine = SimulationEngine(VirtualClock())
+    flying, idle = connect(engine), connect(engine)
+    flying_samples, idle_samples = stream(flying, ['pm.vbat'], 1000), stream(idle, ['pm.vbat'], 1000)
+
+    flying.high_level_commander.takeoff(0.5, 1.0)
+    engine.advance(100.0)
+
+    flying_drain = engine.battery_full - flying_samples[-1][1]['pm.vbat']
+    idle_drain = engine.battery_full - idle_samples[-1][1]['pm.vbat']
+    assert idle_drain == pytest.approx(100 * engine.battery_drain_idle, rel=1e-3)
+    assert flying_drain == pytest.approx(99 * engine.battery_drain_flying + engine.battery_drain_idle, rel=0.01)
+
+
+def test_log_data_is_sent_in_chronological_order():
+    engine = SimulationEngine(VirtualClock())
+    received = []
+    crazyflies = [connect(engine) for _ in range(2)]
+    for index, period in enumerate([30, 50]):
+        logconf = LogConfig(name='Log%d' % index, period_in_ms=period)
+        logconf.add_variable('pm.vbat', 'float')
+        crazyflies[index].log.add_config(logconf)
+        logconf.data_received_cb.add_callback(lambda timestamp, data, logconf: received.append((timestamp, logconf.name)))
+        logconf.start()
+
+    engine.advance(0.3)
+    # A restarted configuration starts over, a stopped one sends nothing
+    logconf.stop()
+    logconf.start()
+    engine.advance(0.3)
+    crazyflies[0].close_link()
+    engine.advance(0.3)
+
+    timestamps = [timestamp for timestamp, _ in received]
+    assert timestamps == sorted(timestamps)
+    assert [timestamp for timestamp, name in received if name == 'Log0'] == list(range(30, 601, 30))
+    assert [timestamp for timestamp, name in received if name == 'Log1'] == list(range(50, 301, 50)) + list(range(350, 901, 50))
+
+
+def test_scoring_session_runs_faster_than_100_times_real_time():
+    started = time.perf_counter()
+    swarm_manager = SwarmManager()
+    swarm_manager.simulation = SimulationEngine(VirtualClock())
+    package_generator = PackageGenerator()
+    swarm_manager.register_swarm('s1', 0, True)
+    package_generator.initialize_swarm('s1', 1)
+    drone = swarm_manager.add_drone('s1', 'd0', 0, 80, 'E7E7E7E7E7', '2M')
+    for _ in range(3):
+        package = package_generator.get_package('s1')
+        for x, y, action in [(2.2, 1.6, package_generator.pickup), (package['coordinates'][0], package['coordinates'][1], package_generator.deliver)]:
+            drone.takeoff(0.5, 0.2, synchronous=True)
+            drone.go_to(x, y, 0.5, 0.0, 0.2, synchronous=True)
+            drone.land(0.0, 0.2, synchronous=True)
+            assert action('s1', package['id'], drone)
+
+    assert package_generator.delivery_loggers['s1'].get_scores()['delivered'] == 3
+    # The flights take more than a minute of simulated time
+    assert swarm_manager.simulation.time() > 60
+    assert swarm_manager.simulation.time() / (time.perf_counter() - started) > 100
@@ -0,0 +1,41 @@
+from crazyserv.telemetryhistory import TelemetryHistory
+
+
+def test_wraparound_keeps_the_latest_samples_in_order():
+    history = TelemetryHistory(capacity=4)
+    for index in range(6):
+        history.record(100.0 + index, index * 10, {'x': float(index)})
+
+    samples = history.query()
+
+    assert len(history) == 4
+    assert samples['time'] == [102.0, 103.0, 104.0, 105.0]
+    assert samples['timestamp'] == [20, 30, 40, 50]
+    assert samples['x'] == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_since_and_until_select_across_the_wraparound():
+    history = TelemetryHistory(capacity=4)
+    for index in range(6):
+        history.record(100.0 + index, index * 10, {'x': float(index)})
+
+    # The samples after 102 s are split over the end and the start of the buffer
+    assert history.query(since=102.0)['time'] == [103.0, 104.0, 105.0]
+    assert history.query(since=102.5, until=104.0, fields=['x']) == {'x': [3.0, 4.0]}
+    assert history.query(until=103.0)['time'] == [102.0, 103.0]
+    assert history.query(since=105.0)['time'] == []
+    # Unknown fields are left out
+    assert history.query(fields=['x', 'unknown']).keys() == {'x'}
+
+
+def test_fields_keep_their_latest_values():
+    history = TelemetryHistory(capacity=8)
+    history.record(1.0, 10, {'x': 0.5})
+    history.record(2.0, 20, {'battery_voltage': 4.0})
+    history.record(3.0, 30, {'x': 0.75})
+
+    samples = history.query(fields=['x', 'battery_voltage'])
+
+    assert samples['x'] == [0.5, 0.5, 0.75]
+    # Not received before the second sample
+    assert samples['battery_voltage'] == [None, 4.0, 4.0]
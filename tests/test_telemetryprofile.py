@@ -0,0 +1,39 @@
+import struct
+
+import pytest
+from cflib.crazyflie.log import LogTocElement
+
+from crazyserv.telemetryprofile import compact_profile
+
+
+def receive(logconf, packet):
+    """Unpacks a log packet like cflib does and returns the data it passes to the callbacks."""
+    received = []
+    logconf.data_received_cb.add_callback(lambda timestamp, data, logconf: received.append(data))
+    logconf.unpack_log_data(packet, 1000)
+    return received[0]
+
+
+# The position in mm, the pitch, roll and yaw as half precision floats
+attitude_packet = struct.pack('<hhheee', 1500, -250, 300, 2.5, -0.125, 90.0)
+
+
+@pytest.mark.parametrize('fp16_format', ['<e', '<h'])
+def test_half_precision_floats_are_decoded(monkeypatch, fp16_format):
+    # cflib 0.1.7 unpacks FP16 as int16, later versions as half precision float
+    monkeypatch.setitem(LogTocElement.types, LogTocElement.get_id_from_cstring('FP16'), ('FP16', fp16_format, 2))
+    logconf = compact_profile.create_log_configs()[1]
+
+    values = compact_profile.decode(logconf, receive(logconf, attitude_packet))
+
+    assert values == {'pos_x': 1.5, 'pos_y': -0.25, 'pos_z': 0.3, 'pitch': 2.5, 'roll': -0.125, 'yaw': 90.0}
+
+
+def test_variances_and_battery_are_decoded():
+    logconf = compact_profile.create_log_configs()[0]
+
+    values = compact_profile.decode(logconf, receive(logconf, struct.pack('<eeeH', 0.001, 0.5, 0.0, 3900)))
+
+    assert values['var_x'] == pytest.approx(0.001, rel=1e-3)
+    assert values['var_y'] == 0.5 and values['var_z'] == 0.0
+    assert values['battery_voltage'] == pytest.approx(3.9)
@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+
+from crazyserv.telemetrystream import TelemetryStream
+
+
+def read(events, count):
+    return [json.loads(next(events)[len('data: '):]) for _ in range(count)]
+
+
+def test_only_changed_values_are_sent():
+    stream = TelemetryStream()
+    events = stream.events()
+    stream.publish('d0', {'x': 1.0, 'y': 2.0, 'status': 'IDLE'})
+    stream.publish('d1', {'x': 0.5})
+    assert read(events, 2) == [{'id': 'd0', 'x': 1.0, 'y': 2.0, 'status': 'IDLE'}, {'id': 'd1', 'x': 0.5}]
+
+    stream.publish('d0', {'x': 1.0, 'y': 2.5, 'status': 'IDLE'})
+    assert read(events, 1) == [{'id': 'd0', 'y': 2.5}]
+    # A value which changed back before it was sent is dropped
+    stream.publish('d0', {'x': 1.5})
+    stream.publish('d0', {'x': 1.0, 'y': 3.0})
+    assert read(events, 1) == [{'id': 'd0', 'y': 3.0}]
+    stream.close()
+    assert list(events) == []
+
+
+def test_drone_and_fields_are_filtered():
+    stream = TelemetryStream(drone_id='d1', fields=['x', 'status'])
+    events = stream.events()
+    stream.publish('d0', {'x': 1.0})
+    stream.publish('d1', {'x': 2.0, 'y': 3.0})
+    stream.publish('d1', {'y': 4.0})
+
+    assert read(events, 1) == [{'id': 'd1', 'x': 2.0}]
+    stream.close()
+
+
+def test_changes_within_the_interval_are_merged():
+    stream = TelemetryStream(max_rate=5)
+    events = stream.events()
+    stream.publish('d0', {'x': 0.0})
+    assert read(events, 1) == [{'id': 'd0', 'x': 0.0}]
+    started = time.monotonic()
+    # Published while the stream waits for the end of the interval
+    publisher = threading.Timer(0.05, lambda: [stream.publish('d0', {'x': x}) for x in [0.1, 0.2, 0.3]])
+    publisher.start()
+
+    assert read(events, 1) == [{'id': 'd0', 'x': 0.3}]
+    assert time.monotonic() - started >= 0.19
+    stream.close()
+
+
+def test_keep_alive_without_changes():
+    stream = TelemetryStream()
+    stream.keep_alive_interval = 0.01
+
+    assert next(stream.events()) == ': keep-alive\n\n'